@@ -29,6 +29,25 @@ class DataProcessor:
             logger.warning(f"Could not convert '{value}' to numeric, using default {default}")
             return default
     
+    @staticmethod
+    def parse_numeric_columns(df, cols, default=0.0):
+        """
+        Convert whole columns to numeric, handling commas and None values
+        
+        Bulk counterpart of safe_numeric: None and '' become default, values that
+        cannot be parsed become NaN and columns that are already numeric are left as is.
+        The columns are replaced in place and the DataFrame is returned.
+        """
+        for col in cols:
+            column = df[col]
+            if pd.api.types.is_numeric_dtype(column):
+                continue
+            as_text = column.astype(str)
+            missing = as_text.eq('') | (column.isna() & as_text.eq('None'))
+            numeric = pd.to_numeric(as_text.str.replace(',', '', regex=False), errors='coerce')
+            df[col] = numeric.mask(missing, default) if missing.any() else numeric
+        return df
+    
     @staticmethod
     def get_symbol(row):
         """Extract symbol from row data"""
@@ -73,7 +92,9 @@ class DataProcessor:
         df[Raw_constants.NAME] = input_data.apply(DataProcessor.get_symbol, axis=1)
         df[Raw_constants.PRICE] = input_data[Data_constants.PRICE]
         df[Raw_constants.QUANTITY] = input_data[Data_constants.QUANTITY]
-        df[Raw_constants.NET_AMOUNT] = df.apply(DataProcessor.get_net_amount, axis=1)
+        numeric = DataProcessor.parse_numeric_columns(
+            df[[Raw_constants.QUANTITY, Raw_constants.PRICE]].copy(), [Raw_constants.QUANTITY, Raw_constants.PRICE])
+        df[Raw_constants.NET_AMOUNT] = (numeric[Raw_constants.QUANTITY] * numeric[Raw_constants.PRICE]).astype(str)
         df[Raw_constants.STOCK_EXCHANGE] = input_data[Data_constants.STOCK_EXCHANGE]
         return df
     
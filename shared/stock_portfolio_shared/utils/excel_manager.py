@@ -128,15 +128,30 @@ class ExcelManager(BaseManager):
                 for cell in row:
                     cell.fill = redFill
 
+    def _get_filled_rows(self, sheet, cell_range):
+        """Get the rows of a range up to the first row with an empty first cell"""
+        rows = []
+        for row in sheet[cell_range]:
+            if row[0].value is None or row[0].value == '':
+                break
+            rows.append(row)
+        return rows
+    
+    def _get_numeric_values(self, rows, column_indices):
+        """Parse the values of the given columns of all rows in one bulk conversion"""
+        values = pd.DataFrame(
+            [[row[index].value for index in column_indices] for row in rows],
+            columns=column_indices, dtype=object
+        )
+        return DataProcessor.parse_numeric_columns(values, column_indices)
+    
     def shareProfitLoss_formatting(self, sheet):
         cell_range = CELL_RANGE
         redFill = openpyxl.styles.PatternFill(start_color='FFFF0000', end_color='FFFF0000', fill_type='solid')
         blueFill = openpyxl.styles.PatternFill(start_color='FF0000FF', end_color='FF0000FF', fill_type='solid')
-        for row in sheet[cell_range]:
-            if row[0].value is None or row[0].value == '':
-                break
-            remaining_shares = DataProcessor.safe_numeric(row[7].value)
-            profit = DataProcessor.safe_numeric(row[9].value)
+        rows = self._get_filled_rows(sheet, cell_range)
+        values = self._get_numeric_values(rows, [7, 9])
+        for row, remaining_shares, profit in zip(rows, values[7], values[9]):
             if abs(remaining_shares) < 0.01:  # Check if effectively zero
                 if profit >= 0.0:
                     for cell in row:
@@ -149,11 +164,10 @@ class ExcelManager(BaseManager):
         cell_range = CELL_RANGE
         redFill = openpyxl.styles.PatternFill(start_color='FFFF0000', end_color='FFFF0000', fill_type='solid')
         blueFill = openpyxl.styles.PatternFill(start_color='FF0000FF', end_color='FF0000FF', fill_type='solid')
-        for row in sheet[cell_range]:
-            if row[0].value is None or row[0].value == '':
-                break
+        rows = self._get_filled_rows(sheet, cell_range)
+        values = self._get_numeric_values(rows, [9])
+        for row, spendings_value in zip(rows, values[9]):
             if row[9].value != '':
-                spendings_value = DataProcessor.safe_numeric(row[9].value)
                 if spendings_value > 0.0:
                     for cell in row:
                         cell.fill = blueFill
@@ -165,13 +179,11 @@ class ExcelManager(BaseManager):
         cell_range = CELL_RANGE
         redFill = openpyxl.styles.PatternFill(start_color='FFFF0000', end_color='FFFF0000', fill_type='solid')
         blueFill = openpyxl.styles.PatternFill(start_color='FF0000FF', end_color='FF0000FF', fill_type='solid')
-        for row in sheet[cell_range]:
-            if row[0].value is None or row[0].value == '':
-                break
+        rows = self._get_filled_rows(sheet, cell_range)
+        values = self._get_numeric_values(rows, [2, 3, 4])
+        total_taxes = values[2] + values[3] + values[4]
+        for row, total_tax in zip(rows, total_taxes):
             if row[9].value != '':
-                total_tax = (DataProcessor.safe_numeric(row[2].value) + 
-                           DataProcessor.safe_numeric(row[3].value) + 
-                           DataProcessor.safe_numeric(row[4].value))
                 if total_tax > 0.0:
                     for cell in row:
                         cell.fill = blueFill
@@ -315,14 +315,14 @@ class SheetsManager(BaseManager):
             logger.error(f"Required columns not found in headers: {headers}")
             return
             
+        numeric = DataProcessor.parse_numeric_columns(
+            df[[ShareProfitLoss_constants.SHARES_REMAINING, ShareProfitLoss_constants.NET_PROFIT]].copy(),
+            [ShareProfitLoss_constants.SHARES_REMAINING, ShareProfitLoss_constants.NET_PROFIT]
+        )
         requests = []
         for row_number, row in df.iterrows():
-            try:
-                remaining_shares = DataProcessor.safe_numeric(row[ShareProfitLoss_constants.SHARES_REMAINING])
-                profit = DataProcessor.safe_numeric(row[ShareProfitLoss_constants.NET_PROFIT])
-            except (ValueError, TypeError):
-                logger.warning(f"Invalid row data: {row}")
-                continue
+            remaining_shares = numeric.at[row_number, ShareProfitLoss_constants.SHARES_REMAINING]
+            profit = numeric.at[row_number, ShareProfitLoss_constants.NET_PROFIT]
                 
             if abs(remaining_shares) < 0.01:  # Check if effectively zero (handles floating point precision)
                 if profit > 0:
@@ -356,29 +356,23 @@ class SheetsManager(BaseManager):
             logger.error(f"Daily Spendings column not found in headers: {headers}")
             return
             
+        numeric = DataProcessor.parse_numeric_columns(
+            df[[DailyProfitLoss_constants.DAILY_SPENDINGS]].copy(), [DailyProfitLoss_constants.DAILY_SPENDINGS]
+        )
         requests = []
         for row_number, row in df.iterrows():
-            try:
-                daily_spendings = DataProcessor.safe_numeric(row[DailyProfitLoss_constants.DAILY_SPENDINGS])
-            except (ValueError, TypeError):
-                logger.warning(f"Invalid row data: {row}")
-                continue
+            daily_spendings = numeric.at[row_number, DailyProfitLoss_constants.DAILY_SPENDINGS]
                 
             if abs(daily_spendings) > 0.01:
-                try:
-                    spendings_value = DataProcessor.safe_numeric(daily_spendings)
-                    if spendings_value > 0.0:
-                        background_color = (0.8, 0.9, 1)
-                    else:
-                        background_color = (1, 0.8, 0.8)
-                    # Convert row back to list for formatting
-                    row_data = row.tolist()
-                    format_request = self._get_backgroundColor_formatting_request(sheet, row_number + 2, row_data, background_color)
-                    if format_request is not None:
-                        requests.append(format_request)
-                except (ValueError, TypeError):
-                    logger.warning(f"Invalid daily spendings value: {daily_spendings}")
-                    continue
+                if daily_spendings > 0.0:
+                    background_color = (0.8, 0.9, 1)
+                else:
+                    background_color = (1, 0.8, 0.8)
+                # Convert row back to list for formatting
+                row_data = row.tolist()
+                format_request = self._get_backgroundColor_formatting_request(sheet, row_number + 2, row_data, background_color)
+                if format_request is not None:
+                    requests.append(format_request)
         if len(requests) > 0:
             try:
                 spreadsheet.batch_update({"requests": requests})
@@ -403,17 +397,11 @@ class SheetsManager(BaseManager):
             logger.error(f"Required taxation columns not found in headers: {missing_columns}")
             return
             
+        numeric = DataProcessor.parse_numeric_columns(df[required_columns].copy(), required_columns)
+        total_gains = numeric[Taxation_constants.LTCG] + numeric[Taxation_constants.STCG] + numeric[Taxation_constants.INTRADAY_INCOME]
         requests = []
         for row_number, row in df.iterrows():
-            try:
-                ltcg = DataProcessor.safe_numeric(row[Taxation_constants.LTCG])
-                stcg = DataProcessor.safe_numeric(row[Taxation_constants.STCG])
-                intraday_income = DataProcessor.safe_numeric(row[Taxation_constants.INTRADAY_INCOME])
-            except (ValueError, TypeError):
-                logger.warning(f"Invalid row data: {row}")
-                continue
-                
-            if (ltcg + stcg + intraday_income) >= 0:
+            if total_gains.at[row_number] >= 0:
                 background_color = (0.8, 0.9, 1)
             else:
                 background_color = (1, 0.8, 0.8)
@@ -6,6 +6,8 @@ from typing import Optional
 worker_directory = os.path.dirname(__file__)
 env_file = os.path.join(worker_directory, 'secrets', '.env')
 load_dotenv(env_file)
+# Files the worker can rebuild, such as checkpoints and stored prices, kept outside the source tree
+cache_directory = os.path.join(os.getenv('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'stock-portfolio-manager')
 
 class Config:
     """Configuration class for worker service and general functionality"""
@@ -40,6 +42,47 @@ class Config:
     # Worker Configuration
     WORKER_CONCURRENCY = int(os.getenv('WORKER_CONCURRENCY', '4'))
     WORKER_TIMEOUT = int(os.getenv('WORKER_TIMEOUT', '300'))
+    # I/O pool runs spreadsheet tasks (Sheets, Excel, market data), CPU pool runs the processing stages
+    IO_POOL_SIZE = int(os.getenv('IO_POOL_SIZE', str(WORKER_CONCURRENCY)))
+    CPU_POOL_SIZE = int(os.getenv('CPU_POOL_SIZE', str(os.cpu_count() or 4)))
+    # 'thread' runs the CPU pool on threads, 'process' on a process pool
+    PROCESSING_MODE = os.getenv('PROCESSING_MODE', 'thread').lower()
+    # Share Profit/Loss and taxation are split into this many symbol shards in process mode
+    SYMBOL_SHARDS = int(os.getenv('SYMBOL_SHARDS', '1'))
+    # Run the processing stages under pandas copy-on-write, so copies of shared frames are deferred until written
+    PANDAS_COPY_ON_WRITE = os.getenv('PANDAS_COPY_ON_WRITE', 'false').lower() == 'true'
+    
+    # Processing Configuration
+    # 'count' keeps min(BUY rows, SELL rows) per (date, name); 'quantity' matches actual intraday quantity
+    INTRADAY_MATCHING_MODE = os.getenv('INTRADAY_MATCHING_MODE', 'count').lower()
+    # Process only rows appended since the last run, from a ledger checkpoint per spreadsheet
+    INCREMENTAL_PROCESSING = os.getenv('INCREMENTAL_PROCESSING', 'false').lower() == 'true'
+    CHECKPOINT_DIRECTORY = os.path.expanduser(os.getenv('CHECKPOINT_DIRECTORY', os.path.join(cache_directory, 'checkpoints')))
+    # Store the open lots and running totals per symbol in the database after every successful run;
+    # without INCREMENTAL_PROCESSING this builds a checkpoint on every run only for the snapshot
+    LEDGER_SNAPSHOTS = os.getenv('LEDGER_SNAPSHOTS', 'false').lower() == 'true'
+    # Record each task's peak allocations with tracemalloc instead of its sampled RSS growth (slower)
+    MEMORY_TRACING = os.getenv('MEMORY_TRACING', 'false').lower() == 'true'
+    
+    # Market Data Configuration
+    # Keep past daily bars in a SQLite price store shared by every worker using the directory
+    PRICE_STORE_ENABLED = os.getenv('PRICE_STORE_ENABLED', 'true').lower() == 'true'
+    PRICE_STORE_DIRECTORY = os.path.expanduser(os.getenv('PRICE_STORE_DIRECTORY', os.path.join(cache_directory, 'price_store')))
+    # Tickers per bulk yfinance download, at most MARKET_DATA_RATE_LIMIT of them while it is set; stocks missing from
+    # the response are fetched one at a time, below 2 disables it
+    MARKET_DATA_BULK_SIZE = int(os.getenv('MARKET_DATA_BULK_SIZE', '100'))
+    # Stocks fetched at the same time when they are fetched one at a time, below 2 fetches them in turn
+    MARKET_DATA_CONCURRENCY = int(os.getenv('MARKET_DATA_CONCURRENCY', '8'))
+    # yfinance requests per second started by each worker process, 0 leaves them unlimited
+    MARKET_DATA_RATE_LIMIT = float(os.getenv('MARKET_DATA_RATE_LIMIT', '10'))
+    # Days between a stock's requested dates beyond which they are fetched as separate windows
+    MARKET_DATA_WINDOW_GAP = int(os.getenv('MARKET_DATA_WINDOW_GAP', '30'))
+    # Time before a stock no exchange had data for is tried again
+    EXCHANGE_NEGATIVE_TTL = int(os.getenv('EXCHANGE_NEGATIVE_TTL', '86400'))  # seconds
+    
+    # Metrics Configuration
+    # Port of the Prometheus text metrics endpoint served by the worker; 0 disables it
+    METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))
     
     # Logging Configuration
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
@@ -5,11 +5,80 @@ Handles participant-specific calculation rates and configurations
 
 import json
 import os
-from typing import Dict, Any
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Any, Optional, Tuple
+import numpy as np
+import pandas as pd
+from config.config import Config
 from config.logging_config import setup_logging
 
 logger = setup_logging(__name__)
 
+# Exchanges a scalar exchange_transaction_charges value applies to
+DEFAULT_EXCHANGES = ('NSE', 'BSE')
+
+
+@dataclass(frozen=True)
+class ParticipantRateTable:
+    """
+    Immutable, pre-resolved charge rates for a single participant
+    
+    Rates are stored per effective period: period i applies to trades dated on or
+    after effective_from[i] and before effective_from[i + 1]. Every rate array is
+    indexed by period, exchange_transaction_charges by (period, exchange code).
+    """
+    participant: str
+    effective_from: np.ndarray  # sorted date ordinals, first period starts at 0
+    stt_delivery: np.ndarray
+    stt_intraday: np.ndarray
+    sebi_transaction_charges: np.ndarray
+    brokerage_delivery_rate: np.ndarray
+    brokerage_delivery_max: np.ndarray
+    brokerage_intraday_rate: np.ndarray
+    brokerage_intraday_max: np.ndarray
+    stamp_duty_delivery: np.ndarray
+    stamp_duty_intraday: np.ndarray
+    dp_charges: np.ndarray
+    gst_rate: np.ndarray
+    exchanges: Tuple[str, ...]
+    exchange_transaction_charges: np.ndarray
+    
+    def period_index(self, date_ordinals: np.ndarray) -> np.ndarray:
+        """Resolve the effective period of every trade with a single sorted lookup"""
+        return np.searchsorted(self.effective_from, date_ordinals, side='right') - 1
+    
+    def exchange_codes(self, exchanges: pd.Series) -> np.ndarray:
+        """
+        Map an exchange column to integer codes into exchange_transaction_charges
+        
+        Only the distinct exchange values are normalized, not every row.
+        
+        Raises:
+            KeyError: If an exchange has no configured rate
+        """
+        codes, uniques = pd.factorize(exchanges)
+        normalized = [str(exchange).upper() for exchange in uniques]
+        unknown = [exchange for exchange in dict.fromkeys(normalized) if exchange not in self.exchanges]
+        if (codes < 0).any():
+            unknown.append('<missing>')
+        if unknown:
+            raise KeyError(f"Participant '{self.participant}' has no exchange transaction charges for exchanges "
+                           f"{unknown}, only for {list(self.exchanges)}")
+        lookup = np.array([self.exchanges.index(exchange) for exchange in normalized], dtype=np.intp)
+        return lookup[codes]
+    
+    def exchange_rates(self, exchanges: pd.Series, periods: np.ndarray) -> np.ndarray:
+        """Get the exchange transaction charge rate for every row"""
+        codes = self.exchange_codes(exchanges)
+        rates = self.exchange_transaction_charges[periods, codes]
+        missing = np.isnan(rates)
+        if missing.any():
+            unknown = sorted({self.exchanges[code] for code in codes[missing]})
+            raise KeyError(f"Participant '{self.participant}' has no exchange transaction charges for exchanges "
+                           f"{unknown} on some trade dates")
+        return rates
+
 class ParticipantConfigManager:
     """Manages participant-specific calculation configurations"""
     
@@ -24,6 +93,7 @@ class ParticipantConfigManager:
         self.config_file_path = os.path.join(current_dir, 'participant_rates.json')
         
         self.participant_configs = self._load_config()
+        self._rate_tables: Dict[str, ParticipantRateTable] = {}
         
     def _load_config(self) -> Dict[str, Dict[str, Any]]:
         """Load participant configurations from JSON file"""
@@ -68,55 +138,178 @@ class ParticipantConfigManager:
             logger.error(f"Error getting participant config for '{participant_name}': {e}")
             raise
     
-    def get_stt_rate(self, participant_name: str, is_intraday: bool = False) -> float:
-        """Get STT rate for a participant"""
-        config = self.get_participant_config(participant_name)
-        stt_rates = config["stt_rates"]
+    @staticmethod
+    def _resolve_schedules(config: Dict[str, Any], as_of: str) -> Dict[str, Any]:
+        """
+        Overlay the rate_schedules entries effective on a date onto the base config
         
-        if is_intraday:
-            return stt_rates["intraday"]
-        else:
-            return stt_rates["delivery"]
+        Each schedule is a list of {"effective_from": "YYYY-MM-DD", "value": ...} entries;
+        the base value applies before the first entry.
+        """
+        resolved = dict(config)
+        for charge_key, schedule in config.get("rate_schedules", {}).items():
+            for entry in sorted(schedule, key=lambda entry: entry["effective_from"]):
+                if entry["effective_from"] > as_of:
+                    break
+                resolved[charge_key] = entry["value"]
+        return resolved
     
-    def get_brokerage_rate(self, participant_name: str, is_intraday: bool = False) -> Dict[str, Any]:
-        """Get brokerage configuration for a participant"""
+    def get_effective_config(self, participant_name: str, as_of: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Get the configuration of a participant as effective on a trade date
+        
+        Args:
+            participant_name: Name of the participant (case-insensitive)
+            as_of: Trade date in YYYY-MM-DD format, None for the base rates
+        """
         config = self.get_participant_config(participant_name)
-        if is_intraday:
-            return config["brokerage"]["intraday"]
-        else:
-            return config["brokerage"]["delivery"]
+        if as_of is None or "rate_schedules" not in config:
+            return config
+        return self._resolve_schedules(config, as_of)
+    
+    def get_stt_rate(self, participant_name: str, is_intraday: bool = False, as_of: Optional[str] = None) -> float:
+        """Get STT rate for a participant"""
+        config = self.get_effective_config(participant_name, as_of)
+        delivery_rate, intraday_rate = self._split_by_trade_type(config["stt_rates"])
+        return intraday_rate if is_intraday else delivery_rate
     
-    def get_exchange_transaction_charges_rate(self, participant_name: str, exchange: str) -> float:
+    def get_brokerage_rate(self, participant_name: str, is_intraday: bool = False, as_of: Optional[str] = None) -> Dict[str, Any]:
+        """Get brokerage configuration for a participant"""
+        config = self.get_effective_config(participant_name, as_of)
+        delivery_brokerage, intraday_brokerage = self._split_by_trade_type(config["brokerage"])
+        return intraday_brokerage if is_intraday else delivery_brokerage
+    
+    def get_exchange_transaction_charges_rate(self, participant_name: str, exchange: str, as_of: Optional[str] = None) -> float:
         """Get transaction charges rate for a participant"""
-        config = self.get_participant_config(participant_name)
-        return config["exchange_transaction_charges"][exchange.upper()]
+        config = self.get_effective_config(participant_name, as_of)
+        exchange_charges = config["exchange_transaction_charges"]
+        if not isinstance(exchange_charges, dict):
+            exchange_charges = {exchange: exchange_charges for exchange in DEFAULT_EXCHANGES}
+        return exchange_charges[exchange.upper()]
     
-    def get_stamp_duty_rate(self, participant_name: str, is_intraday: bool = False) -> float:
+    def get_stamp_duty_rate(self, participant_name: str, is_intraday: bool = False, as_of: Optional[str] = None) -> float:
         """Get stamp duty rate for a participant"""
-        config = self.get_participant_config(participant_name)
-        if is_intraday:
-            return config["stamp_duty"]["intraday"]
-        else:
-            return config["stamp_duty"]["delivery"]
+        config = self.get_effective_config(participant_name, as_of)
+        delivery_rate, intraday_rate = self._split_by_trade_type(config["stamp_duty"])
+        return intraday_rate if is_intraday else delivery_rate
     
-    def get_dp_charges(self, participant_name: str) -> float:
+    def get_dp_charges(self, participant_name: str, as_of: Optional[str] = None) -> float:
         """Get DP charges for a participant"""
-        config = self.get_participant_config(participant_name)
+        config = self.get_effective_config(participant_name, as_of)
         return config["dp_charges"]
     
-    def get_gst_rate(self, participant_name: str) -> float:
+    def get_gst_rate(self, participant_name: str, as_of: Optional[str] = None) -> float:
         """Get GST rate for a participant"""
-        config = self.get_participant_config(participant_name)
+        config = self.get_effective_config(participant_name, as_of)
         return config["gst_rate"]
     
-    def get_sebi_transaction_charges_rate(self, participant_name: str) -> float:
+    def get_sebi_transaction_charges_rate(self, participant_name: str, as_of: Optional[str] = None) -> float:
         """Get exchange transaction charges rate for a participant"""
-        config = self.get_participant_config(participant_name)
+        config = self.get_effective_config(participant_name, as_of)
         return config["sebi_transaction_charges"]
     
+    @staticmethod
+    def _split_by_trade_type(value: Any) -> Tuple[Any, Any]:
+        """Return (delivery, intraday) for values that may or may not be split by trade type"""
+        if isinstance(value, dict) and "delivery" in value and "intraday" in value:
+            return value["delivery"], value["intraday"]
+        return value, value
+    
+    def _compile_period(self, config: Dict[str, Any]) -> Dict[str, Any]:
+        """Compile the rates of one effective period into scalars and an exchange map"""
+        stt_delivery, stt_intraday = self._split_by_trade_type(config["stt_rates"])
+        brokerage_delivery, brokerage_intraday = self._split_by_trade_type(config["brokerage"])
+        stamp_delivery, stamp_intraday = self._split_by_trade_type(config["stamp_duty"])
+        
+        exchange_charges = config["exchange_transaction_charges"]
+        if not isinstance(exchange_charges, dict):
+            exchange_charges = {exchange: exchange_charges for exchange in DEFAULT_EXCHANGES}
+        
+        return {
+            "stt_delivery": float(stt_delivery),
+            "stt_intraday": float(stt_intraday),
+            "sebi_transaction_charges": float(config["sebi_transaction_charges"]),
+            "brokerage_delivery_rate": float(brokerage_delivery["rate"]),
+            "brokerage_delivery_max": float(brokerage_delivery["max_amount"]),
+            "brokerage_intraday_rate": float(brokerage_intraday["rate"]),
+            "brokerage_intraday_max": float(brokerage_intraday["max_amount"]),
+            "stamp_duty_delivery": float(stamp_delivery),
+            "stamp_duty_intraday": float(stamp_intraday),
+            "dp_charges": float(config["dp_charges"]),
+            "gst_rate": float(config["gst_rate"]),
+            "exchange_transaction_charges": {
+                exchange.upper(): float(rate) for exchange, rate in exchange_charges.items()
+            }
+        }
+    
+    @staticmethod
+    def _read_only(values, dtype=np.float64) -> np.ndarray:
+        """Build a read-only array so compiled tables cannot be mutated in place"""
+        array = np.array(values, dtype=dtype)
+        array.flags.writeable = False
+        return array
+    
+    def _compile_rate_table(self, participant_key: str) -> ParticipantRateTable:
+        """Compile the JSON config and rate schedules of a participant into a ParticipantRateTable"""
+        config = self.get_participant_config(participant_key)
+        
+        # Every schedule date starts a new period; the base config covers everything before
+        schedule_dates = sorted({
+            entry["effective_from"]
+            for schedule in config.get("rate_schedules", {}).values()
+            for entry in schedule
+        })
+        periods = [self._compile_period(config)]
+        periods.extend(self._compile_period(self._resolve_schedules(config, date)) for date in schedule_dates)
+        effective_from = [0] + [
+            datetime.strptime(date, Config.DATA_TIME_FORMAT).toordinal() for date in schedule_dates
+        ]
+        
+        exchanges = tuple(dict.fromkeys(
+            exchange for period in periods for exchange in period["exchange_transaction_charges"]
+        ))
+        exchange_rates = [
+            [period["exchange_transaction_charges"].get(exchange, np.nan) for exchange in exchanges]
+            for period in periods
+        ]
+        scalar_fields = [key for key in periods[0] if key != "exchange_transaction_charges"]
+        
+        return ParticipantRateTable(
+            participant=participant_key,
+            effective_from=self._read_only(effective_from, dtype=np.int64),
+            exchanges=exchanges,
+            exchange_transaction_charges=self._read_only(exchange_rates).reshape(len(periods), len(exchanges)),
+            **{field: self._read_only([period[field] for period in periods]) for field in scalar_fields}
+        )
+    
+    def get_rate_table(self, participant_name: str) -> ParticipantRateTable:
+        """
+        Get the compiled rate table for a participant
+        
+        Tables are compiled on first use and cached for the life of the process.
+        
+        Args:
+            participant_name: Name of the participant (case-insensitive)
+            
+        Returns:
+            ParticipantRateTable: Immutable rate table
+        """
+        participant_key = participant_name.lower()
+        rate_table = self._rate_tables.get(participant_key)
+        if rate_table is None:
+            try:
+                rate_table = self._compile_rate_table(participant_key)
+            except Exception as e:
+                logger.error(f"Error compiling rate table for '{participant_name}': {e}")
+                raise
+            self._rate_tables[participant_key] = rate_table
+            logger.info(f"Compiled rate table for {participant_key}")
+        return rate_table
+    
     def reload_config(self):
         """Reload configuration from file"""
         self.participant_configs = self._load_config()
+        self._rate_tables = {}
         logger.info("Participant config reloaded")
     
     def list_participants(self) -> list:
@@ -128,6 +321,7 @@ class ParticipantConfigManager:
         try:
             participant_key = participant_name.value.lower()
             self.participant_configs[participant_key] = config
+            self._rate_tables.pop(participant_key, None)
             
             # Save to file
             with open(self.config_file_path, 'w') as f:
@@ -1,8 +1,15 @@
 import yfinance as yf
 import logging
+import threading
+import time
+import pandas as pd
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime, timedelta
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, Iterator, List, Tuple, Optional
 from config.config import Config
+from helper.price_store import PriceStore
+from utils.rate_limiter import get_rate_limiter
+from utils.worker_metrics import registry
 
 logger = logging.getLogger(__name__)
 
@@ -14,23 +21,139 @@ class MarketDataHelper:
         {'suffix': '.NS', 'name': 'NSE', 'priority': 1},
         {'suffix': '.BO', 'name': 'BSE', 'priority': 2}
     ]
+    # Host whose request rate every yfinance call counts towards
+    YFINANCE_HOST = 'finance.yahoo.com'
+    # yfinance keeps the results and errors of a download in module globals, so downloads run one at a time
+    _download_lock = threading.Lock()
     
     def __init__(self):
         self.config = Config()
         # Cache for storing fetched data
-        self._price_cache: Dict[str, Dict] = {}
+        self._price_cache: Dict[Tuple[str, int], Dict] = {}
         self._current_price_cache: Dict[str, float] = {}
         self._cache_ttl = 1200  # 20 minutes cache TTL
+        # Past daily bars never change, so they are kept on disk for every worker
+        self._price_store = PriceStore() if self.config.PRICE_STORE_ENABLED else None
+        # (exchange name or None, resolution time) by stock, persisted in the price store
+        self._exchange_resolutions: Dict[str, Tuple[Optional[str], float]] = {}
     
-    def _get_cache_key(self, stock_name: str, date: datetime) -> str:
-        """Generate cache key for stock and date"""
-        date_str = date.strftime(self.config.DATA_TIME_FORMAT)
-        return f"{stock_name}_{date_str}"
+    def _get_cache_key(self, stock_name: str, date: datetime) -> Tuple[str, int]:
+        """Generate cache key for stock and date from the day ordinal, without formatting the date"""
+        return stock_name, date.toordinal()
     
     def _get_current_price_cache_key(self, stock_name: str) -> str:
         """Generate cache key for current price"""
         return f"current_{stock_name}"
     
+    def _fetch_history(self, full_name: str, start: datetime, end: datetime):
+        """
+        Fetch daily bars of a ticker from yfinance, recording the call latency
+        
+        Prices are as traded, not adjusted for later dividends, so bars fetched on different
+        days stay on the same basis; the Adj Close column carries the adjustment.
+        """
+        get_rate_limiter(self.YFINANCE_HOST).acquire()
+        with registry.time('worker_external_call_duration_seconds', errors='worker_external_call_errors_total',
+                           service='yfinance', call='history'):
+            return yf.Ticker(full_name).history(start=start, end=end, auto_adjust=False)
+    
+    def _record_cache_lookups(self, cache: str, hits: int, misses: int):
+        """Record the hits and misses of lookups in a cache"""
+        if hits:
+            registry.inc('worker_market_data_cache_lookups_total', hits, cache=cache, result='hit')
+        if misses:
+            registry.inc('worker_market_data_cache_lookups_total', misses, cache=cache, result='miss')
+    
+    def _load_exchange_resolutions(self, stock_names):
+        """Load the stored exchange resolutions of stocks not resolved in this process yet"""
+        unresolved = [stock_name for stock_name in stock_names if stock_name not in self._exchange_resolutions]
+        if self._price_store is not None and unresolved:
+            self._exchange_resolutions.update(self._price_store.get_resolutions(unresolved))
+    
+    def _get_exchanges(self, stock_name: str, skip_resolved_to_none: bool = True) -> List[Dict]:
+        """
+        Get the exchanges to try for a stock
+        
+        Args:
+            stock_name: Stock symbol
+            skip_resolved_to_none: Whether a stock resolved to none gets no exchange until the
+                resolution expires
+            
+        Returns:
+            list: The exchange the stock resolved to followed by the others, no exchange while
+                a resolution to none is skipped, or every exchange in priority order
+        """
+        exchange_name, resolved_at = self._exchange_resolutions.get(stock_name, (None, None))
+        if exchange_name is not None:
+            # The other exchanges still answer for days the resolved one has no bars for
+            return sorted(self.EXCHANGES, key=lambda exchange: exchange['name'] != exchange_name)
+        if (skip_resolved_to_none and resolved_at is not None
+                and time.time() - resolved_at < self.config.EXCHANGE_NEGATIVE_TTL):
+            return []
+        return self.EXCHANGES
+    
+    def _resolve_exchange(self, stock_name: str, exchange: Optional[Dict]):
+        """Record the exchange a stock has data on, or None if no exchange has data for it"""
+        exchange_name = exchange['name'] if exchange else None
+        current_name = self._exchange_resolutions.get(stock_name, (None,))[0]
+        # Empty responses never override an exchange the stock had data on
+        if current_name is not None and exchange_name in (None, current_name):
+            return
+        resolved_at = time.time()
+        self._exchange_resolutions[stock_name] = (exchange_name, resolved_at)
+        if self._price_store is not None:
+            self._price_store.put_resolution(stock_name, exchange_name, resolved_at)
+    
+    def _store_history(self, stock_name: str, exchange_suffix: str, hist):
+        """Keep the past bars of fetched history in the price store"""
+        if self._price_store is not None and not hist.empty:
+            exchange_name = next(exchange['name'] for exchange in self.EXCHANGES if exchange['suffix'] == exchange_suffix)
+            self._price_store.put_bars(stock_name, exchange_name, hist)
+    
+    def _get_stored_prices(self, stock_dates: List[Tuple[str, datetime]], days_before: int = 0) -> Dict[Tuple[str, datetime], List]:
+        """
+        Get price details from the price store, caching them in memory
+        
+        Args:
+            stock_dates: List of (stock_name, date) tuples
+            days_before: Days between each date and the date of the bar returned for it
+            
+        Returns:
+            dict: Mapping of (stock_name, date) to price details, for the stored bars only
+        """
+        if self._price_store is None or not stock_dates:
+            return {}
+        
+        bar_ordinals = {(stock_name, date): date.toordinal() - days_before for stock_name, date in stock_dates}
+        symbol_dates = {}
+        for (stock_name, _), ordinal in bar_ordinals.items():
+            symbol_dates.setdefault(stock_name, set()).add(ordinal)
+        bars = self._price_store.get_bars(symbol_dates, [exchange['name'] for exchange in self.EXCHANGES])
+        suffixes = {exchange['name']: exchange['suffix'] for exchange in self.EXCHANGES}
+        
+        results = {}
+        for (stock_name, date), ordinal in bar_ordinals.items():
+            bar = bars.get(stock_name, {}).get(ordinal)
+            if bar is None:
+                continue
+            exchange_name, open_price, high, low, close, volume = bar
+            formatted_data = [
+                date.strftime(self.config.DATA_TIME_FORMAT),
+                stock_name + suffixes[exchange_name],
+                open_price,
+                high,
+                low,
+                close,
+                volume
+            ]
+            self._price_cache[self._get_cache_key(stock_name, date)] = {
+                'data': formatted_data,
+                'timestamp': datetime.now()
+            }
+            results[(stock_name, date)] = formatted_data
+        self._record_cache_lookups('price_store', len(results), len(bar_ordinals) - len(results))
+        return results
+    
     def _is_cache_valid(self, cache_entry: Dict) -> bool:
         """Check if cache entry is still valid"""
         if 'timestamp' not in cache_entry:
@@ -51,8 +174,8 @@ class MarketDataHelper:
         """
         try:
             full_name = stock_name + exchange_suffix
-            stock = yf.Ticker(full_name)
-            hist = stock.history(start=date - timedelta(days=5), end=date - timedelta(days=4))
+            hist = self._fetch_history(full_name, date - timedelta(days=5), date - timedelta(days=4))
+            self._store_history(stock_name, exchange_suffix, hist)
             
             if not hist.empty:
                 row = hist.iloc[0]
@@ -66,21 +189,24 @@ class MarketDataHelper:
         
         return {'success': False}
     
-    def _get_data_with_fallback(self, stock_name: str, date: datetime):
+    def _get_data_with_fallback(self, stock_name: str, date: datetime, skip_resolved_to_none: bool = True):
         """
-        Get data with exchange fallback (NSE → BSE)
+        Get data with exchange fallback (NSE → BSE), starting at the exchange the stock resolved to
         
         Args:
             stock_name: Stock symbol
             date: Date to fetch data for
+            skip_resolved_to_none: Whether a stock no exchange had data for is skipped
             
         Returns:
             dict: Exchange result with success status and data
         """
-        # Try exchanges in priority order
-        for exchange in self.EXCHANGES:
+        # Try exchanges in priority order; a single day without data does not resolve a stock to none
+        self._load_exchange_resolutions([stock_name])
+        for exchange in self._get_exchanges(stock_name, skip_resolved_to_none):
             result = self._try_exchange_data(stock_name, date, exchange['suffix'])
             if result['success']:
+                self._resolve_exchange(stock_name, exchange)
                 return result
         
         logger.warning(f"No data found for {stock_name} on {date} in any exchange")
@@ -108,13 +234,14 @@ class MarketDataHelper:
             int(row['Volume'])
         ]
     
-    def get_stock_price_details(self, date, stock_name):
+    def get_stock_price_details(self, date, stock_name, skip_resolved_to_none: bool = True):
         """
         Get stock price details using yfinance with fallback to BSE and caching
         
         Args:
             date: Date to fetch data for
             stock_name: Stock symbol
+            skip_resolved_to_none: Whether a stock no exchange had data for is skipped
             
         Returns:
             list: Formatted price details or empty list if not found
@@ -124,10 +251,17 @@ class MarketDataHelper:
             cache_key = self._get_cache_key(stock_name, date)
             if cache_key in self._price_cache and self._is_cache_valid(self._price_cache[cache_key]):
                 logger.debug(f"Cache hit for {stock_name} on {date}")
+                self._record_cache_lookups('price', 1, 0)
                 return self._price_cache[cache_key]['data']
+            self._record_cache_lookups('price', 0, 1)
+            
+            # Then the price store, which holds the bar from 5 days before the date as fetched below
+            stored = self._get_stored_prices([(stock_name, date)], days_before=5)
+            if stored:
+                return stored[(stock_name, date)]
             
             # Fetch from API
-            result = self._get_data_with_fallback(stock_name, date)
+            result = self._get_data_with_fallback(stock_name, date, skip_resolved_to_none)
             
             if result['success']:
                 formatted_data = self._format_ohlcv_data(
@@ -148,94 +282,324 @@ class MarketDataHelper:
             logger.error(f"Error fetching stock data for {stock_name}: {e}")
             return []
     
-    def batch_get_stock_prices(self, stock_dates: List[Tuple[str, datetime]]) -> Dict[Tuple[str, datetime], List]:
+    def _download_history(self, full_names: List[str], start: datetime, end: datetime) -> Dict[str, object]:
         """
-        Batch fetch stock prices for multiple stock-date combinations
+        Fetch daily bars of many tickers from yfinance in bulk, recording the call latency
         
         Args:
-            stock_dates: List of (stock_name, date) tuples
+            full_names: Tickers with exchange suffix
+            start: First date to fetch
+            end: Date to fetch until, exclusive
             
         Returns:
-            dict: Mapping of (stock_name, date) to price details
+            dict: Daily bars by ticker, empty for the tickers answered without bars; tickers
+                yfinance recorded an error for, or all of them if it cannot tell, are left out
         """
-        results = {}
-        uncached_requests = []
+        history = {}
+        limiter = get_rate_limiter(self.YFINANCE_HOST)
+        # yfinance requests each ticker of a download separately and cannot wait for the limiter
+        # between them, so a download takes at most one burst of tickers, paid for up front
+        chunk_size = self.config.MARKET_DATA_BULK_SIZE
+        if limiter.rate > 0:
+            chunk_size = min(chunk_size, limiter.burst)
+        for chunk_start in range(0, len(full_names), chunk_size):
+            chunk = full_names[chunk_start:chunk_start + chunk_size]
+            with self._download_lock:
+                for _ in chunk:
+                    limiter.acquire()
+                with registry.time('worker_external_call_duration_seconds', errors='worker_external_call_errors_total',
+                                   service='yfinance', call='download'):
+                    # Unadjusted like _fetch_history, with one (ticker, field) column group per ticker
+                    frame = yf.download(chunk, start=start, end=end, group_by='ticker', auto_adjust=False,
+                                        actions=False, progress=False, multi_level_index=True,
+                                        threads=max(min(self.config.MARKET_DATA_CONCURRENCY, len(chunk)), 1))
+                # Tickers that failed, such as on rate limits or timeouts, are dropped from the frame
+                errors = getattr(getattr(yf, 'shared', None), '_ERRORS', None)
+            if not isinstance(errors, dict):
+                logger.warning(f"Cannot tell which of {len(chunk)} downloaded tickers failed")
+                continue
+            failed = {full_name.upper() for full_name in errors}
+            tickers = set(frame.columns.get_level_values(0)) if frame is not None and not frame.empty else set()
+            for full_name in chunk:
+                if full_name.upper() in failed:
+                    continue
+                if full_name in tickers:
+                    # Days on which only other tickers traded come back as empty rows
+                    history[full_name] = frame[full_name].dropna(subset=['Open', 'High', 'Low', 'Close', 'Volume'])
+                else:
+                    history[full_name] = pd.DataFrame()
+        return history
+    
+    def _bulk_fetch_history(self, stock_names: List[str], start: datetime, end: datetime) -> Optional[Dict[str, Tuple[str, object]]]:
+        """
+        Fetch daily bars of many stocks on the primary exchange in bulk
         
-        # Check cache first
-        for stock_name, date in stock_dates:
-            cache_key = self._get_cache_key(stock_name, date)
-            if cache_key in self._price_cache and self._is_cache_valid(self._price_cache[cache_key]):
-                results[(stock_name, date)] = self._price_cache[cache_key]['data']
-                logger.debug(f"Cache hit for {stock_name} on {date}")
-            else:
-                uncached_requests.append((stock_name, date))
+        Args:
+            stock_names: Stock symbols without exchange suffix
+            start: First date to fetch
+            end: Date to fetch until, exclusive
+            
+        Returns:
+            dict: (full exchange name, daily bars) by stock, or (None, None) for the stocks the
+                exchange answered without bars; stocks whose download failed are left out, and
+                None is returned if the whole download failed
+        """
+        if self.config.MARKET_DATA_BULK_SIZE < 2 or len(stock_names) < 2:
+            return None
+        exchange = self.EXCHANGES[0]
+        try:
+            history = self._download_history([stock_name + exchange['suffix'] for stock_name in stock_names], start, end)
+        except Exception as e:
+            logger.warning(f"Failed to bulk download {exchange['suffix']} data for {len(stock_names)} stocks: {e}")
+            return None
         
-        # Group uncached requests by stock name to make true batch API calls
-        stock_groups = {}
-        for stock_name, date in uncached_requests:
-            if stock_name not in stock_groups:
-                stock_groups[stock_name] = []
-            stock_groups[stock_name].append(date)
+        fetched = {}
+        for stock_name in stock_names:
+            full_name = stock_name + exchange['suffix']
+            if full_name not in history:
+                continue
+            if history[full_name].empty:
+                fetched[stock_name] = (None, None)
+                continue
+            self._store_history(stock_name, exchange['suffix'], history[full_name])
+            self._resolve_exchange(stock_name, exchange)
+            fetched[stock_name] = (full_name, history[full_name])
+        found = sum(full_name is not None for full_name, _ in fetched.values())
+        logger.info(f"Bulk downloaded {exchange['suffix']} data for {found} of {len(stock_names)} stocks")
+        return fetched
+    
+    def _fetch_history_with_fallback(self, stock_name: str, start: datetime, end: datetime,
+                                     exchanges: Optional[List[Dict]] = None) -> Tuple[Optional[str], object, bool]:
+        """
+        Fetch daily bars of one stock, trying exchanges in priority order
         
-        # Make true batch API calls - one call per stock for all its dates
-        for stock_name, dates in stock_groups.items():
-            logger.info(f"Making batch API call for {stock_name} for {len(dates)} dates")
+        A stock resolved to an exchange tries that exchange first, and the others only if it
+        has no bars for the range.
+        
+        Args:
+            stock_name: Stock symbol
+            start: First date to fetch
+            end: Date to fetch until, exclusive
+            exchanges: Exchanges to try instead of those of the stock, when the others are
+                known to have no data
             
+        Returns:
+            tuple: (full exchange name, daily bars, whether every call succeeded); the name and
+                bars are None if no exchange has data
+        """
+        if exchanges is None:
+            # Stocks resolved to none that reach here are meant to be fetched
+            exchanges = self._get_exchanges(stock_name, skip_resolved_to_none=False)
+        failed = False
+        for exchange in exchanges:
             try:
-                # Get the date range for this stock
-                min_date = min(dates)
-                max_date = max(dates)
-                
-                # Add buffer days for better data retrieval
-                start_date = min_date - timedelta(days=5)
-                end_date = max_date + timedelta(days=1)
-                
-                # Try exchanges in priority order for batch fetch
-                batch_data = None
-                exchange_used = None
+                full_name = stock_name + exchange['suffix']
+                hist = self._fetch_history(full_name, start, end)
+                self._store_history(stock_name, exchange['suffix'], hist)
                 
-                for exchange in self.EXCHANGES:
+                if not hist.empty:
+                    logger.debug(f"Successfully fetched batch data for {full_name}")
+                    self._resolve_exchange(stock_name, exchange)
+                    return full_name, hist, not failed
+            except Exception as e:
+                logger.warning(f"Failed to get {exchange['suffix']} batch data for {stock_name}: {e}")
+                failed = True
+                continue
+        return None, None, not failed
+    
+    def _cluster_dates(self, dates: List[datetime], days_before: int) -> Dict[Tuple[datetime, datetime], List[datetime]]:
+        """
+        Split the requested dates of a stock into windows of nearby dates
+        
+        Dates more than MARKET_DATA_WINDOW_GAP days apart fall into separate windows, so a stock
+        traded in 2015 and in 2024 fetches two short ranges instead of ten years of bars.
+        
+        Args:
+            dates: Requested dates
+            days_before: Days between each date and the date of the bar returned for it
+            
+        Returns:
+            dict: Requested dates by (first date to fetch, date to fetch until), with buffer days
+                for better data retrieval
+        """
+        clusters = []
+        for date in sorted(dates, key=lambda date: date.toordinal()):
+            if clusters and date.toordinal() - clusters[-1][-1].toordinal() <= self.config.MARKET_DATA_WINDOW_GAP:
+                clusters[-1].append(date)
+            else:
+                clusters.append([date])
+        
+        # Windows start and end at midnight, so stocks with dates on the same days share them
+        return {
+            (datetime.fromordinal(cluster[0].toordinal() - days_before - 5),
+             datetime.fromordinal(cluster[-1].toordinal() - days_before + 1)): cluster
+            for cluster in clusters
+        }
+    
+    def _fetch_windows(self, windows: Dict[Tuple[datetime, datetime], Dict[str, List[datetime]]]) -> Iterator[Tuple[str, List[datetime], Optional[str], object, bool]]:
+        """
+        Fetch the daily bars of every window, up to MARKET_DATA_CONCURRENCY calls at a time
+        
+        The stocks of a window that may be on the primary exchange are downloaded in bulk, and
+        the others one at a time. Stocks the bulk response has no bars for only try the remaining
+        exchanges, and stocks whose download failed try them all. Each stock runs its
+        own NSE → BSE fallback, so one stock's BSE call overlaps the other stocks' NSE calls,
+        all within the yfinance rate limit.
+        
+        Args:
+            windows: Requested dates by stock, by (first date to fetch, date to fetch until)
+            
+        Returns:
+            iterator: (stock_name, requested dates, full exchange name, daily bars, whether every
+                call succeeded) as each window of a stock finishes; the name and bars are None if
+                no exchange has data
+        """
+        def fetch(stock_name: str, start: datetime, end: datetime,
+                  exchanges: Optional[List[Dict]] = None) -> Tuple[Optional[str], object, bool]:
+            logger.info(f"Making batch API call for {stock_name} for {len(windows[(start, end)][stock_name])} dates")
+            full_name, hist, succeeded = self._fetch_history_with_fallback(stock_name, start, end, exchanges)
+            # Without bars in a bulk response is not an answer the stock can be resolved to none on
+            return full_name, hist, succeeded and exchanges is None
+        
+        with ThreadPoolExecutor(max_workers=max(self.config.MARKET_DATA_CONCURRENCY, 1),
+                                thread_name_prefix='market-data') as executor:
+            # (window, stock names, whether it is a bulk download) by future
+            pending = {}
+            for window, stock_dates in windows.items():
+                bulk_names = [stock_name for stock_name in stock_dates
+                              if self._get_exchanges(stock_name, skip_resolved_to_none=False)[:1] == self.EXCHANGES[:1]]
+                if self.config.MARKET_DATA_BULK_SIZE < 2 or len(bulk_names) < 2:
+                    bulk_names = []
+                else:
+                    pending[executor.submit(self._bulk_fetch_history, bulk_names, *window)] = (window, bulk_names, True)
+                for stock_name in stock_dates:
+                    if stock_name not in bulk_names:
+                        pending[executor.submit(fetch, stock_name, *window)] = (window, [stock_name], False)
+            
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    window, stock_names, is_bulk = pending.pop(future)
                     try:
-                        full_name = stock_name + exchange['suffix']
-                        stock = yf.Ticker(full_name)
-                        hist = stock.history(start=start_date, end=end_date)
-                        
-                        if not hist.empty:
-                            batch_data = hist
-                            exchange_used = full_name
-                            logger.debug(f"Successfully fetched batch data for {full_name}")
-                            break
+                        result = future.result()
                     except Exception as e:
-                        logger.warning(f"Failed to get {exchange['suffix']} batch data for {stock_name}: {e}")
+                        logger.error(f"Error in batch API call for {stock_names}: {e}")
+                        result = None if is_bulk else (None, None, False)
+                    
+                    if not is_bulk:
+                        yield (stock_names[0], windows[window][stock_names[0]], *result)
                         continue
-                
+                    for stock_name in stock_names:
+                        if result is None or stock_name not in result:
+                            # The download failed for the stock, so every exchange is tried again
+                            pending[executor.submit(fetch, stock_name, *window)] = (window, [stock_name], False)
+                        elif result[stock_name][0] is not None:
+                            yield (stock_name, windows[window][stock_name], *result[stock_name], True)
+                        else:
+                            # The primary exchange answered without bars, so only the others are tried
+                            pending[executor.submit(fetch, stock_name, *window, self.EXCHANGES[1:])] = (window, [stock_name], False)
+    
+    def _match_dates(self, stock_name: str, dates: List[datetime], exchange_used: str, batch_data,
+                     days_before: int) -> Dict[Tuple[str, datetime], List]:
+        """
+        Pick the bars of the requested dates from fetched daily bars, caching them
+        
+        Args:
+            stock_name: Stock symbol
+            dates: Requested dates
+            exchange_used: Full exchange name of the bars
+            batch_data: Daily bars indexed by timestamp
+            days_before: Days between each date and the date of the bar returned for it
+            
+        Returns:
+            dict: Mapping of (stock_name, date) to price details, empty for dates without a bar
+        """
+        results = {}
+        # Index the fetched rows by day ordinal once instead of formatting every requested date
+        rows_by_ordinal = {timestamp.toordinal(): position for position, timestamp in enumerate(batch_data.index)}
+        
+        # Process each requested date from the batch data
+        for date in dates:
+            try:
+                position = rows_by_ordinal.get(date.toordinal() - days_before)
+                if position is not None:
+                    row = batch_data.iloc[position]
+                    formatted_data = self._format_ohlcv_data(row, date, exchange_used)
+                    
+                    # Cache the result
+                    cache_key = self._get_cache_key(stock_name, date)
+                    self._price_cache[cache_key] = {
+                        'data': formatted_data,
+                        'timestamp': datetime.now()
+                    }
+                    
+                    results[(stock_name, date)] = formatted_data
+                    logger.debug(f"Found data for {stock_name} on {date}")
+                else:
+                    # Try to find the closest available date
+                    available_dates = batch_data.index.strftime('%Y-%m-%d').tolist()
+                    logger.warning(f"Date {date.strftime('%Y-%m-%d')} not found for {stock_name}. Available dates: {available_dates[:5]}...")
+                    results[(stock_name, date)] = []
+            except Exception as e:
+                logger.error(f"Error processing date {date} for {stock_name}: {e}")
+                results[(stock_name, date)] = []
+        return results
+    
+    def _fetch_stock_prices(self, stock_dates: List[Tuple[str, datetime]], days_before: int = 0,
+                            skip_resolved_to_none: bool = True) -> Dict[Tuple[str, datetime], List]:
+        """
+        Get price details missing from the in-memory cache, from the price store or the network
+        
+        An unresolved stock that every exchange answers without bars for, in every window, is
+        resolved to none and skipped until EXCHANGE_NEGATIVE_TTL has passed; failed calls and
+        windows with bars on any exchange keep it unresolved.
+        
+        Args:
+            stock_dates: List of (stock_name, date) tuples
+            days_before: Days between each date and the date of the bar returned for it
+            skip_resolved_to_none: Whether stocks no exchange had data for are skipped, and
+                resolved to none when they still have none
+            
+        Returns:
+            dict: Mapping of (stock_name, date) to price details, empty for dates without a bar
+        """
+        # The price store first, leaving only the dates never fetched for the network
+        results = self._get_stored_prices(stock_dates, days_before)
+        
+        # Group uncached requests by stock name to make true batch API calls
+        stock_groups = {}
+        for stock_name, date in stock_dates:
+            if (stock_name, date) not in results:
+                stock_groups.setdefault(stock_name, []).append(date)
+        
+        # Stocks no exchange had data for are skipped until their resolution expires
+        self._load_exchange_resolutions(stock_groups)
+        for stock_name in [stock_name for stock_name in stock_groups
+                           if not self._get_exchanges(stock_name, skip_resolved_to_none)]:
+            logger.debug(f"Skipping {stock_name}, which no exchange had data for")
+            for date in stock_groups.pop(stock_name):
+                results[(stock_name, date)] = []
+        if not stock_groups:
+            return results
+        
+        # Windows of nearby dates, shared by the stocks requesting the same days
+        windows = {}
+        for stock_name, dates in stock_groups.items():
+            for window, window_dates in self._cluster_dates(dates, days_before).items():
+                windows.setdefault(window, {})[stock_name] = window_dates
+        
+        # Unresolved stocks, until one of their windows has bars or fails
+        without_data = set()
+        if skip_resolved_to_none:
+            without_data = {stock_name for stock_name in stock_groups if self._exchange_resolutions.get(stock_name, (None,))[0] is None}
+        
+        # Dates are matched as each window of a stock arrives
+        for stock_name, dates, exchange_used, batch_data, succeeded in self._fetch_windows(windows):
+            if batch_data is not None or not succeeded:
+                without_data.discard(stock_name)
+            try:
                 if batch_data is not None:
-                    # Process each requested date from the batch data
-                    for date in dates:
-                        try:
-                            # Find the closest date in the batch data
-                            date_str = date.strftime('%Y-%m-%d')
-                            if date_str in batch_data.index:
-                                row = batch_data.loc[date_str]
-                                formatted_data = self._format_ohlcv_data(row, date, exchange_used)
-                                
-                                # Cache the result
-                                cache_key = self._get_cache_key(stock_name, date)
-                                self._price_cache[cache_key] = {
-                                    'data': formatted_data,
-                                    'timestamp': datetime.now()
-                                }
-                                
-                                results[(stock_name, date)] = formatted_data
-                                logger.debug(f"Found data for {stock_name} on {date_str}")
-                            else:
-                                # Try to find the closest available date
-                                available_dates = batch_data.index.strftime('%Y-%m-%d').tolist()
-                                logger.warning(f"Date {date_str} not found for {stock_name}. Available dates: {available_dates[:5]}...")
-                                results[(stock_name, date)] = []
-                        except Exception as e:
-                            logger.error(f"Error processing date {date} for {stock_name}: {e}")
-                            results[(stock_name, date)] = []
+                    results.update(self._match_dates(stock_name, dates, exchange_used, batch_data, days_before))
                 else:
                     logger.warning(f"No batch data found for {stock_name} in any exchange")
                     for date in dates:
@@ -246,6 +610,35 @@ class MarketDataHelper:
                 for date in dates:
                     results[(stock_name, date)] = []
         
+        for stock_name in without_data:
+            logger.warning(f"No exchange has data for {stock_name}, skipping it for {self.config.EXCHANGE_NEGATIVE_TTL}s")
+            self._resolve_exchange(stock_name, None)
+        return results
+    
+    def batch_get_stock_prices(self, stock_dates: List[Tuple[str, datetime]]) -> Dict[Tuple[str, datetime], List]:
+        """
+        Batch fetch stock prices for multiple stock-date combinations
+        
+        Args:
+            stock_dates: List of (stock_name, date) tuples
+            
+        Returns:
+            dict: Mapping of (stock_name, date) to price details
+        """
+        results = {}
+        uncached_requests = []
+        
+        # Check cache first
+        for stock_name, date in stock_dates:
+            cache_key = self._get_cache_key(stock_name, date)
+            if cache_key in self._price_cache and self._is_cache_valid(self._price_cache[cache_key]):
+                results[(stock_name, date)] = self._price_cache[cache_key]['data']
+                logger.debug(f"Cache hit for {stock_name} on {date}")
+            else:
+                uncached_requests.append((stock_name, date))
+        self._record_cache_lookups('price', len(stock_dates) - len(uncached_requests), len(uncached_requests))
+        
+        results.update(self._fetch_stock_prices(uncached_requests))
         return results
     
     def get_current_stock_price(self, stock_name):
@@ -263,10 +656,13 @@ class MarketDataHelper:
             cache_key = self._get_current_price_cache_key(stock_name)
             if cache_key in self._current_price_cache:
                 logger.debug(f"Current price cache hit for {stock_name}")
+                self._record_cache_lookups('current_price', 1, 0)
                 return self._current_price_cache[cache_key]
+            self._record_cache_lookups('current_price', 0, 1)
             
             # Use the stock price details function
-            pricing_details = self.get_stock_price_details(datetime.now(), stock_name)
+            # A held stock is always priced, even if an earlier range came back empty
+            pricing_details = self.get_stock_price_details(datetime.now(), stock_name, skip_resolved_to_none=False)
             
             # Return the closing price (index 5) from the pricing details
             current_price = 0.0
@@ -305,15 +701,50 @@ class MarketDataHelper:
                 logger.debug(f"Current price cache hit for {stock_name}")
             else:
                 uncached_stocks.append(stock_name)
+        self._record_cache_lookups('current_price', len(stock_names) - len(uncached_stocks), len(uncached_stocks))
+        if not uncached_stocks:
+            return results
         
-        # Fetch uncached prices
+        # Fetch uncached prices together, as get_current_stock_price would one at a time
+        now = datetime.now()
+        logger.info(f"Fetching current prices for {len(uncached_stocks)} stocks")
+        # A held stock is always priced, even if an earlier range came back empty
+        pricing_details = self._fetch_stock_prices([(stock_name, now) for stock_name in uncached_stocks], days_before=5,
+                                                   skip_resolved_to_none=False)
         for stock_name in uncached_stocks:
-            logger.info(f"Fetching current price for {stock_name}")
-            current_price = self.get_current_stock_price(stock_name)
+            details = pricing_details.get((stock_name, now), [])
+            
+            # Return the closing price (index 5) from the pricing details
+            current_price = 0.0
+            if len(details) >= 6 and details[5] is not None:
+                current_price = float(details[5])
+            else:
+                logger.warning(f"Could not get current price for {stock_name}")
+            
+            # Cache the result
+            self._current_price_cache[self._get_current_price_cache_key(stock_name)] = current_price
             results[stock_name] = current_price
         
         return results
     
+    def count_cached(self, stock_names: List[str], stock_dates: List[Tuple[str, datetime]]) -> int:
+        """
+        Count the current prices and daily prices that are already cached
+        
+        Args:
+            stock_names: Stocks whose current price is needed
+            stock_dates: (stock_name, date) tuples whose daily price is needed
+            
+        Returns:
+            int: Number of requests the caches can answer
+        """
+        cached_current = sum(self._get_current_price_cache_key(name) in self._current_price_cache for name in stock_names)
+        cached_daily = 0
+        for stock_name, date in stock_dates:
+            cache_entry = self._price_cache.get(self._get_cache_key(stock_name, date))
+            cached_daily += cache_entry is not None and self._is_cache_valid(cache_entry)
+        return cached_current + cached_daily
+    
     def clear_cache(self):
         """Clear all cached data"""
         self._price_cache.clear()
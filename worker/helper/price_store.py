@@ -0,0 +1,220 @@
+import os
+import sqlite3
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Tuple
+from config.config import Config
+from config.logging_config import setup_logging
+
+logger = setup_logging(__name__)
+
+# A stored daily bar: exchange name, open, high, low, close and volume
+Bar = Tuple[str, float, float, float, float, int]
+
+class PriceStore:
+    """
+    Daily OHLCV bars kept in a SQLite file, keyed by (symbol, exchange, date)
+
+    Bars of past days never change, so they are stored once and never expire. Every worker
+    process using the same directory shares them, across restarts and replicas. The store
+    also keeps the exchange each symbol resolved to, or that it resolved to none.
+
+    Bars are stored unadjusted for dividends, with the Adj Close / Close factor and the day
+    they were fetched. Yahoo Finance still rebases past prices after a split, so when newly
+    fetched bars disagree with stored ones, the stored bars of the symbol are dropped and
+    fetched again on the new basis.
+    """
+
+    FILE_NAME = 'prices.sqlite3'
+    # Bound parameters per IN query, under the limit of older SQLite builds
+    MAX_QUERY_PARAMETERS = 500
+    # Relative close difference beyond which a stored bar is on an older price basis
+    REBASE_TOLERANCE = 1e-4
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or Config.PRICE_STORE_DIRECTORY
+        self.path = os.path.join(self.directory, self.FILE_NAME)
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection, creating the store on first use; connections are not shared across threads"""
+        if not self._initialized:
+            os.makedirs(self.directory, exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=30)
+        if not self._initialized:
+            # WAL lets readers in other processes carry on while one of them writes
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS daily_bars (
+                    symbol TEXT NOT NULL,
+                    exchange TEXT NOT NULL,
+                    date INTEGER NOT NULL,
+                    open REAL NOT NULL,
+                    high REAL NOT NULL,
+                    low REAL NOT NULL,
+                    close REAL NOT NULL,
+                    volume INTEGER NOT NULL,
+                    adjustment_factor REAL NOT NULL,
+                    fetched_on INTEGER NOT NULL,
+                    PRIMARY KEY (symbol, exchange, date)
+                ) WITHOUT ROWID
+            """)
+            # A NULL exchange records that no exchange had data for the symbol
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS exchange_resolutions (
+                    symbol TEXT PRIMARY KEY,
+                    exchange TEXT,
+                    resolved_at REAL NOT NULL
+                )
+            """)
+            connection.commit()
+            self._initialized = True
+        return connection
+
+    def get_bars(self, symbol_dates: Dict[str, Iterable[int]], exchanges: List[str]) -> Dict[str, Dict[int, Bar]]:
+        """
+        Get the stored bars of several symbols
+
+        Args:
+            symbol_dates: Day ordinals to read, by symbol
+            exchanges: Exchange names in priority order; a day stored for several exchanges
+                returns the bar of the first of them
+
+        Returns:
+            dict: Bars by day ordinal, by symbol; empty if the store cannot be read
+        """
+        priority = {exchange: position for position, exchange in enumerate(exchanges)}
+        bars: Dict[str, Dict[int, Bar]] = {}
+        try:
+            connection = self._connect()
+            try:
+                for symbol, ordinals in symbol_dates.items():
+                    ordinals = sorted(set(ordinals))
+                    rows = []
+                    for start in range(0, len(ordinals), self.MAX_QUERY_PARAMETERS):
+                        chunk = ordinals[start:start + self.MAX_QUERY_PARAMETERS]
+                        rows.extend(connection.execute(
+                            'SELECT date, exchange, open, high, low, close, volume FROM daily_bars '
+                            f'WHERE symbol = ? AND date IN ({", ".join("?" * len(chunk))})',
+                            (symbol, *chunk)
+                        ).fetchall())
+                    symbol_bars = bars.setdefault(symbol, {})
+                    for ordinal, *bar in sorted(rows, key=lambda row: (row[0], priority.get(row[1], len(priority)))):
+                        if ordinal not in symbol_bars and bar[0] in priority:
+                            symbol_bars[ordinal] = tuple(bar)
+            finally:
+                connection.close()
+        except Exception as e:
+            # Unreadable bars are fetched from the network instead
+            logger.warning(f"Failed to read the price store {self.path}: {e}")
+        return bars
+
+    def put_bars(self, symbol: str, exchange: str, history) -> None:
+        """
+        Store the bars of past days from an unadjusted yfinance history frame
+
+        Args:
+            symbol: Stock symbol without exchange suffix
+            exchange: Exchange name of the history
+            history: Daily bars indexed by timestamp, with Open, High, Low, Close and Volume
+                columns and optionally Adj Close
+        """
+        today = date.today().toordinal()
+        adjusted_close = history['Adj Close'] if 'Adj Close' in history else history['Close']
+        rows = [
+            (symbol, exchange, timestamp.toordinal(), float(open_), float(high), float(low), float(close), int(volume),
+             float(adjusted) / float(close) if close else 1.0, today)
+            for timestamp, open_, high, low, close, volume, adjusted in zip(
+                history.index, history['Open'], history['High'], history['Low'], history['Close'], history['Volume'],
+                adjusted_close
+            )
+            # Today's bar can still change
+            if timestamp.toordinal() < today
+        ]
+        if not rows:
+            return
+        try:
+            connection = self._connect()
+            try:
+                with connection:
+                    if self._is_rebased(connection, rows):
+                        logger.info(f"Prices of {symbol} on {exchange} were rebased, dropping its stored bars")
+                        connection.execute('DELETE FROM daily_bars WHERE symbol = ? AND exchange = ?', (symbol, exchange))
+                    connection.executemany('INSERT OR IGNORE INTO daily_bars VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            finally:
+                connection.close()
+        except Exception as e:
+            # The bars are fetched again next time
+            logger.warning(f"Failed to write {len(rows)} bars of {symbol} to the price store {self.path}: {e}")
+
+    def _is_rebased(self, connection: sqlite3.Connection, rows: List[Tuple]) -> bool:
+        """Check whether stored bars of the same days close at other prices than the new rows"""
+        symbol, exchange = rows[0][0], rows[0][1]
+        closes = {row[2]: row[6] for row in rows}
+        ordinals = list(closes)
+        for start in range(0, len(ordinals), self.MAX_QUERY_PARAMETERS):
+            chunk = ordinals[start:start + self.MAX_QUERY_PARAMETERS]
+            stored = connection.execute(
+                'SELECT date, close FROM daily_bars '
+                f'WHERE symbol = ? AND exchange = ? AND date IN ({", ".join("?" * len(chunk))})',
+                (symbol, exchange, *chunk)
+            ).fetchall()
+            if any(abs(close - closes[ordinal]) > self.REBASE_TOLERANCE * max(abs(close), 1e-9) for ordinal, close in stored):
+                return True
+        return False
+
+    def get_resolutions(self, symbols: Iterable[str]) -> Dict[str, Tuple[Optional[str], float]]:
+        """
+        Get the stored exchange resolutions of symbols
+
+        Args:
+            symbols: Stock symbols without exchange suffix
+
+        Returns:
+            dict: (exchange name or None, resolution time as a Unix timestamp) by symbol, for
+                the symbols resolved before; empty if the store cannot be read
+        """
+        symbols = sorted(set(symbols))
+        resolutions = {}
+        try:
+            connection = self._connect()
+            try:
+                for start in range(0, len(symbols), self.MAX_QUERY_PARAMETERS):
+                    chunk = symbols[start:start + self.MAX_QUERY_PARAMETERS]
+                    rows = connection.execute(
+                        'SELECT symbol, exchange, resolved_at FROM exchange_resolutions '
+                        f'WHERE symbol IN ({", ".join("?" * len(chunk))})',
+                        chunk
+                    ).fetchall()
+                    resolutions.update({symbol: (exchange, resolved_at) for symbol, exchange, resolved_at in rows})
+            finally:
+                connection.close()
+        except Exception as e:
+            # Unresolved symbols try every exchange instead
+            logger.warning(f"Failed to read exchange resolutions from the price store {self.path}: {e}")
+        return resolutions
+
+    def put_resolution(self, symbol: str, exchange: Optional[str], resolved_at: float) -> None:
+        """
+        Store the exchange a symbol resolved to, replacing its earlier resolution unless that
+        is an exchange and the new one is None
+
+        Args:
+            symbol: Stock symbol without exchange suffix
+            exchange: Exchange name, or None if no exchange had data for the symbol
+            resolved_at: Resolution time as a Unix timestamp
+        """
+        try:
+            connection = self._connect()
+            try:
+                with connection:
+                    # Another process may have found the symbol on an exchange meanwhile
+                    connection.execute(
+                        'INSERT OR REPLACE INTO exchange_resolutions SELECT ?, ?, ? WHERE ? IS NOT NULL OR NOT EXISTS '
+                        '(SELECT 1 FROM exchange_resolutions WHERE symbol = ? AND exchange IS NOT NULL)',
+                        (symbol, exchange, resolved_at, exchange, symbol)
+                    )
+            finally:
+                connection.close()
+        except Exception as e:
+            # The symbol is resolved again next time
+            logger.warning(f"Failed to store the exchange resolution of {symbol} in the price store {self.path}: {e}")
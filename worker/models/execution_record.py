@@ -91,6 +91,11 @@ class ExecutionRecord(Base):
         self.processing_duration = duration
         self.rows_processed = rows_processed
     
+    def record_resource_usage(self, memory_usage=None, cpu_usage=None):
+        """Record the peak memory (MB) and CPU usage (percentage of the run's wall-clock time)"""
+        self.memory_usage = memory_usage
+        self.cpu_usage = cpu_usage
+    
     def mark_failed(self, error_message=None):
         """Mark execution as failed"""
         self.status = 'failed'
@@ -0,0 +1,49 @@
+from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey, Index
+from sqlalchemy.sql import func
+from database import Base
+
+class ExecutionStageTiming(Base):
+    """Model for storing the time an execution spent in each of its stages"""
+    __tablename__ = 'execution_stage_timings'
+
+    # Primary key
+    id = Column(Integer, primary_key=True, autoincrement=True)
+
+    # Execution the stage belongs to; a retried execution records every attempt
+    execution_record_id = Column(Integer, ForeignKey('execution_records.id', ondelete='CASCADE'), nullable=False)
+    attempt = Column(Integer, nullable=False, default=0)
+
+    # Stage name, dotted by phase, e.g. read.auth or write.Taxation.format
+    stage = Column(String(200), nullable=False)
+    wall_seconds = Column(Float, nullable=False)
+    cpu_seconds = Column(Float)
+    calls = Column(Integer, nullable=False, default=1)
+
+    # Market data cache lookups, for stages that fetch market data
+    cache_hits = Column(Integer)
+    cache_misses = Column(Integer)
+
+    # Metadata fields
+    created_at = Column(DateTime, default=func.now())
+
+    __table_args__ = (
+        Index('ix_execution_stage_timings_record_stage', 'execution_record_id', 'stage'),
+    )
+
+    def __repr__(self):
+        return f'<ExecutionStageTiming {self.execution_record_id} - {self.stage} - {self.wall_seconds}>'
+
+    def to_dict(self):
+        """Convert stage timing to dictionary"""
+        return {
+            'id': self.id,
+            'execution_record_id': self.execution_record_id,
+            'attempt': self.attempt,
+            'stage': self.stage,
+            'wall_seconds': self.wall_seconds,
+            'cpu_seconds': self.cpu_seconds,
+            'calls': self.calls,
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
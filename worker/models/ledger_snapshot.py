@@ -0,0 +1,69 @@
+from sqlalchemy import Column, Integer, String, DateTime, Date, Float, Index
+from sqlalchemy.sql import func
+from database import Base
+
+class LedgerOpenLot(Base):
+    """Model for storing the open lots of a spreadsheet as of its last processed row"""
+    __tablename__ = 'ledger_open_lots'
+
+    # Primary key
+    id = Column(Integer, primary_key=True, autoincrement=True)
+
+    # Lot identity, in FIFO order per symbol
+    spreadsheet_id = Column(String(100), nullable=False)
+    symbol = Column(String(50), nullable=False)
+    lot_sequence = Column(Integer, nullable=False)
+
+    # Remaining quantity, with amounts scaled to it; negative for sells not matched to a buy yet
+    trade_date = Column(Date, nullable=False)
+    financial_year = Column(Integer, nullable=False)  # starting year, e.g. 2024 for FY 2024-25
+    quantity = Column(Float, nullable=False)
+    final_amount = Column(Float, nullable=False)
+    net_amount = Column(Float, nullable=False)
+
+    # Metadata fields
+    created_at = Column(DateTime, default=func.now())
+
+    __table_args__ = (
+        Index('ix_ledger_open_lots_spreadsheet_symbol', 'spreadsheet_id', 'symbol', 'lot_sequence'),
+    )
+
+    def __repr__(self):
+        return f'<LedgerOpenLot {self.spreadsheet_id} - {self.symbol} - {self.quantity}>'
+
+class LedgerSymbolSnapshot(Base):
+    """Model for storing the running totals of a symbol as of the last processed row of a spreadsheet"""
+    __tablename__ = 'ledger_symbol_snapshots'
+
+    # Primary key
+    id = Column(Integer, primary_key=True, autoincrement=True)
+
+    # Snapshot identity
+    spreadsheet_id = Column(String(100), nullable=False)
+    symbol = Column(String(50), nullable=False)
+    as_of_date = Column(Date, nullable=False)
+    rows_processed = Column(Integer, nullable=False)
+
+    # Traded totals; sell quantities are negative as in the transactions
+    buy_amount = Column(Float, nullable=False)
+    buy_quantity = Column(Float, nullable=False)
+    sell_amount = Column(Float, nullable=False)
+    sell_quantity = Column(Float, nullable=False)
+    sold_cost = Column(Float, nullable=False)
+    sold_quantity = Column(Float, nullable=False)
+    open_quantity = Column(Float, nullable=False)
+
+    # Realized gains over all financial years
+    ltcg = Column(Float, nullable=False)
+    stcg = Column(Float, nullable=False)
+    intraday_income = Column(Float, nullable=False)
+
+    # Metadata fields
+    created_at = Column(DateTime, default=func.now())
+
+    __table_args__ = (
+        Index('ix_ledger_symbol_snapshots_spreadsheet_symbol', 'spreadsheet_id', 'symbol', unique=True),
+    )
+
+    def __repr__(self):
+        return f'<LedgerSymbolSnapshot {self.spreadsheet_id} - {self.symbol} - {self.as_of_date}>'
@@ -9,6 +9,8 @@ from typing import Any, Dict, List, Optional
 from sqlalchemy.orm import Session
 from database import get_db
 from models.execution_record import ExecutionRecord
+from models.execution_stage_timing import ExecutionStageTiming
+from utils.execution_metrics import StageTiming
 
 # Setup logging
 from config.logging_config import setup_logging
@@ -286,4 +288,62 @@ class ExecutionRecordService:
             logger.error(f"Failed to get execution statistics: {e}")
             return {}
         finally:
-            db.close() 
\ No newline at end of file
+            db.close() 
+    
+    def save_stage_timings(self, execution_record: ExecutionRecord, stages: Dict[str, StageTiming]):
+        """
+        Save the stage timings of an execution attempt in one bulk insert
+        
+        Args:
+            execution_record: Execution record the stages ran for
+            stages: Stage timings by stage name
+        """
+        if execution_record is None or not stages:
+            return
+        
+        db = next(get_db())
+        try:
+            db.bulk_insert_mappings(ExecutionStageTiming, [
+                {
+                    'execution_record_id': execution_record.id,
+                    'attempt': execution_record.retry_count or 0,
+                    'stage': name,
+                    'wall_seconds': timing.wall_seconds,
+                    'cpu_seconds': timing.cpu_seconds,
+                    'calls': timing.calls,
+                    'cache_hits': timing.cache_hits,
+                    'cache_misses': timing.cache_misses
+                }
+                for name, timing in stages.items()
+            ])
+            db.commit()
+            logger.info(f"Saved {len(stages)} stage timings for execution record {execution_record.id}")
+            
+        except Exception as e:
+            # Timings are diagnostics; losing them must not fail the execution
+            logger.error(f"Failed to save stage timings for execution record {execution_record.id}: {e}")
+            db.rollback()
+        finally:
+            db.close()
+    
+    def load_stage_timings(self, execution_record_id: int) -> List[ExecutionStageTiming]:
+        """
+        Load the stage timings of an execution record
+        
+        Args:
+            execution_record_id: Primary key of the execution record
+            
+        Returns:
+            List[ExecutionStageTiming]: Stage timings of every attempt, in the order they were recorded
+        """
+        db = next(get_db())
+        try:
+            return db.query(ExecutionStageTiming).filter_by(execution_record_id=execution_record_id).order_by(
+                ExecutionStageTiming.id
+            ).all()
+            
+        except Exception as e:
+            logger.error(f"Failed to load stage timings for execution record {execution_record_id}: {e}")
+            return []
+        finally:
+            db.close()
@@ -0,0 +1,68 @@
+"""
+Ledger Checkpoint Service - Stores the ledger checkpoints of incremental processing
+"""
+
+import hashlib
+import os
+import pickle
+from typing import Optional
+from config.config import Config
+from utils.ledger_checkpoint import LedgerCheckpoint
+
+# Setup logging
+from config.logging_config import setup_logging
+logger = setup_logging(__name__)
+
+class LedgerCheckpointService:
+    """Service for saving and loading ledger checkpoints as files, one per spreadsheet"""
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or Config.CHECKPOINT_DIRECTORY
+
+    def _get_checkpoint_path(self, spreadsheet_id: str) -> str:
+        """Get the checkpoint file of a spreadsheet, named by a hash since IDs may be paths"""
+        file_name = hashlib.sha256(spreadsheet_id.encode()).hexdigest()
+        return os.path.join(self.directory, f"{file_name}.pkl")
+
+    def load_checkpoint(self, spreadsheet_id: str) -> Optional[LedgerCheckpoint]:
+        """
+        Load the checkpoint of a spreadsheet
+
+        Args:
+            spreadsheet_id: ID of the spreadsheet
+
+        Returns:
+            LedgerCheckpoint: The checkpoint, or None if there is none or it cannot be read
+        """
+        path = self._get_checkpoint_path(spreadsheet_id)
+        if not os.path.exists(path):
+            logger.info(f"No ledger checkpoint found for {spreadsheet_id}")
+            return None
+        try:
+            with open(path, 'rb') as checkpoint_file:
+                checkpoint = pickle.load(checkpoint_file)
+            logger.info(f"Loaded ledger checkpoint for {spreadsheet_id} after {checkpoint.raw_row_count} rows")
+            return checkpoint
+        except Exception as e:
+            # A full run rebuilds the checkpoint
+            logger.warning(f"Failed to load ledger checkpoint for {spreadsheet_id}: {e}")
+            return None
+
+    def save_checkpoint(self, spreadsheet_id: str, checkpoint: LedgerCheckpoint) -> None:
+        """
+        Save the checkpoint of a spreadsheet, replacing the previous one atomically
+
+        Args:
+            spreadsheet_id: ID of the spreadsheet
+            checkpoint: Checkpoint to save
+        """
+        path = self._get_checkpoint_path(spreadsheet_id)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(f"{path}.tmp", 'wb') as checkpoint_file:
+                pickle.dump(checkpoint, checkpoint_file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(f"{path}.tmp", path)
+            logger.info(f"Saved ledger checkpoint for {spreadsheet_id} after {checkpoint.raw_row_count} rows")
+        except Exception as e:
+            # The next run falls back to full processing
+            logger.error(f"Failed to save ledger checkpoint for {spreadsheet_id}: {e}")
@@ -0,0 +1,144 @@
+"""
+Ledger Snapshot Service - Stores the open lots and running totals of every symbol in the database
+"""
+
+from datetime import date
+import pandas as pd
+from sqlalchemy import insert
+from stock_portfolio_shared.constants.taxation_constants import Taxation_constants
+from database import get_db
+from models.ledger_snapshot import LedgerOpenLot, LedgerSymbolSnapshot
+from utils.ledger_checkpoint import LedgerCheckpoint
+
+# Setup logging
+from config.logging_config import setup_logging
+logger = setup_logging(__name__)
+
+# Symbol snapshot column of every checkpoint symbol state column
+SYMBOL_STATE_COLUMNS = {
+    'buy_amount': 'buy_amount',
+    'buy_quantity': 'buy_quantity',
+    'sell_amount': 'sell_amount',
+    'sell_quantity': 'sell_quantity',
+    'sold_cost': 'sold_cost',
+    'sold_quantity': 'sold_quantity',
+    'open_quantity': 'open_quantity',
+    Taxation_constants.LTCG: 'ltcg',
+    Taxation_constants.STCG: 'stcg',
+    Taxation_constants.INTRADAY_INCOME: 'intraday_income'
+}
+
+class LedgerSnapshotService:
+    """Service for replacing and reading the ledger snapshot of a spreadsheet"""
+
+    def __init__(self):
+        pass
+
+    def save_snapshot(self, spreadsheet_id: str, checkpoint: LedgerCheckpoint) -> None:
+        """
+        Replace the snapshot of a spreadsheet with the state of a checkpoint, in one transaction
+
+        Args:
+            spreadsheet_id: ID of the spreadsheet
+            checkpoint: Checkpoint after the last processed row
+        """
+        as_of_date = date.fromordinal(checkpoint.last_date_ordinal) if checkpoint.last_date_ordinal else date.today()
+        open_lots = checkpoint.open_lots
+        lot_rows = [
+            {
+                'spreadsheet_id': spreadsheet_id,
+                'symbol': name,
+                'lot_sequence': sequence,
+                'trade_date': date.fromordinal(int(ordinal)),
+                'financial_year': int(fy_code),
+                'quantity': float(quantity),
+                'final_amount': float(final_amount),
+                'net_amount': float(net_amount)
+            }
+            for name, sequence, ordinal, fy_code, quantity, final_amount, net_amount in zip(
+                open_lots['name'], open_lots.groupby('name').cumcount(), open_lots['date_ordinal'],
+                open_lots['fy_code'], open_lots['quantity'], open_lots['final_amount'], open_lots['net_amount']
+            )
+        ]
+        symbol_state = checkpoint.symbol_state()[list(SYMBOL_STATE_COLUMNS)].rename(columns=SYMBOL_STATE_COLUMNS)
+        symbol_rows = [
+            {
+                'spreadsheet_id': spreadsheet_id,
+                'symbol': name,
+                'as_of_date': as_of_date,
+                'rows_processed': checkpoint.raw_row_count,
+                **{column: float(value) for column, value in state.items()}
+            }
+            for name, state in symbol_state.iterrows()
+        ]
+
+        db = next(get_db())
+        try:
+            db.query(LedgerOpenLot).filter_by(spreadsheet_id=spreadsheet_id).delete(synchronize_session=False)
+            db.query(LedgerSymbolSnapshot).filter_by(spreadsheet_id=spreadsheet_id).delete(synchronize_session=False)
+            if lot_rows:
+                db.execute(insert(LedgerOpenLot), lot_rows)
+            if symbol_rows:
+                db.execute(insert(LedgerSymbolSnapshot), symbol_rows)
+            db.commit()
+            logger.info(f"Saved ledger snapshot for {spreadsheet_id}: {len(symbol_rows)} symbols, {len(lot_rows)} open lots")
+        except Exception as e:
+            # The sheets are already written, so the run still succeeds without a snapshot
+            logger.error(f"Failed to save ledger snapshot for {spreadsheet_id}: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+    def load_open_lots(self, spreadsheet_id: str) -> pd.DataFrame:
+        """
+        Load the open lots of a spreadsheet in FIFO order per symbol
+
+        Args:
+            spreadsheet_id: ID of the spreadsheet
+
+        Returns:
+            pd.DataFrame: Open lots in the layout of PortfolioLedger.open_lots, usable as carried lots
+        """
+        db = next(get_db())
+        try:
+            lots = db.query(LedgerOpenLot).filter_by(spreadsheet_id=spreadsheet_id).order_by(
+                LedgerOpenLot.symbol, LedgerOpenLot.lot_sequence
+            ).all()
+            return pd.DataFrame({
+                'name': [lot.symbol for lot in lots],
+                'date_ordinal': pd.array([lot.trade_date.toordinal() for lot in lots], dtype='int32'),
+                'fy_code': pd.array([lot.financial_year for lot in lots], dtype='int32'),
+                'quantity': [lot.quantity for lot in lots],
+                'final_amount': [lot.final_amount for lot in lots],
+                'net_amount': [lot.net_amount for lot in lots]
+            }).astype({'quantity': float, 'final_amount': float, 'net_amount': float})
+        except Exception as e:
+            logger.error(f"Failed to load open lots for {spreadsheet_id}: {e}")
+            raise
+        finally:
+            db.close()
+
+    def load_holdings(self, spreadsheet_id: str) -> pd.DataFrame:
+        """
+        Load the running totals of every symbol of a spreadsheet
+
+        Args:
+            spreadsheet_id: ID of the spreadsheet
+
+        Returns:
+            pd.DataFrame: One row per symbol with its open quantity, traded totals and realized gains
+        """
+        db = next(get_db())
+        try:
+            snapshots = db.query(LedgerSymbolSnapshot).filter_by(spreadsheet_id=spreadsheet_id).order_by(
+                LedgerSymbolSnapshot.symbol
+            ).all()
+            columns = [column.name for column in LedgerSymbolSnapshot.__table__.columns
+                       if column.name not in ('id', 'spreadsheet_id', 'created_at')]
+            return pd.DataFrame([{column: getattr(snapshot, column) for column in columns} for snapshot in snapshots],
+                                columns=columns)
+        except Exception as e:
+            logger.error(f"Failed to load holdings for {spreadsheet_id}: {e}")
+            raise
+        finally:
+            db.close()
@@ -5,8 +5,8 @@ Trading Service - Scalable function-based approach for processing trading data
 import pandas as pd
 import os
 from datetime import datetime
-from typing import Dict, List, Tuple, Callable
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple, Callable
+from concurrent.futures import Executor, ProcessPoolExecutor, as_completed
 import asyncio
 
 from stock_portfolio_shared.models.depository_participant import DepositoryParticipant
@@ -21,6 +21,16 @@ logger = setup_logging(__name__)
 from config.config import Config
 from services.data_processing_service import DataProcessingService
 from services.execution_record_service import ExecutionRecordService
+from services.ledger_checkpoint_service import LedgerCheckpointService
+from services.ledger_snapshot_service import LedgerSnapshotService
+from utils.date_utils import drop_internal_columns
+from utils.process_pool import pack_ledger, unpack_frame, run_stage
+from utils.executors import InstrumentedThreadPoolExecutor
+from utils.execution_metrics import ExecutionMetrics, run_timed
+from utils.ledger_checkpoint import LedgerCheckpoint, digest_row_hashes, get_row_hashes
+from utils.portfolio_ledger import PortfolioLedger, format_capital_gains
+from utils.sharding import SHARDABLE_STAGES, merge_shard_results, partition_by_symbol
+from utils.worker_metrics import registry
 
 # Import models and database
 from models.execution_record import ExecutionRecord
@@ -28,23 +38,30 @@ from models.execution_record import ExecutionRecord
 class TradingOrchestrator:
     """Scalable trading service for processing spreadsheet data"""
     
-    def __init__(self, manager: BaseManager, executor: ThreadPoolExecutor = None):
+    def __init__(self, manager: BaseManager, io_executor: Executor = None, cpu_executor: Executor = None):
         # Initialize configuration and services
         self.config = Config()
         self.data_processing_service = DataProcessingService()
         self.execution_record_service = ExecutionRecordService()
+        self.checkpoint_service = LedgerCheckpointService()
+        self.ledger_snapshot_service = LedgerSnapshotService()
         
         # Use provided manager
         self.manager = manager
         
-        # Use provided executor or create a default one
-        self.executor = executor or ThreadPoolExecutor(max_workers=4)
+        # Use provided executors or create default ones. Spreadsheet tasks run on the I/O pool and
+        # only ever wait on the CPU pool, so a batch can never fill a pool with tasks waiting on itself
+        self.io_executor = io_executor or InstrumentedThreadPoolExecutor('io', self.config.IO_POOL_SIZE)
+        self.cpu_executor = cpu_executor or InstrumentedThreadPoolExecutor('cpu', self.config.CPU_POOL_SIZE)
+        
+        # A process pool CPU tier gets the portfolio ledger serialized instead of shared
+        self.uses_process_pool = isinstance(self.cpu_executor, ProcessPoolExecutor)
         
         # Environment setup
         self.worker_directory = os.path.dirname(os.path.dirname(__file__))
         self.env_file = os.path.join(self.worker_directory, 'secrets', '.env')
         
-        logger.info(f"TradingOrchestrator initialized with shared executor")
+        logger.info(f"TradingOrchestrator initialized with shared I/O and CPU executors")
     
     async def process_spreadsheet(self, spreadsheet_task: SpreadsheetTask, max_retries: int = 0) -> bool:
         """
@@ -64,12 +81,13 @@ class TradingOrchestrator:
                 # Run the processing in a thread pool
                 loop = asyncio.get_event_loop()
                 result, execution_record = await loop.run_in_executor(
-                    self.executor,
+                    self.io_executor,
                     self._process_spreadsheet_sync,
                     spreadsheet_task,
                     attempt,
                     execution_record_id
                 )
+                registry.inc('worker_tasks_total', status='completed' if result else 'failed')
                 if result:
                     logger.info(f"Completed processing for {spreadsheet_task.spreadsheet_id}: {result}")
                     return True
@@ -81,6 +99,7 @@ class TradingOrchestrator:
                         logger.warning(f"No valid execution record ID for retry on {spreadsheet_task.spreadsheet_id}")
                         return False
                     
+                    registry.inc('worker_task_retries_total')
                     delay = 2 ** attempt  # Exponential backoff
                     logger.warning(f"Attempt {attempt + 1} failed, retrying record {execution_record_id} in {delay}s...")
                     await asyncio.sleep(delay)
@@ -88,6 +107,7 @@ class TradingOrchestrator:
                     return False
             
             except Exception as e:
+                registry.inc('worker_tasks_total', status='failed')
                 logger.error(f"Exception in async processing for {spreadsheet_task.spreadsheet_id}: {e}")
                 return False
             
@@ -106,6 +126,8 @@ class TradingOrchestrator:
         """
         start_time = datetime.now()
         execution_record = None
+        metrics = ExecutionMetrics()
+        registry.inc('worker_tasks_in_flight')
         
         try:
             # Load specific execution record if retrying
@@ -138,44 +160,60 @@ class TradingOrchestrator:
                     return False, None
             
             # Get spreadsheet data first
-            spreadsheet, sheet_names, raw_data = self._get_spreadsheet_data(spreadsheet_task)
+            with metrics.stage('read'):
+                spreadsheet, sheet_names, raw_data = self._get_spreadsheet_data(spreadsheet_task, metrics)
             
             # Update execution record with data hash
-            if execution_record:
-                self.execution_record_service.update_execution_record_data_hash(execution_record, raw_data)
+            with metrics.stage('change_detection'):
+                if execution_record:
+                    self.execution_record_service.update_execution_record_data_hash(execution_record, raw_data)
+                data_changed = raw_data.empty or self.execution_record_service.data_has_changed(spreadsheet_task.spreadsheet_id, raw_data)
             
             if raw_data.empty:
                 logger.warning(f"No data found in spreadsheet {spreadsheet_task.spreadsheet_id}")
                 if execution_record:
                     execution_record.mark_failed("No data found in spreadsheet")
+                    self._record_metrics(execution_record, metrics)
                     self.execution_record_service.save_execution_record(execution_record)
                 return False, execution_record
             
             # Check if data has changed
-            if not self.execution_record_service.data_has_changed(spreadsheet_task.spreadsheet_id, raw_data):
+            if not data_changed:
                 logger.info(f"Data unchanged for {spreadsheet_task.spreadsheet_id}, skipping processing")
                 if execution_record:
                     execution_record.mark_completed(0, 0)
+                    self._record_metrics(execution_record, metrics)
                     self.execution_record_service.save_execution_record(execution_record)
                 return True, execution_record
             
-            # Process data in parallel
-            results = self._process_data_parallel(sheet_names, raw_data, spreadsheet_task.get_participant_name())
+            # Process data in parallel, or only the appended rows when the checkpoint allows it
+            with metrics.stage('process'):
+                results, checkpoint = self._process_data(sheet_names, raw_data, spreadsheet_task, metrics)
             
             # Update spreadsheet with results
-            formatting_funcs = self.manager.get_formatting_funcs(sheet_names)
-            self._update_spreadsheet(spreadsheet, results, formatting_funcs)
+            with metrics.stage('write'):
+                formatting_funcs = self.manager.get_formatting_funcs(sheet_names)
+                self._update_spreadsheet(spreadsheet, results, formatting_funcs, metrics)
+            with metrics.stage('save_state'):
+                if checkpoint and self.config.INCREMENTAL_PROCESSING:
+                    self.checkpoint_service.save_checkpoint(spreadsheet_task.spreadsheet_id, checkpoint)
+                if checkpoint and self.config.LEDGER_SNAPSHOTS:
+                    self.ledger_snapshot_service.save_snapshot(spreadsheet_task.spreadsheet_id, checkpoint)
             
             # Calculate processing duration and rows processed
             processing_duration = (datetime.now() - start_time).total_seconds()
             total_rows = sum(len(df) for df in results.values() if isinstance(df, pd.DataFrame))
             
+            memory_usage, cpu_usage = self._record_metrics(execution_record, metrics)
+            
             # Mark execution as completed
             if execution_record:
                 execution_record.mark_completed(processing_duration, total_rows)
                 self.execution_record_service.save_execution_record(execution_record)
             
-            logger.info(f"Successfully processed spreadsheet {spreadsheet_task.spreadsheet_id}")
+            phases = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in metrics.phase_seconds.items())
+            logger.info(f"Successfully processed spreadsheet {spreadsheet_task.spreadsheet_id} in {processing_duration:.2f}s "
+                        f"({phases}), memory {memory_usage:.1f} MB, CPU {cpu_usage:.0f}%")
             return True, execution_record
             
         except Exception as e:
@@ -183,18 +221,46 @@ class TradingOrchestrator:
             if execution_record:
                 try:
                     execution_record.mark_failed(str(e))
+                    self._record_metrics(execution_record, metrics)
                     self.execution_record_service.save_execution_record(execution_record)
                 except Exception as save_error:
                     logger.error(f"Failed to save failed execution record: {save_error}")
             return False, execution_record
+        finally:
+            registry.inc('worker_tasks_in_flight', -1)
+    
+    def _record_metrics(self, execution_record: Optional[ExecutionRecord], metrics: ExecutionMetrics) -> Tuple[float, float]:
+        """
+        Stop measuring the task, record its resource usage, save its stage timings and
+        export them to the worker metrics
+        
+        Args:
+            execution_record: Execution record of the task, if one was created
+            metrics: Metrics of the task
+            
+        Returns:
+            tuple: (memory usage in MB, CPU usage in percent)
+        """
+        memory_usage, cpu_usage = metrics.finish()
+        manager_name = type(self.manager).__name__
+        registry.observe('worker_task_duration_seconds', metrics.wall_seconds, manager=manager_name)
+        for name, timing in metrics.stages.items():
+            registry.observe('worker_stage_duration_seconds', timing.wall_seconds, manager=manager_name, stage=name)
+        if execution_record:
+            execution_record.record_resource_usage(memory_usage, cpu_usage)
+            self.execution_record_service.save_stage_timings(execution_record, metrics.stages)
+        return memory_usage, cpu_usage
     
-    def _get_spreadsheet_data(self, spreadsheet_task: SpreadsheetTask) -> Tuple:
+    def _get_spreadsheet_data(self, spreadsheet_task: SpreadsheetTask, metrics: ExecutionMetrics) -> Tuple:
         """Get data from spreadsheet using the provided manager and SpreadsheetTask"""
         try:
             # Use manager for Google Sheets or Excel based on SpreadsheetTask
-            spreadsheet = self.manager.get_spreadsheet(spreadsheet_task)
-            sheet_names = self.manager.get_sheet_names(spreadsheet_task)
-            raw_data = self.manager.read_data(spreadsheet, sheet_names[0])
+            with metrics.stage('read.auth'):
+                spreadsheet = self.manager.get_spreadsheet(spreadsheet_task)
+            with metrics.stage('read.sheet_names'):
+                sheet_names = self.manager.get_sheet_names(spreadsheet_task)
+            with metrics.stage(f"read.{sheet_names[0]}"):
+                raw_data = self.manager.read_data(spreadsheet, sheet_names[0])
             logger.info(f"Retrieved data from {spreadsheet_task.spreadsheet_id}: {len(raw_data)} rows, {len(sheet_names)} sheets")
             return spreadsheet, sheet_names, raw_data
             
@@ -202,59 +268,187 @@ class TradingOrchestrator:
             logger.error(f"Error getting spreadsheet data for {spreadsheet_task.spreadsheet_id}: {e}")
             raise
     
-    def _process_data_parallel(self, sheet_names: List[str], raw_data: pd.DataFrame, participant_name: str) -> Dict[str, pd.DataFrame]:
+    def _process_data(self, sheet_names: List[str], raw_data: pd.DataFrame, spreadsheet_task: SpreadsheetTask,
+                      metrics: ExecutionMetrics) -> Tuple[Dict[str, pd.DataFrame], Optional[LedgerCheckpoint]]:
+        """
+        Process data in full, or incrementally from the ledger checkpoint when only rows were appended
+        
+        A checkpoint is returned whenever incremental processing or ledger snapshots are enabled.
+        
+        Args:
+            raw_data: Raw transaction data
+            spreadsheet_task: SpreadsheetTask the data was read from
+            metrics: Metrics of the task, which the CPU time of stages on the CPU pool is added to
+            
+        Returns:
+            tuple: (Dict containing processed dataframes, checkpoint to save and snapshot or None)
+        """
+        participant_name = spreadsheet_task.get_participant_name()
+        if not (self.config.INCREMENTAL_PROCESSING or self.config.LEDGER_SNAPSHOTS):
+            results, _ = self._process_data_parallel(sheet_names, raw_data, participant_name, metrics)
+            return results, None
+        
+        raw_hash = None
+        if self.config.INCREMENTAL_PROCESSING:
+            # Hashed before processing, which converts the raw numeric columns in place
+            with metrics.stage('process.row_hashes'):
+                row_hashes = get_row_hashes(raw_data)
+                raw_hash = digest_row_hashes(row_hashes, len(raw_data))
+            with metrics.stage('process.checkpoint'):
+                checkpoint = self.checkpoint_service.load_checkpoint(spreadsheet_task.spreadsheet_id)
+                appended_rows = checkpoint.get_appended_rows(raw_data, row_hashes, participant_name) if checkpoint else None
+            if appended_rows is not None:
+                return self._process_appended_rows(sheet_names, len(raw_data), raw_hash, appended_rows, checkpoint, metrics)
+        
+        results, ledger = self._process_data_parallel(sheet_names, raw_data, participant_name, metrics)
+        # A failed stage leaves an empty sheet, which must not end up in the checkpoint or snapshot
+        if any(result.empty for result in results.values()):
+            return results, None
+        with metrics.stage('process.checkpoint'):
+            return results, LedgerCheckpoint.create(
+                participant_name, len(raw_data), raw_hash, results[sheet_names[1]], ledger, results[sheet_names[3]]
+            )
+    
+    def _process_appended_rows(self, sheet_names: List[str], raw_row_count: int, raw_hash: str,
+                               appended_rows: pd.DataFrame, checkpoint: LedgerCheckpoint,
+                               metrics: ExecutionMetrics) -> Tuple[Dict[str, pd.DataFrame], LedgerCheckpoint]:
+        """
+        Process only the rows appended since the checkpoint
+        
+        The appended trades are matched against the open lots of the checkpoint, and the sheets
+        are rebuilt from the advanced checkpoint.
+        
+        Args:
+            raw_row_count: Number of raw rows, including the appended rows
+            raw_hash: Hash of all raw rows
+            appended_rows: Raw rows appended since the checkpoint
+            checkpoint: Checkpoint of the earlier rows
+            metrics: Metrics of the task
+            
+        Returns:
+            tuple: (Dict containing processed dataframes, advanced checkpoint)
+        """
+        logger.info(f"Processing {len(appended_rows)} appended rows on top of the ledger checkpoint")
+        with metrics.stage(f"process.{sheet_names[1]}"):
+            trans_details_data = self.data_processing_service.process_transaction_details(
+                appended_rows.copy(), checkpoint.participant_name
+            )
+        with metrics.stage('process.portfolio_ledger'):
+            ledger = PortfolioLedger.from_transaction_details(trans_details_data, carried_lots=checkpoint.open_lots)
+        with metrics.stage(f"process.{sheet_names[3]}"):
+            daily_profit_loss = self.data_processing_service.process_daily_profit_loss(trans_details_data)
+        with metrics.stage('process.checkpoint'):
+            checkpoint = checkpoint.advance(raw_row_count, raw_hash, trans_details_data, ledger, daily_profit_loss)
+        
+        results = {sheet_names[1]: checkpoint.trans_details, sheet_names[3]: checkpoint.daily_profit_loss}
+        with metrics.stage(f"process.{sheet_names[2]}"):
+            results[sheet_names[2]] = self.data_processing_service.build_share_profit_loss(checkpoint.symbol_totals)
+        with metrics.stage(f"process.{sheet_names[4]}"):
+            results[sheet_names[4]] = self.data_processing_service.build_taxation(format_capital_gains(checkpoint.gain_cells))
+        return results, checkpoint
+    
+    def _process_data_parallel(self, sheet_names: List[str], raw_data: pd.DataFrame, participant_name: str,
+                               metrics: ExecutionMetrics) -> Tuple[Dict[str, pd.DataFrame], PortfolioLedger]:
         """
         Process data in parallel using multiple threads
         
         Args:
             raw_data: Raw transaction data
+            metrics: Metrics of the task, which the CPU time of every stage is added to
             
         Returns:
-            Dict containing processed dataframes
+            tuple: (Dict containing processed dataframes, portfolio ledger of the transaction details)
         """
         logger.info("Starting parallel data processing")
         
         # First, process transaction details (this is the base for other processing)
-        trans_details_data = self.data_processing_service.process_transaction_details(raw_data, participant_name)
+        with metrics.stage(f"process.{sheet_names[1]}"):
+            trans_details_data = self.data_processing_service.process_transaction_details(raw_data, participant_name)
         logger.info(f"Completed {sheet_names[1]} processing")
         
         # Define processing tasks that depend on trans_details_data
         tasks = [
-            (sheet_names[2], self.data_processing_service.process_share_profit_loss, trans_details_data.copy()),
-            (sheet_names[3], self.data_processing_service.process_daily_profit_loss, trans_details_data.copy()),
-            (sheet_names[4], self.data_processing_service.process_taxation, trans_details_data.copy())
+            (sheet_names[2], self.data_processing_service.process_share_profit_loss),
+            (sheet_names[3], self.data_processing_service.process_daily_profit_loss),
+            (sheet_names[4], self.data_processing_service.process_taxation)
         ]
         
         results = {
             sheet_names[1]: trans_details_data  # Add the already processed transaction details
         }
         
-        # Submit tasks to thread pool
-        future_to_task = {
-            self.executor.submit(func, data): (name, func, data)
-            for name, func, data in tasks
-        }
+        # Group and match the trades once; every stage is a projection of this ledger
+        with metrics.stage('process.portfolio_ledger'):
+            ledger = self.data_processing_service.build_portfolio_ledger(trans_details_data)
+        
+        if self.uses_process_pool:
+            # Serialize the ledger once and run every stage in its own process.
+            # Per-symbol stages are split further into symbol shards when SYMBOL_SHARDS > 1
+            payload = pack_ledger(ledger)
+            shard_payloads = None
+            future_to_task = {}
+            for name, func in tasks:
+                payloads = [payload]
+                if self.config.SYMBOL_SHARDS > 1 and func.__name__ in SHARDABLE_STAGES:
+                    if shard_payloads is None:
+                        shard_payloads = [pack_ledger(shard) for shard in partition_by_symbol(ledger, self.config.SYMBOL_SHARDS)]
+                    payloads = shard_payloads
+                for stage_payload in payloads:
+                    future_to_task[self.cpu_executor.submit(run_stage, func.__name__, stage_payload)] = (name, func)
+        else:
+            # Fetch market data on this I/O thread so the CPU stages find it cached.
+            # The ledger is read-only, so all stages share it
+            with metrics.stage('process.market_data'):
+                cache_lookups = self.data_processing_service.prefetch_market_data(ledger)
+            metrics.add_cache_lookups('process.market_data', **cache_lookups)
+            future_to_task = {
+                self.cpu_executor.submit(run_timed, func, ledger): (name, func)
+                for name, func in tasks
+            }
         
         # Collect results as they complete
+        partial_results: Dict[str, List[pd.DataFrame]] = {name: [] for name, func in tasks}
+        failed_tasks = set()
         for future in as_completed(future_to_task):
-            task_name, func, data = future_to_task[future]
+            task_name, func = future_to_task[future]
             try:
-                result = future.result()
-                results[task_name] = result
-                logger.info(f"Completed {task_name} processing")
+                if self.uses_process_pool:
+                    # Stages on pool processes also report their RSS growth, and the metrics they
+                    # changed there, which only this process exports
+                    result, wall_seconds, cpu_seconds, memory_mb, metric_changes = future.result()
+                    registry.merge(metric_changes)
+                    metrics.add_stage(f"process.{task_name}", wall_seconds, cpu_seconds, memory_mb)
+                    partial_results[task_name].append(unpack_frame(result))
+                else:
+                    result, wall_seconds, cpu_seconds = future.result()
+                    metrics.add_stage(f"process.{task_name}", wall_seconds, cpu_seconds)
+                    partial_results[task_name].append(result)
             except Exception as e:
                 logger.error(f"Error in {task_name} processing: {e}")
+                failed_tasks.add(task_name)
+        
+        for task_name, task_results in partial_results.items():
+            if task_name in failed_tasks:
                 results[task_name] = pd.DataFrame()  # Empty dataframe on error
+            else:
+                results[task_name] = merge_shard_results(task_results)
+                logger.info(f"Completed {task_name} processing")
         
-        return results
+        return results, ledger
     
-    def _update_spreadsheet(self, spreadsheet, results: Dict[str, pd.DataFrame], formatting_funcs: Dict[str, Callable]):
-        """Update spreadsheet with processed results"""
+    def _update_spreadsheet(self, spreadsheet, results: Dict[str, pd.DataFrame], formatting_funcs: Dict[str, Callable],
+                            metrics: ExecutionMetrics):
+        """Update spreadsheet with processed results, timing each sheet write and its formatting"""
         logger.info(f"Updating spreadsheet with {len(results)} processed datasets")
         
         # Update each sheet with corresponding data
         for sheet_name, data in results.items():
             logger.info(f"Updating sheet {sheet_name} with {len(data)} rows")
             if not data.empty:
-                
-                self.manager.update_data(spreadsheet, sheet_name, data, formatting_funcs.get(sheet_name)) 
\ No newline at end of file
+                # Internal date columns are only for processing, dates are written as strings
+                data = drop_internal_columns(data)
+                formatting_func = formatting_funcs.get(sheet_name)
+                if formatting_func is not None:
+                    formatting_func = metrics.wrap(f"write.{sheet_name}.format", formatting_func)
+                with metrics.stage(f"write.{sheet_name}"):
+                    self.manager.update_data(spreadsheet, sheet_name, data, formatting_func) 
\ No newline at end of file
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the columnar charge engine against the row-by-row reference
+"""
+
+import pandas as pd
+from config.logging_config import setup_logging
+from stock_portfolio_shared.constants.trans_details_constants import TransDetails_constants
+from stock_portfolio_shared.constants.raw_constants import Raw_constants
+from utils.calculation_utils import calculate_charges_reference, participant_config_manager
+from utils.charge_engine import calculate_charges
+
+logger = setup_logging(__name__)
+
+def create_test_transaction_data():
+    """Create sorted transaction details with intraday counts already set"""
+    data = {
+        Raw_constants.DATE: [
+            '2024-01-15', '2024-01-15', '2024-01-15', '2024-01-16',
+            '2024-01-16', '2024-01-17', '2024-01-17', '2024-10-18'
+        ],
+        Raw_constants.NAME: [
+            'RELIANCE', 'RELIANCE', 'RELIANCE', 'RELIANCE',
+            'RELIANCE', 'TCS', 'TCS', 'TCS'
+        ],
+        Raw_constants.PRICE: [2500.0, 2510.5, 2520.0, 2550.0, 2555.0, 3600.0, 3610.0, 3500.0],
+        Raw_constants.QUANTITY: [10, 5, -8, -5, -3, 20, -4, -10],
+        Raw_constants.NET_AMOUNT: [25000.0, 12552.5, -20160.0, -12750.0, -7665.0, 72000.0, -14440.0, -35000.0],
+        Raw_constants.STOCK_EXCHANGE: ['NSE', 'NSE', 'nse', 'BSE', 'BSE', 'NSE', 'NSE', 'BSE'],
+        TransDetails_constants.TRANSACTION_TYPE: ['BUY', 'BUY', 'SELL', 'SELL', 'SELL', 'BUY', 'SELL', 'SELL'],
+        TransDetails_constants.INTRADAY_COUNT: [1.0, 1.0, 1.0, 0.0, 0.0, 1.0, 1.0, 0.0]
+    }
+    return pd.DataFrame(data)
+
+def test_charge_engine_matches_reference():
+    """The columnar engine must reproduce the row functions exactly"""
+    expected = calculate_charges_reference(create_test_transaction_data(), "zerodha")
+    actual = calculate_charges(create_test_transaction_data(), "zerodha")
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False, check_exact=True)
+    logger.info("Charge engine matches the reference implementation")
+
+def test_charge_engine_matches_reference_for_every_participant():
+    """Participants whose rates are not split by trade type match the reference too"""
+    for participant_name in participant_config_manager.participant_configs:
+        expected = calculate_charges_reference(create_test_transaction_data(), participant_name)
+        actual = calculate_charges(create_test_transaction_data(), participant_name)
+        pd.testing.assert_frame_equal(actual, expected, check_dtype=False, check_exact=True)
+        logger.info(f"Charge engine matches the reference implementation for {participant_name}")
+
+def test_unknown_exchange_is_named():
+    """An exchange without configured charges fails with the exchange and participant in the message"""
+    data = create_test_transaction_data()
+    data.loc[[3, 4], Raw_constants.STOCK_EXCHANGE] = 'mcx'
+    try:
+        calculate_charges(data, "grow")
+    except KeyError as e:
+        assert "'MCX'" in str(e) and "'grow'" in str(e)
+        logger.info(f"Unknown exchange reported: {e}")
+    else:
+        raise AssertionError("charges were calculated for an unknown exchange")
+
+if __name__ == "__main__":
+    test_charge_engine_matches_reference()
+    test_charge_engine_matches_reference_for_every_participant()
+    test_unknown_exchange_is_named()
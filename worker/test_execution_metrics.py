@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the CPU, memory and wall-clock measurements of a spreadsheet task
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from config.logging_config import setup_logging
+from utils.execution_metrics import ExecutionMetrics, run_measured, run_timed
+
+logger = setup_logging(__name__)
+
+def busy_loop(seconds: float) -> int:
+    """Spend about the given number of seconds of CPU time"""
+    iterations = 0
+    end = time.thread_time() + seconds
+    while time.thread_time() < end:
+        iterations += 1
+    return iterations
+
+def test_stage_cpu_time_is_added():
+    """CPU time spent by stages on other threads counts towards the task"""
+    metrics = ExecutionMetrics()
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [executor.submit(run_timed, busy_loop, 0.2) for _ in range(2)]
+        for future in futures:
+            iterations, wall_seconds, cpu_seconds = future.result()
+            assert iterations > 0 and wall_seconds >= cpu_seconds >= 0.2
+            metrics.add_stage('process.busy_loop', wall_seconds, cpu_seconds)
+    memory_usage, cpu_usage = metrics.finish()
+    # 0.4s of stage CPU time within at most 0.4s of wall-clock time
+    assert cpu_usage > 90.0
+    assert memory_usage >= 0.0
+    assert metrics.stages['process.busy_loop'].calls == 2
+    logger.info(f"Task CPU usage {cpu_usage:.0f}%, memory {memory_usage:.1f} MB")
+
+def test_stages():
+    """Wall-clock time adds up per stage, and phases are the top-level stages"""
+    metrics = ExecutionMetrics()
+    for _ in range(2):
+        with metrics.stage('read'):
+            with metrics.stage('read.auth'):
+                time.sleep(0.05)
+    format_sheet = metrics.wrap('write.Taxation.format', lambda sheet: sheet)
+    with metrics.stage('write'):
+        assert format_sheet('Taxation') == 'Taxation'
+    metrics.add_cache_lookups('process.market_data', cache_hits=3, cache_misses=1)
+    metrics.finish()
+    assert list(metrics.phase_seconds) == ['read', 'write']
+    assert metrics.phase_seconds['read'] >= metrics.stages['read.auth'].wall_seconds >= 0.1
+    assert metrics.stages['read.auth'].calls == 2
+    assert metrics.stages['write.Taxation.format'].calls == 1
+    assert (metrics.stages['process.market_data'].cache_hits, metrics.stages['process.market_data'].cache_misses) == (3, 1)
+    logger.info(f"Phases: {metrics.phase_seconds}")
+
+def allocate(megabytes: int) -> int:
+    """Touch and hold a buffer of the given size for a moment"""
+    buffer = bytearray(megabytes * 1024 * 1024)
+    time.sleep(0.2)
+    return len(buffer)
+
+def test_memory_is_per_task():
+    """A task records the RSS growth while it ran, not the peak of the process so far"""
+    metrics = ExecutionMetrics()
+    allocate(200)
+    memory_usage, _ = metrics.finish()
+    assert memory_usage > 150.0
+
+    # The earlier peak is not repeated by a task that allocates little
+    memory_usage, _ = ExecutionMetrics().finish()
+    assert memory_usage < 50.0
+
+    # Stages measured in pool processes add their own growth
+    _, _, _, stage_memory = run_measured(allocate, 100)
+    metrics = ExecutionMetrics()
+    metrics.add_stage('process.allocate', 0.2, 0.0, stage_memory)
+    memory_usage, _ = metrics.finish()
+    assert stage_memory > 75.0 and memory_usage >= stage_memory
+    logger.info(f"Stage RSS growth {stage_memory:.0f} MB")
+
+if __name__ == "__main__":
+    test_stage_cpu_time_is_added()
+    test_stages()
+    test_memory_is_per_task()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Test script to verify incremental processing from a ledger checkpoint against a full run
+"""
+
+import numpy as np
+import pandas as pd
+from config.logging_config import setup_logging
+from services.data_processing_service import DataProcessingService
+from stock_portfolio_shared.constants.raw_constants import Raw_constants
+from stock_portfolio_shared.constants.taxation_constants import Taxation_constants
+from utils.ledger_checkpoint import GAIN_COLUMNS, LedgerCheckpoint, digest_row_hashes, get_row_hashes
+from utils.portfolio_ledger import PortfolioLedger, format_capital_gains
+
+logger = setup_logging(__name__)
+
+def create_raw_data():
+    """Create raw transactions in the order they were appended, with strings as read from a sheet"""
+    rows = [
+        ('2023-01-10', 'RELIANCE', '2,500.00', '10', '25,000.00'),
+        ('2023-01-10', 'TCS', '3,300.00', '6', '19,800.00'),
+        ('2023-02-15', 'RELIANCE', '2,600.00', '-4', '-10,400.00'),
+        ('2023-06-01', 'RELIANCE', '2,450.00', '8', '19,600.00'),
+        ('2024-03-20', 'TCS', '3,900.00', '-2', '-7,800.00'),
+        # Appended after the checkpoint
+        ('2024-04-02', 'RELIANCE', '2,900.00', '-10', '-29,000.00'),
+        ('2024-04-02', 'INFY', '1,500.00', '5', '7,500.00'),
+        ('2024-04-02', 'INFY', '1,520.00', '-3', '-4,560.00'),
+        ('2024-05-06', 'TCS', '4,000.00', '-3', '-12,000.00'),
+    ]
+    return pd.DataFrame(rows, columns=[
+        Raw_constants.DATE, Raw_constants.NAME, Raw_constants.PRICE, Raw_constants.QUANTITY, Raw_constants.NET_AMOUNT
+    ]).assign(**{Raw_constants.STOCK_EXCHANGE: 'NSE'})
+
+def create_service():
+    """Create a processing service whose market data calls return without network access"""
+    service = DataProcessingService()
+    service.market_data_helper.batch_get_current_prices = lambda names: {name: 100.0 for name in names}
+    service.market_data_helper.batch_get_stock_prices = lambda stock_dates: {}
+    return service
+
+def create_checkpoint(service, raw_data):
+    """Run the full pipeline on raw_data and checkpoint it"""
+    raw_hash = digest_row_hashes(get_row_hashes(raw_data), len(raw_data))
+    trans_details = service.process_transaction_details(raw_data.copy(), "zerodha")
+    ledger = PortfolioLedger.from_transaction_details(trans_details)
+    return LedgerCheckpoint.create(
+        "zerodha", len(raw_data), raw_hash, trans_details, ledger, service.process_daily_profit_loss(ledger)
+    )
+
+def create_random_raw_data(rng):
+    """Create random trades over a few symbols, some sold beyond what was bought as with IPO or bonus shares"""
+    rows = []
+    for _ in range(int(rng.integers(20, 60))):
+        day = pd.Timestamp('2022-01-03') + pd.Timedelta(days=int(rng.integers(0, 900)))
+        name = str(rng.choice(['RELIANCE', 'TCS', 'INFY', 'HDFC']))
+        price = float(rng.integers(100, 4000))
+        quantity = int(rng.integers(1, 20)) * (1 if rng.random() < 0.5 else -1)
+        rows.append((day, name, price, quantity))
+    rows.sort(key=lambda row: row[0])
+    return pd.DataFrame([
+        (day.strftime('%Y-%m-%d'), name, f"{price:,.2f}", str(quantity), f"{price * quantity:,.2f}")
+        for day, name, price, quantity in rows
+    ], columns=[
+        Raw_constants.DATE, Raw_constants.NAME, Raw_constants.PRICE, Raw_constants.QUANTITY, Raw_constants.NET_AMOUNT
+    ]).assign(**{Raw_constants.STOCK_EXCHANGE: 'NSE'})
+
+def test_randomized_appends_match_full_run():
+    """Advancing a checkpoint with appended trades gives the sheets of a full run, oversold symbols included"""
+    service = create_service()
+    rng = np.random.default_rng(16)
+    oversold_runs = 0
+    for _ in range(25):
+        raw_data = create_random_raw_data(rng)
+        dates = raw_data[Raw_constants.DATE]
+        # Checkpoint after a day, so every appended trade is dated after it
+        cut_date = str(rng.choice(dates.unique()[:-1]))
+        row_count = int((dates <= cut_date).sum())
+        checkpoint = create_checkpoint(service, raw_data.iloc[:row_count])
+        oversold_runs += bool((checkpoint.open_lots['quantity'] < 0).any())
+
+        row_hashes = get_row_hashes(raw_data)
+        appended_rows = checkpoint.get_appended_rows(raw_data, row_hashes, "zerodha")
+        assert appended_rows is not None and len(appended_rows) == len(raw_data) - row_count
+        trans_details = service.process_transaction_details(appended_rows.copy(), "zerodha")
+        ledger = PortfolioLedger.from_transaction_details(trans_details, carried_lots=checkpoint.open_lots)
+        checkpoint = checkpoint.advance(
+            len(raw_data), digest_row_hashes(row_hashes, len(raw_data)),
+            trans_details, ledger, service.process_daily_profit_loss(trans_details)
+        )
+
+        full = service.process_transaction_details(raw_data.copy(), "zerodha")
+        full_ledger = PortfolioLedger.from_transaction_details(full)
+        pd.testing.assert_frame_equal(
+            service.build_share_profit_loss(checkpoint.symbol_totals), service.process_share_profit_loss(full)
+        )
+        pd.testing.assert_frame_equal(
+            service.build_taxation(format_capital_gains(checkpoint.gain_cells)), service.process_taxation(full)
+        )
+        pd.testing.assert_frame_equal(checkpoint.daily_profit_loss, service.process_daily_profit_loss(full))
+        pd.testing.assert_frame_equal(checkpoint.trans_details.reset_index(drop=True), full.reset_index(drop=True))
+        pd.testing.assert_frame_equal(checkpoint.open_lots, full_ledger.open_lots(), check_dtype=False)
+        state = checkpoint.symbol_state()
+        assert np.allclose(state['open_quantity'], state['buy_quantity'] + state['sell_quantity'])
+    assert oversold_runs > 0
+    logger.info(f"Incremental processing matches the full run, {oversold_runs} of 25 checkpoints oversold")
+
+def test_changed_rows_need_full_run():
+    """Edited earlier rows, or appended trades not dated after the checkpoint, need a full run"""
+    service = create_service()
+    raw_data = create_raw_data()
+    checkpoint = create_checkpoint(service, raw_data.iloc[:5])
+
+    edited = raw_data.copy()
+    edited.loc[0, Raw_constants.QUANTITY] = '12'
+    assert checkpoint.get_appended_rows(edited, get_row_hashes(edited), "zerodha") is None
+
+    backdated = pd.concat([raw_data.iloc[:5], raw_data.iloc[[4]]], ignore_index=True)
+    assert checkpoint.get_appended_rows(backdated, get_row_hashes(backdated), "zerodha") is None
+    assert checkpoint.get_appended_rows(raw_data, get_row_hashes(raw_data), "groww") is None
+    logger.info("Changed transactions fall back to a full run")
+
+def test_symbol_state():
+    """The running totals per symbol hold the open quantity and the gains of all financial years"""
+    service = create_service()
+    raw_data = create_raw_data()
+    state = create_checkpoint(service, raw_data).symbol_state()
+    assert state.index.tolist() == ['INFY', 'RELIANCE', 'TCS']
+    assert state['open_quantity'].tolist() == [2.0, 4.0, 1.0]
+    taxation = service.process_taxation(service.process_transaction_details(raw_data.copy(), "zerodha"))
+    gains = taxation.groupby(Taxation_constants.NAME)[GAIN_COLUMNS].sum()
+    pd.testing.assert_frame_equal(state[GAIN_COLUMNS], gains, check_names=False, check_dtype=False)
+    logger.info("Symbol state matches the taxation sheet")
+
+if __name__ == "__main__":
+    test_randomized_appends_match_full_run()
+    test_changed_rows_need_full_run()
+    test_symbol_state()
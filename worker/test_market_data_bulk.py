@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Test script to verify bulk downloads are split per stock and missing stocks are fetched one at a time
+from the remaining exchanges
+"""
+
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from config.logging_config import setup_logging
+from helper import market_data_helper
+from helper.market_data_helper import MarketDataHelper
+
+logger = setup_logging(__name__)
+
+FIELDS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+def fake_download(tickers, start, end, **kwargs):
+    """Return grouped columns like yf.download, with no bars for INFY.NS and none on 2024-03-04 for WIPRO.NS"""
+    # yf.download resets the errors of the previous download
+    market_data_helper.yf.shared._ERRORS = {}
+    dates = pd.DatetimeIndex(['2024-03-01', '2024-03-04'])
+    columns = pd.MultiIndex.from_product([tickers, FIELDS])
+    frame = pd.DataFrame(np.nan, index=dates, columns=columns)
+    if 'TCS.NS' in tickers:
+        frame.loc[:, 'TCS.NS'] = np.array([[99.0, 101.0, 98.0, 100.0, 1000], [109.0, 111.0, 108.0, 110.0, 2000]])
+    if 'WIPRO.NS' in tickers:
+        frame.loc[dates[0], 'WIPRO.NS'] = [9.0, 11.0, 8.0, 10.0, 500]
+    return frame
+
+def fake_history(full_name, start, end):
+    """Return bars only for INFY on BSE"""
+    if full_name != 'INFY.BO':
+        return pd.DataFrame(columns=FIELDS)
+    return pd.DataFrame([[49.0, 51.0, 48.0, 50.0, 300]], columns=FIELDS, index=pd.DatetimeIndex(['2024-03-04']))
+
+def test_bulk_download_with_fallback():
+    """Bulk bars are matched per stock, and only the stock missing from the response is fetched alone"""
+    helper = MarketDataHelper()
+    helper._price_store = None
+    fetched = []
+    helper._fetch_history = lambda full_name, start, end: fetched.append(full_name) or fake_history(full_name, start, end)
+    download = market_data_helper.yf.download
+    market_data_helper.yf.download = fake_download
+    try:
+        first, second = datetime(2024, 3, 1), datetime(2024, 3, 4)
+        # The same dates give every stock the same window, downloaded in bulk
+        results = helper.batch_get_stock_prices([(name, date) for name in ['TCS', 'WIPRO', 'INFY'] for date in [first, second]])
+    finally:
+        market_data_helper.yf.download = download
+
+    assert results[('TCS', first)][1:] == ['TCS.NS', 99.0, 101.0, 98.0, 100.0, 1000]
+    assert results[('TCS', second)][1:] == ['TCS.NS', 109.0, 111.0, 108.0, 110.0, 2000]
+    assert results[('WIPRO', first)][1:] == ['WIPRO.NS', 9.0, 11.0, 8.0, 10.0, 500]
+    assert results[('WIPRO', second)] == [] and results[('INFY', first)] == []
+    assert results[('INFY', second)][1:] == ['INFY.BO', 49.0, 51.0, 48.0, 50.0, 300]
+    # The bulk response already showed INFY has no NSE bars
+    assert fetched == ['INFY.BO']
+    logger.info("Bulk download split per stock with per-stock fallback")
+
+def test_failed_ticker_tries_every_exchange():
+    """A ticker dropped from the bulk response on an error is fetched again on every exchange"""
+    helper = MarketDataHelper()
+    helper._price_store = None
+    fetched = []
+    helper._fetch_history = lambda full_name, start, end: fetched.append(full_name) or fake_history(full_name, start, end)
+    def download_with_error(tickers, start, end, **kwargs):
+        frame = fake_download([ticker for ticker in tickers if ticker != 'INFY.NS'], start, end, **kwargs)
+        market_data_helper.yf.shared._ERRORS = {'INFY.NS': 'YFRateLimitError: Too Many Requests'}
+        return frame
+    download = market_data_helper.yf.download
+    market_data_helper.yf.download = download_with_error
+    try:
+        date = datetime(2024, 3, 4)
+        results = helper.batch_get_stock_prices([('TCS', date), ('INFY', date)])
+    finally:
+        market_data_helper.yf.download = download
+
+    assert results[('TCS', date)][1] == 'TCS.NS' and results[('INFY', date)][1] == 'INFY.BO'
+    assert fetched == ['INFY.NS', 'INFY.BO']
+    logger.info("Ticker that failed in the bulk download fell back to every exchange")
+
+def test_failed_bulk_download_tries_every_exchange():
+    """Stocks of a bulk download that failed run the whole NSE → BSE fallback"""
+    helper = MarketDataHelper()
+    helper._price_store = None
+    fetched = []
+    helper._fetch_history = lambda full_name, start, end: fetched.append(full_name) or fake_history(full_name, start, end)
+    def failing_download(tickers, start, end, **kwargs):
+        raise ConnectionError("Connection reset")
+    download = market_data_helper.yf.download
+    market_data_helper.yf.download = failing_download
+    try:
+        date = datetime(2024, 3, 4)
+        results = helper.batch_get_stock_prices([('TCS', date), ('INFY', date)])
+    finally:
+        market_data_helper.yf.download = download
+
+    assert results[('INFY', date)][1] == 'INFY.BO' and results[('TCS', date)] == []
+    assert sorted(fetched) == ['INFY.BO', 'INFY.NS', 'TCS.BO', 'TCS.NS']
+    logger.info("Failed bulk download fell back to every exchange")
+
+def test_bulk_miss_keeps_stock_unresolved():
+    """A stock without bars in a bulk response and on BSE is not resolved to none"""
+    helper = MarketDataHelper()
+    helper._price_store = None
+    helper._fetch_history = lambda full_name, start, end: pd.DataFrame(columns=FIELDS)
+    download = market_data_helper.yf.download
+    market_data_helper.yf.download = fake_download
+    try:
+        date = datetime(2024, 3, 4)
+        results = helper.batch_get_stock_prices([('TCS', date), ('HDFC', date)])
+    finally:
+        market_data_helper.yf.download = download
+
+    assert results[('HDFC', date)] == [] and 'HDFC' not in helper._exchange_resolutions
+    assert helper._get_exchanges('HDFC') == helper.EXCHANGES
+    logger.info("Stock missing from a bulk response stays unresolved")
+
+if __name__ == "__main__":
+    test_bulk_download_with_fallback()
+    test_failed_ticker_tries_every_exchange()
+    test_failed_bulk_download_tries_every_exchange()
+    test_bulk_miss_keeps_stock_unresolved()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Test script to verify per-stock fetches run concurrently within the request rate limit
+"""
+
+import tempfile
+import threading
+import time
+from datetime import datetime
+import pandas as pd
+from config.logging_config import setup_logging
+from helper import market_data_helper
+from helper.market_data_helper import MarketDataHelper
+from helper.price_store import PriceStore
+from utils import rate_limiter
+from utils.rate_limiter import RateLimiter
+
+logger = setup_logging(__name__)
+
+def frozen_limiter(rate, burst):
+    """Build a limiter whose clock stands still, recording the waits instead of sleeping"""
+    waits = []
+    return RateLimiter(rate=rate, burst=burst, clock=lambda: 0.0, sleep=waits.append), waits
+
+def test_rate_limiter_spaces_calls():
+    """Calls past the burst start at the configured rate, across threads"""
+    limiter, waits = frozen_limiter(rate=20, burst=2)
+    threads = [threading.Thread(target=limiter.acquire) for _ in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Two calls start at once, the other ten 50ms apart
+    assert [round(wait, 6) for wait in sorted(waits)] == [round(0.05 * index, 6) for index in range(1, 11)]
+    logger.info(f"12 calls at 20/s waited {sorted(waits)}")
+
+class FakeTicker:
+    """Stand-in for yf.Ticker with bars only on BSE; NSE calls answer once all 8 are in flight"""
+
+    nse_calls = threading.Barrier(8, timeout=10)
+
+    def __init__(self, full_name):
+        self.full_name = full_name
+
+    def history(self, start, end, auto_adjust):
+        if self.full_name.endswith('.NS'):
+            self.nse_calls.wait()
+            return pd.DataFrame(columns=['Open', 'High', 'Low', 'Close', 'Volume'])
+        return pd.DataFrame([[9.0, 11.0, 8.0, 10.0, 100]], columns=['Open', 'High', 'Low', 'Close', 'Volume'],
+                            index=pd.DatetimeIndex(['2024-03-01']))
+
+def test_fallbacks_run_concurrently():
+    """Every stock's NSE → BSE fallback overlaps the others, within the shared rate limit"""
+    helper = MarketDataHelper()
+    helper._price_store = None
+    helper.config.MARKET_DATA_BULK_SIZE = 0
+    helper.config.MARKET_DATA_CONCURRENCY = 8
+
+    limiter, waits = frozen_limiter(rate=40, burst=4)
+    FakeTicker.nse_calls.reset()
+    limiters = dict(rate_limiter._limiters)
+    rate_limiter._limiters[MarketDataHelper.YFINANCE_HOST] = limiter
+    ticker = market_data_helper.yf.Ticker
+    market_data_helper.yf.Ticker = FakeTicker
+    try:
+        date = datetime(2024, 3, 1)
+        results = helper.batch_get_stock_prices([(f"STOCK{index}", date) for index in range(8)])
+    finally:
+        market_data_helper.yf.Ticker = ticker
+        rate_limiter._limiters.clear()
+        rate_limiter._limiters.update(limiters)
+
+    # Every NSE call was in flight at once, and all 16 calls took turns at the shared limiter:
+    # 4 at once, the others 25ms apart
+    assert all(results[(f"STOCK{index}", date)][1] == f"STOCK{index}.BO" for index in range(8))
+    assert [round(wait, 6) for wait in sorted(waits)] == [round(0.025 * index, 6) for index in range(1, 13)]
+    logger.info("8 stocks with BSE fallback fetched concurrently within the rate limit")
+
+def test_downloads_take_one_burst():
+    """A bulk download never asks for more tickers than the rate limiter lets start at once"""
+    helper = MarketDataHelper()
+    helper.config.MARKET_DATA_BULK_SIZE = 100
+    helper.config.MARKET_DATA_CONCURRENCY = 8
+    downloads = []
+
+    def download(tickers, start, end, threads, **kwargs):
+        downloads.append((len(tickers), threads))
+        return pd.DataFrame()
+
+    limiters = dict(rate_limiter._limiters)
+    rate_limiter._limiters[MarketDataHelper.YFINANCE_HOST] = frozen_limiter(rate=1000, burst=5)[0]
+    original = market_data_helper.yf.download
+    market_data_helper.yf.download = download
+    try:
+        helper._download_history([f"STOCK{index}.NS" for index in range(12)], datetime(2024, 3, 1), datetime(2024, 3, 2))
+    finally:
+        market_data_helper.yf.download = original
+        rate_limiter._limiters.clear()
+        rate_limiter._limiters.update(limiters)
+    assert downloads == [(5, 5), (5, 5), (2, 2)]
+    logger.info(f"Downloads of (tickers, threads): {downloads}")
+
+def test_dates_fetched_in_windows():
+    """Distant dates of a stock are fetched as separate short windows"""
+    helper = MarketDataHelper()
+    helper._price_store = None
+    helper.config.MARKET_DATA_BULK_SIZE = 0
+    helper.config.MARKET_DATA_WINDOW_GAP = 30
+    ranges = []
+
+    def fetch_history(full_name, start, end):
+        ranges.append((start, end))
+        return pd.DataFrame([[9.0, 11.0, 8.0, 10.0, 100]] * 3, columns=['Open', 'High', 'Low', 'Close', 'Volume'],
+                            index=pd.DatetimeIndex(['2015-06-01', '2015-06-20', '2024-03-01']))
+    helper._fetch_history = fetch_history
+
+    dates = [datetime(2015, 6, 1), datetime(2015, 6, 20), datetime(2024, 3, 1)]
+    results = helper.batch_get_stock_prices([('TCS', date) for date in dates])
+    assert all(results[('TCS', date)][5] == 10.0 for date in dates)
+    assert sorted(ranges) == [(datetime(2015, 5, 27), datetime(2015, 6, 21)), (datetime(2024, 2, 25), datetime(2024, 3, 2))]
+    logger.info(f"Fetched windows: {sorted(ranges)}")
+
+def test_empty_window_keeps_resolution():
+    """A stock with bars in one window stays on its exchange when another window comes back empty"""
+    date = datetime(2024, 3, 1)
+    for slow_year in (2015, 2024):
+        with tempfile.TemporaryDirectory() as directory:
+            helper = MarketDataHelper()
+            helper._price_store = PriceStore(directory)
+            helper.config.MARKET_DATA_BULK_SIZE = 0
+
+            def fetch_history(full_name, start, end):
+                # Either window may finish first
+                time.sleep(0.1 if start.year == slow_year else 0.0)
+                if full_name == 'NEWCO.NS' and start.year == 2024:
+                    return pd.DataFrame([[9.0, 11.0, 8.0, 10.0, 100]], columns=['Open', 'High', 'Low', 'Close', 'Volume'],
+                                        index=pd.DatetimeIndex([date]))
+                return pd.DataFrame(columns=['Open', 'High', 'Low', 'Close', 'Volume'])
+            helper._fetch_history = fetch_history
+
+            # NEWCO had not listed yet in 2015
+            results = helper.batch_get_stock_prices([('NEWCO', datetime(2015, 6, 1)), ('NEWCO', date)])
+            assert results[('NEWCO', datetime(2015, 6, 1))] == [] and results[('NEWCO', date)][5] == 10.0
+            assert helper._exchange_resolutions['NEWCO'][0] == 'NSE'
+            assert helper._price_store.get_resolutions(['NEWCO'])['NEWCO'][0] == 'NSE'
+    logger.info("An empty window keeps the exchange found in another")
+
+if __name__ == "__main__":
+    test_rate_limiter_spaces_calls()
+    test_fallbacks_run_concurrently()
+    test_downloads_take_one_burst()
+    test_dates_fetched_in_windows()
+    test_empty_window_keeps_resolution()
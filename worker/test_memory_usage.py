@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the processing stages share the transaction details read-only
+"""
+
+import tracemalloc
+import numpy as np
+import pandas as pd
+from config.logging_config import setup_logging
+from services.data_processing_service import DataProcessingService
+from stock_portfolio_shared.constants.raw_constants import Raw_constants
+
+logger = setup_logging(__name__)
+
+STAGES = ['process_share_profit_loss', 'process_daily_profit_loss', 'process_taxation']
+
+# Peak memory a stage may allocate, relative to the size of the transaction details it shares
+MAX_PEAK_RATIO = 1.0
+
+def create_raw_data(rows: int = 50000, symbols: int = 50):
+    """Create raw transactions of random buys and sells spread over about four years"""
+    rng = np.random.default_rng(7)
+    names = np.array([f"STOCK{index:03d}" for index in range(symbols)])[rng.integers(0, symbols, rows)]
+    dates = pd.Timestamp('2019-01-01') + pd.to_timedelta(np.sort(rng.integers(0, 1500, rows)), unit='D')
+    quantity = np.where(rng.random(rows) < 0.6, 1, -1) * rng.integers(1, 10, rows)
+    price = rng.uniform(50, 3000, rows).round(2)
+    return pd.DataFrame({
+        Raw_constants.DATE: dates.strftime('%Y-%m-%d'),
+        Raw_constants.NAME: names,
+        Raw_constants.PRICE: price,
+        Raw_constants.QUANTITY: quantity,
+        Raw_constants.NET_AMOUNT: (quantity * price).round(2),
+        Raw_constants.STOCK_EXCHANGE: 'NSE'
+    })
+
+def create_service():
+    """Create a processing service whose market data calls return without network access"""
+    service = DataProcessingService()
+    service.market_data_helper.batch_get_current_prices = lambda names: {name: 100.0 for name in names}
+    service.market_data_helper.batch_get_stock_prices = lambda stock_dates: {}
+    return service
+
+def test_stages_do_not_modify_input():
+    """Every stage must leave the shared transaction details exactly as it found them"""
+    service = create_service()
+    trans_details = service.process_transaction_details(create_raw_data(5000, 50), "zerodha")
+    snapshot = trans_details.copy(deep=True)
+    for stage in STAGES:
+        getattr(service, stage)(trans_details)
+        pd.testing.assert_frame_equal(trans_details, snapshot, check_exact=True)
+    logger.info("Processing stages leave their input unchanged")
+
+def test_stage_peak_memory():
+    """Each stage may allocate at most the size of the transaction details it reads"""
+    service = create_service()
+    trans_details = service.process_transaction_details(create_raw_data(), "zerodha")
+    input_size = trans_details.memory_usage(deep=True).sum()
+    for stage in STAGES:
+        tracemalloc.start()
+        try:
+            getattr(service, stage)(trans_details)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        logger.info(f"{stage} peak allocation: {peak / input_size:.2f}x the input")
+        assert peak < MAX_PEAK_RATIO * input_size, f"{stage} allocated {peak} bytes for a {input_size} byte input"
+
+if __name__ == "__main__":
+    test_stages_do_not_modify_input()
+    test_stage_peak_memory()
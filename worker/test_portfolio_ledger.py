@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the portfolio ledger lot matching and its sheet projections
+"""
+
+import numpy as np
+import pandas as pd
+from config.logging_config import setup_logging
+from stock_portfolio_shared.constants.trans_details_constants import TransDetails_constants
+from stock_portfolio_shared.constants.raw_constants import Raw_constants
+from stock_portfolio_shared.constants.taxation_constants import Taxation_constants
+from utils.portfolio_ledger import PortfolioLedger
+
+logger = setup_logging(__name__)
+
+def create_test_transaction_details():
+    """Create transaction details where the final amount equals the net amount"""
+    net_amount = [1000.0, 600.0, -960.0, -750.0, 400.0, -480.0]
+    return pd.DataFrame({
+        Raw_constants.DATE: ['2024-01-15', '2024-01-15', '2024-01-15', '2025-03-01', '2024-06-01', '2024-09-01'],
+        Raw_constants.NAME: ['RELIANCE', 'RELIANCE', 'RELIANCE', 'RELIANCE', 'TCS', 'TCS'],
+        Raw_constants.QUANTITY: [10, 5, -8, -5, 4, -4],
+        Raw_constants.NET_AMOUNT: net_amount,
+        TransDetails_constants.TRANSACTION_TYPE: ['BUY', 'BUY', 'SELL', 'SELL', 'BUY', 'SELL'],
+        TransDetails_constants.FINAL_AMOUNT: net_amount
+    })
+
+def test_average_cost_of_sold_shares():
+    """Sells take same-day buys first and then the oldest remaining buys"""
+    ledger = PortfolioLedger.from_transaction_details(create_test_transaction_details())
+    # RELIANCE: 8 intraday from the first buy, then 2 more from it and 3 from the second buy
+    np.testing.assert_allclose(ledger.average_cost_of_sold_shares(), [(10 * 100 + 3 * 120) / 13, 100.0])
+    logger.info("Average cost of sold shares matches FIFO")
+
+def test_capital_gains():
+    """Gains are split into intraday, long and short term and booked in the sell's financial year"""
+    gains = PortfolioLedger.from_transaction_details(create_test_transaction_details()).capital_gains()
+    assert gains[Taxation_constants.NAME].tolist() == ['RELIANCE', 'RELIANCE', 'TCS']
+    assert gains[Taxation_constants.FINANCIAL_YEAR].tolist() == ['FY 2023-24', 'FY 2024-25', 'FY 2024-25']
+    np.testing.assert_allclose(gains[Taxation_constants.INTRADAY_INCOME], [8 * 20, 0, 0])
+    np.testing.assert_allclose(gains[Taxation_constants.LTCG], [0, 2 * 50 + 3 * 30, 0])
+    np.testing.assert_allclose(gains[Taxation_constants.STCG], [0, 0, 4 * 20])
+    logger.info("Capital gains match FIFO")
+
+def test_select_symbols():
+    """A symbol subset of the ledger equals the ledger built from that symbol's trades"""
+    data = create_test_transaction_details()
+    ledger = PortfolioLedger.from_transaction_details(data)
+    selected = ledger.select_symbols(ledger.names == 'TCS')
+    rebuilt = PortfolioLedger.from_transaction_details(data[data[Raw_constants.NAME] == 'TCS'])
+    pd.testing.assert_frame_equal(selected.capital_gains(), rebuilt.capital_gains())
+    np.testing.assert_allclose(selected.average_cost_of_sold_shares(), rebuilt.average_cost_of_sold_shares())
+    logger.info("Selected ledger matches the rebuilt ledger")
+
+if __name__ == "__main__":
+    test_average_cost_of_sold_shares()
+    test_capital_gains()
+    test_select_symbols()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Test script to verify past daily bars are read back from the price store before the network
+"""
+
+import tempfile
+import time
+from datetime import datetime, timedelta
+import pandas as pd
+from config.logging_config import setup_logging
+from helper.market_data_helper import MarketDataHelper
+from helper.price_store import PriceStore
+
+logger = setup_logging(__name__)
+
+def make_history(dates, close):
+    """Build daily bars shaped like a yfinance history frame"""
+    return pd.DataFrame({
+        'Open': [close - 1.0] * len(dates),
+        'High': [close + 1.0] * len(dates),
+        'Low': [close - 2.0] * len(dates),
+        'Close': [close] * len(dates),
+        'Volume': [1000] * len(dates)
+    }, index=pd.DatetimeIndex(dates, tz='Asia/Kolkata'))
+
+def test_bars_prefer_exchange_priority():
+    """A day stored for both exchanges returns the NSE bar, and today's bar is not stored"""
+    with tempfile.TemporaryDirectory() as directory:
+        store = PriceStore(directory)
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        past = [today - timedelta(days=2), today - timedelta(days=1)]
+        store.put_bars('TCS', 'BSE', make_history(past, 90.0))
+        store.put_bars('TCS', 'NSE', make_history(past[1:] + [today], 100.0))
+        # Bars fetched again on the same basis leave the stored ones as they are
+        store.put_bars('TCS', 'NSE', make_history(past[1:], 100.0))
+
+        ordinals = [date.toordinal() for date in past + [today]]
+        bars = PriceStore(directory).get_bars({'TCS': ordinals, 'INFY': ordinals}, ['NSE', 'BSE'])
+        assert bars['TCS'] == {
+            ordinals[0]: ('BSE', 89.0, 91.0, 88.0, 90.0, 1000),
+            ordinals[1]: ('NSE', 99.0, 101.0, 98.0, 100.0, 1000)
+        }
+        assert bars['INFY'] == {}
+        logger.info("Stored bars follow the exchange priority")
+
+def test_rebased_bars_are_replaced():
+    """Bars fetched after a split replace every stored bar of the symbol, keeping the adjustment factor"""
+    with tempfile.TemporaryDirectory() as directory:
+        store = PriceStore(directory)
+        days = [datetime(2024, 3, day) for day in (1, 4, 5)]
+        history = make_history(days[:2], 100.0).assign(**{'Adj Close': 98.0})
+        store.put_bars('TCS', 'NSE', history)
+        # A 1:2 split halves every earlier price
+        store.put_bars('TCS', 'NSE', make_history(days[1:], 50.0))
+
+        bars = store.get_bars({'TCS': [day.toordinal() for day in days]}, ['NSE'])['TCS']
+        assert sorted(bars) == [days[1].toordinal(), days[2].toordinal()]
+        assert all(bar[4] == 50.0 for bar in bars.values())
+        logger.info("Rebased bars replace the stored ones")
+
+def test_batch_reads_store_first():
+    """Batch price lookups are answered from the store without fetching"""
+    with tempfile.TemporaryDirectory() as directory:
+        helper = MarketDataHelper()
+        helper._price_store = PriceStore(directory)
+        date = datetime(2024, 3, 1)
+        helper._price_store.put_bars('TCS', 'NSE', make_history([date], 100.0))
+        helper._fetch_history = lambda *args: (_ for _ in ()).throw(AssertionError('fetched from the network'))
+
+        results = helper.batch_get_stock_prices([('TCS', date)])
+        assert results[('TCS', date)][1:] == ['TCS.NS', 99.0, 101.0, 98.0, 100.0, 1000]
+        assert helper._get_cache_key('TCS', date) in helper._price_cache
+        logger.info("Batch lookups read the price store")
+
+def test_exchange_resolutions():
+    """Stocks go straight to the exchange they resolved to, and stocks without data are skipped until expiry"""
+    with tempfile.TemporaryDirectory() as directory:
+        date = datetime(2024, 3, 1)
+        fetched = []
+
+        def fetch_history(full_name, start, end):
+            fetched.append(full_name)
+            return make_history([date], 100.0) if full_name == 'TCS.BO' else make_history([], 0.0)
+
+        def new_helper():
+            helper = MarketDataHelper()
+            helper._price_store = PriceStore(directory)
+            helper.config.MARKET_DATA_BULK_SIZE = 0
+            helper._fetch_history = fetch_history
+            return helper
+
+        new_helper().batch_get_stock_prices([('TCS', date), ('DEAD', date)])
+        assert sorted(fetched) == ['DEAD.BO', 'DEAD.NS', 'TCS.BO', 'TCS.NS']
+
+        # A new process reads the resolutions back from the store
+        fetched.clear()
+        helper = new_helper()
+        results = helper.batch_get_stock_prices([('TCS', date + timedelta(days=3)), ('DEAD', date + timedelta(days=3))])
+        assert fetched == ['TCS.BO'] and results[('DEAD', date + timedelta(days=3))] == []
+
+        # Resolutions to no exchange expire
+        fetched.clear()
+        helper.config.EXCHANGE_NEGATIVE_TTL = 0
+        helper.batch_get_stock_prices([('DEAD', date + timedelta(days=4))])
+        assert fetched == ['DEAD.NS', 'DEAD.BO']
+        logger.info("Exchange resolutions skip known exchanges and dead stocks")
+
+def test_empty_responses_keep_resolutions():
+    """Empty or failed responses never resolve a stock to none over an exchange, or hide a held stock's price"""
+    with tempfile.TemporaryDirectory() as directory:
+        date = datetime(2024, 3, 1)
+        today = datetime.combine(datetime.now().date(), datetime.min.time())
+        fetched = []
+
+        def fetch_history(full_name, start, end):
+            fetched.append(full_name)
+            if full_name == 'FLAKY.BO':
+                raise ConnectionError("Connection reset")
+            if full_name == 'DEAD.NS' and end > date + timedelta(days=30):
+                return make_history([today - timedelta(days=5)], 20.0)
+            return make_history([], 0.0)
+
+        helper = MarketDataHelper()
+        helper._price_store = PriceStore(directory)
+        helper.config.MARKET_DATA_BULK_SIZE = 0
+        helper._fetch_history = fetch_history
+        helper._price_store.put_resolution('TCS', 'NSE', 1.0)
+        helper._price_store.put_resolution('DEAD', None, time.time())
+
+        # The resolved exchange falls back to the others, and an empty range keeps the resolution
+        helper.batch_get_stock_prices([('TCS', date), ('FLAKY', date)])
+        assert sorted(fetched) == ['FLAKY.BO', 'FLAKY.NS', 'TCS.BO', 'TCS.NS']
+        assert helper._price_store.get_resolutions(['TCS', 'FLAKY']) == {'TCS': ('NSE', 1.0)}
+        helper._resolve_exchange('TCS', None)
+        assert helper._exchange_resolutions['TCS'] == ('NSE', 1.0)
+
+        # Current prices are fetched for stocks resolved to none
+        fetched.clear()
+        assert helper.batch_get_current_prices(['DEAD']) == {'DEAD': 20.0}
+        assert fetched == ['DEAD.NS']
+        logger.info("Empty responses keep exchange resolutions")
+
+if __name__ == "__main__":
+    test_bars_prefer_exchange_priority()
+    test_rebased_bars_are_replaced()
+    test_batch_reads_store_first()
+    test_exchange_resolutions()
+    test_empty_responses_keep_resolutions()
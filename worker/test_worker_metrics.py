@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the worker metrics render in the Prometheus text exposition format
+"""
+
+from config.logging_config import setup_logging
+from utils.executors import InstrumentedThreadPoolExecutor
+from utils.worker_metrics import MetricsRegistry, collect_executor_metrics
+
+logger = setup_logging(__name__)
+
+def test_counters_and_histograms():
+    """Counters add up per label set and histogram buckets are cumulative"""
+    registry = MetricsRegistry()
+    registry.inc('worker_tasks_total', status='completed')
+    registry.inc('worker_tasks_total', status='completed')
+    registry.inc('worker_tasks_in_flight')
+    registry.inc('worker_tasks_in_flight', -1)
+    registry.observe('worker_stage_duration_seconds', 0.2, stage='write."Taxation"')
+    registry.observe('worker_stage_duration_seconds', 3.0, stage='write."Taxation"')
+
+    lines = registry.render().splitlines()
+    assert '# TYPE worker_tasks_total counter' in lines
+    assert 'worker_tasks_total{status="completed"} 2' in lines
+    assert 'worker_tasks_in_flight 0' in lines
+    labels = 'stage="write.\\"Taxation\\""'
+    assert f'worker_stage_duration_seconds_bucket{{le="0.1",{labels}}} 0' in lines
+    assert f'worker_stage_duration_seconds_bucket{{le="0.25",{labels}}} 1' in lines
+    assert f'worker_stage_duration_seconds_bucket{{le="+Inf",{labels}}} 2' in lines
+    assert f'worker_stage_duration_seconds_sum{{{labels}}} 3.2' in lines
+    assert f'worker_stage_duration_seconds_count{{{labels}}} 2' in lines
+    logger.info("Counters and histograms render in the exposition format")
+
+def test_collectors():
+    """Collectors are read at every scrape, and a failing one leaves the others"""
+    registry = MetricsRegistry()
+    executor = InstrumentedThreadPoolExecutor('io', 2)
+    executor.submit(lambda: None).result()
+    registry.register_collector(lambda: collect_executor_metrics({'io': executor}))
+    registry.register_collector(lambda: 1 / 0)
+
+    lines = registry.render().splitlines()
+    assert 'worker_executor_max_workers{pool="io"} 2' in lines
+    assert 'worker_executor_submitted_total{pool="io"} 1' in lines
+    executor.shutdown()
+    logger.info("Collector samples are rendered")
+
+def test_changes_merge_into_another_registry():
+    """Changes recorded in one registry, as in a pool process, add up in another"""
+    parent, child = MetricsRegistry(), MetricsRegistry()
+    parent.inc('worker_market_data_cache_lookups_total', 2, cache='price', result='hit')
+    child.inc('worker_market_data_cache_lookups_total', 5, cache='price', result='hit')
+    child.observe('worker_external_call_duration_seconds', 0.2, service='yfinance', call='history')
+
+    before = child.snapshot()
+    child.inc('worker_market_data_cache_lookups_total', 3, cache='price', result='hit')
+    child.inc('worker_external_call_errors_total', service='yfinance', call='history')
+    child.observe('worker_external_call_duration_seconds', 0.03, service='yfinance', call='history')
+    parent.merge(child.changes_since(before))
+
+    lines = parent.render().splitlines()
+    assert 'worker_market_data_cache_lookups_total{cache="price",result="hit"} 5' in lines
+    assert 'worker_external_call_errors_total{call="history",service="yfinance"} 1' in lines
+    labels = 'call="history",le="0.05",service="yfinance"'
+    assert f'worker_external_call_duration_seconds_bucket{{{labels}}} 1' in lines
+    assert 'worker_external_call_duration_seconds_count{call="history",service="yfinance"} 1' in lines
+    logger.info("Metric changes merge into another registry")
+
+if __name__ == "__main__":
+    test_counters_and_histograms()
+    test_collectors()
+    test_changes_merge_into_another_registry()
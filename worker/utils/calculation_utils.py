@@ -1,5 +1,5 @@
-from datetime import datetime
-from typing import Dict
+from typing import Dict, List, Optional
+import numpy as np
 import pandas as pd
 from stock_portfolio_shared.constants.general_constants import BUY, SELL
 from stock_portfolio_shared.constants.raw_constants import Raw_constants
@@ -29,8 +29,8 @@ def calculate_stt(row, participant_name: str = "zerodha"):
     intraday_charges, delivery_charges = 0.0, 0.0
     try:
         # Get participant-specific STT rates
-        delivery_rate = participant_config_manager.get_stt_rate(participant_name, is_intraday=False)
-        intraday_rate = participant_config_manager.get_stt_rate(participant_name, is_intraday=True)
+        delivery_rate = participant_config_manager.get_stt_rate(participant_name, is_intraday=False, as_of=row[Raw_constants.DATE])
+        intraday_rate = participant_config_manager.get_stt_rate(participant_name, is_intraday=True, as_of=row[Raw_constants.DATE])
         
         # Calculate delivery charges (non-intraday portion)
         delivery_quantity = abs(row[Raw_constants.QUANTITY]) - row[TransDetails_constants.INTRADAY_COUNT]
@@ -50,7 +50,7 @@ def calculate_exchange_transaction_charges(row, participant_name: str = "zerodha
     try:
         net_amount = row[Raw_constants.NET_AMOUNT]
         exchange = row[Raw_constants.STOCK_EXCHANGE]
-        rate = participant_config_manager.get_exchange_transaction_charges_rate(participant_name, exchange)
+        rate = participant_config_manager.get_exchange_transaction_charges_rate(participant_name, exchange, as_of=row[Raw_constants.DATE])
         return abs(net_amount * rate)
     except Exception as e:
         logger.error(f"Error calculating exchange transaction charges for {participant_name}: {e}")
@@ -60,8 +60,8 @@ def calculate_brokerage(row, participant_name: str = "zerodha"):
     """Calculate brokerage charges with participant-specific rates"""
     try:
         net_amount = row[Raw_constants.NET_AMOUNT]
-        intraday_brokerage_rate = participant_config_manager.get_brokerage_rate(participant_name, is_intraday=True)
-        delivery_brokerage_rate = participant_config_manager.get_brokerage_rate(participant_name, is_intraday=False)
+        intraday_brokerage_rate = participant_config_manager.get_brokerage_rate(participant_name, is_intraday=True, as_of=row[Raw_constants.DATE])
+        delivery_brokerage_rate = participant_config_manager.get_brokerage_rate(participant_name, is_intraday=False, as_of=row[Raw_constants.DATE])
         delivery_quantity = abs(row[Raw_constants.QUANTITY]) - row[TransDetails_constants.INTRADAY_COUNT]
         delivery_brokerage = min(delivery_quantity * delivery_brokerage_rate["rate"] * row[Raw_constants.PRICE], delivery_brokerage_rate["max_amount"])
         intraday_brokerage = min(row[TransDetails_constants.INTRADAY_COUNT] * intraday_brokerage_rate["rate"] * row[Raw_constants.PRICE], intraday_brokerage_rate["max_amount"])
@@ -74,8 +74,8 @@ def calculate_brokerage(row, participant_name: str = "zerodha"):
 def calculate_stamp_duty(row, participant_name: str = "zerodha"):
     """Calculate stamp duty with participant-specific rates"""
     try:
-        delivery_rate = participant_config_manager.get_stamp_duty_rate(participant_name, is_intraday=False)
-        intraday_rate = participant_config_manager.get_stamp_duty_rate(participant_name, is_intraday=True)
+        delivery_rate = participant_config_manager.get_stamp_duty_rate(participant_name, is_intraday=False, as_of=row[Raw_constants.DATE])
+        intraday_rate = participant_config_manager.get_stamp_duty_rate(participant_name, is_intraday=True, as_of=row[Raw_constants.DATE])
         
         delivery_quantity = abs(row[Raw_constants.QUANTITY]) - row[TransDetails_constants.INTRADAY_COUNT]
         delivery_charges = delivery_quantity * delivery_rate * row[Raw_constants.PRICE]
@@ -103,7 +103,7 @@ def calculate_dp_charges(row, dp_data, participant_name: str = "zerodha"):
             # Check if DP charges already applied for this name/date combination
             if date not in dp_data[name]:
                 # First time seeing this name/date combination - apply DP charges
-                dp_charges = participant_config_manager.get_dp_charges(participant_name)
+                dp_charges = participant_config_manager.get_dp_charges(participant_name, as_of=date)
                 dp_data[name][date] = dp_charges
                 return dp_charges
             else:
@@ -121,7 +121,7 @@ def calculate_sebi_transaction_charges(row, participant_name: str = "zerodha"):
     """Calculate exchange transaction charges with participant-specific rates"""
     try:
         net_amount = row[Raw_constants.NET_AMOUNT]
-        rate = participant_config_manager.get_sebi_transaction_charges_rate(participant_name)
+        rate = participant_config_manager.get_sebi_transaction_charges_rate(participant_name, as_of=row[Raw_constants.DATE])
         return abs(net_amount * rate)
     except Exception as e:
         logger.error(f"Error calculating transaction charges for {participant_name}: {e}")
@@ -134,129 +134,77 @@ def calculate_gst(row, participant_name: str = "zerodha"):
         brokerage = row[TransDetails_constants.BROKERAGE]
         dp_charges = row[TransDetails_constants.DP_CHARGES]
         exchange_charges = row[TransDetails_constants.EXCHANGE_TRANSACTION_CHARGES]
-        gst_rate = participant_config_manager.get_gst_rate(participant_name)
+        gst_rate = participant_config_manager.get_gst_rate(participant_name, as_of=row[Raw_constants.DATE])
         return abs(gst_rate * (brokerage + dp_charges + exchange_charges))
     except Exception as e:
         logger.error(f"Error calculating GST for {participant_name}: {e}")
         raise
 
-def calculate_average_cost_of_sold_shares(infoMap: Dict[str, pd.DataFrame]) -> float:
-    logger.info(f"Calculating average cost of sold shares")
-    try:
-        sold_df = infoMap[SELL]
-        buy_df = infoMap[BUY]
-
-        # If no buy or sell data, return 0
-        if sold_df.empty or buy_df.empty:
-            return 0.0
-
-        # Convert to lists for easier processing
-        sold_list = sold_df.to_dict('records')
-        buy_list = buy_df.to_dict('records')
-
-        sell_idx, buy_idx = 0, 0
-        price = 0.0
-        intraCount = 0.0
-        delCount = 0.0
-        counter = 0.0
-
-        logger.info(f"Calculating for IntraDay Orders")
-        # Calculating for IntraDay Orders using while loops with clear conditions
-        while sell_idx < len(sold_list) and buy_idx < len(buy_list):
-            sold_quantity = abs(sold_list[sell_idx][Raw_constants.QUANTITY])
-            sold_amount = abs(sold_list[sell_idx][TransDetails_constants.FINAL_AMOUNT])
-            
-            # Check if same date (intraday)
-            if buy_list[buy_idx][Raw_constants.DATE] == sold_list[sell_idx][Raw_constants.DATE]:
-                buy_quantity = buy_list[buy_idx][Raw_constants.QUANTITY]
-                
-                if buy_quantity < sold_quantity:
-                    # Buy quantity exhausted, move to next buy
-                    intraCount += buy_quantity
-                    sold_list[sell_idx][Raw_constants.QUANTITY] -= buy_quantity
-                    price += buy_list[buy_idx][TransDetails_constants.FINAL_AMOUNT]
-                    buy_list[buy_idx][Raw_constants.QUANTITY] = 0
-                    buy_list[buy_idx][TransDetails_constants.FINAL_AMOUNT] = 0
-                    buy_idx += 1  # Move to next buy
-                    # Don't increment i, process remaining sold quantity
-                    
-                elif buy_quantity > sold_quantity:
-                    # Sold quantity exhausted, move to next sell
-                    price += (buy_list[buy_idx][TransDetails_constants.FINAL_AMOUNT] * sold_quantity) / buy_quantity
-                    buy_list[buy_idx][TransDetails_constants.FINAL_AMOUNT] -= (buy_list[buy_idx][TransDetails_constants.FINAL_AMOUNT] * sold_quantity) / buy_quantity
-                    buy_list[buy_idx][Raw_constants.QUANTITY] -= sold_quantity
-                    intraCount += sold_quantity
-                    sold_list[sell_idx][Raw_constants.QUANTITY] = 0
-                    sell_idx += 1  # Move to next sell
-                    
-                else:  # Equal quantities
-                    intraCount += sold_quantity
-                    sold_list[sell_idx][Raw_constants.QUANTITY] = 0
-                    price += buy_list[buy_idx][TransDetails_constants.FINAL_AMOUNT]
-                    buy_list[buy_idx][Raw_constants.QUANTITY] = 0
-                    buy_list[buy_idx][TransDetails_constants.FINAL_AMOUNT] = 0
-                    sell_idx += 1  # Move to next sell
-                    buy_idx += 1  # Move to next buy
-                    
-            elif buy_list[buy_idx][Raw_constants.DATE] < sold_list[sell_idx][Raw_constants.DATE]:
-                # Buy date is earlier, skip this buy (it's for delivery)
-                buy_idx += 1
-            else:
-                # Sell date is earlier, skip this sell (no matching buy)
-                sell_idx += 1
-
-        
-        # Calculating for Delivery Orders
-        for x in sold_list:
-            delCount += x[Raw_constants.QUANTITY]
-        for x in buy_list:
-            if x[Raw_constants.QUANTITY] <= (delCount - counter):
-                price += x[TransDetails_constants.FINAL_AMOUNT]
-                counter += x[Raw_constants.QUANTITY]
-            else:
-                price += (x[TransDetails_constants.FINAL_AMOUNT] * (delCount - counter))/x[Raw_constants.QUANTITY]
-                counter = delCount
-        counter += intraCount
-
-        if counter == 0:
-            return 0.0
-            
-        return price/counter
-    except Exception as e:
-        logger.error(f"Error calculating average cost of sold shares: {e}")
-        raise
-
-
+def calculate_charges_reference(data: pd.DataFrame, participant_name: str = "zerodha") -> pd.DataFrame:
+    """
+    Row-by-row reference implementation of utils.charge_engine.calculate_charges
 
-def is_long_term(buy_date, sell_date):
-    """Check if holding period is long term (more than 1 year)"""
-    try:
-        buy_dt = datetime.strptime(buy_date, config.DATA_TIME_FORMAT)
-        sell_dt = datetime.strptime(sell_date, config.DATA_TIME_FORMAT)
-        return (sell_dt - buy_dt).days > 365
-    except Exception as e:
-        logger.error(f"Error checking long term: {e}")
-        return False
+    Kept to validate the columnar engine; it produces identical charge columns.
+    """
+    dp_data: Dict[str, Dict[str, float]] = {}
+    data[TransDetails_constants.STT] = data.apply(lambda row: calculate_stt(row, participant_name), axis=1)
+    data[TransDetails_constants.SEBI_TRANSACTION_CHARGES] = data.apply(
+        lambda row: calculate_sebi_transaction_charges(row, participant_name), axis=1
+    )
+    data[TransDetails_constants.EXCHANGE_TRANSACTION_CHARGES] = data.apply(
+        lambda row: calculate_exchange_transaction_charges(row, participant_name), axis=1
+    )
+    data[TransDetails_constants.BROKERAGE] = data.apply(lambda row: calculate_brokerage(row, participant_name), axis=1)
+    data[TransDetails_constants.STAMP_DUTY] = data.apply(lambda row: calculate_stamp_duty(row, participant_name), axis=1)
+    data[TransDetails_constants.DP_CHARGES] = data.apply(
+        lambda row: calculate_dp_charges(row, dp_data, participant_name), axis=1
+    )
+    data[TransDetails_constants.GST] = data.apply(lambda row: calculate_gst(row, participant_name), axis=1)
+    return data
+
+def allocate_matched_quantity(quantity: pd.Series, keys: List[pd.Series], matched: pd.Series) -> pd.Series:
+    """
+    Spread a per-group matched quantity over the rows of each group in frame order
+    
+    Each row takes what is left of the group's matched quantity, capped at its own quantity,
+    so earlier rows are matched first (FIFO).
+    """
+    quantity_before = quantity.groupby(keys, sort=False).cumsum() - quantity
+    return np.minimum((matched - quantity_before).clip(lower=0), quantity)
 
-def update_intraday_count(data):
-    """Update intraday count for transactions"""
+def update_intraday_count(data, mode: Optional[str] = None):
+    """
+    Update intraday count for transactions
+    
+    Args:
+        data: Transaction details with transaction types set
+        mode: 'count' sets min(BUY rows, SELL rows) of each (date, name) group on every row,
+              'quantity' sets the quantity of each row matched against the opposite side
+              on the same day. Defaults to Config.INTRADAY_MATCHING_MODE.
+    """
     try:
-        # Group by date and name
-        grouped = data.groupby([Raw_constants.DATE, Raw_constants.NAME])
+        mode = mode or config.INTRADAY_MATCHING_MODE
+        keys = [data[Raw_constants.DATE], data[Raw_constants.NAME]]
+        is_buy = data[TransDetails_constants.TRANSACTION_TYPE] == config.BUY
+        is_sell = data[TransDetails_constants.TRANSACTION_TYPE] == config.SELL
         
-        for (date, name), group in grouped:
-            buy_count = 0
-            sell_count = 0
-            
-            for _, row in group.iterrows():
-                if row[TransDetails_constants.TRANSACTION_TYPE] == config.BUY:
-                    buy_count += 1
-                elif row[TransDetails_constants.TRANSACTION_TYPE] == config.SELL:
-                    sell_count += 1
-            
-            # Update intraday count
-            mask = (data[Raw_constants.DATE] == date) & (data[Raw_constants.NAME] == name)
-            data.loc[mask, TransDetails_constants.INTRADAY_COUNT] = min(buy_count, sell_count)
+        if mode == 'quantity':
+            quantity = data[Raw_constants.QUANTITY].abs().astype(float)
+            buy_quantity = quantity.where(is_buy, 0.0)
+            sell_quantity = quantity.where(is_sell, 0.0)
+            totals = pd.DataFrame({'buy': buy_quantity, 'sell': sell_quantity}).groupby(keys, sort=False).transform('sum')
+            matched = np.minimum(totals['buy'], totals['sell'])
+            intraday_quantity = (
+                allocate_matched_quantity(buy_quantity, keys, matched) +
+                allocate_matched_quantity(sell_quantity, keys, matched)
+            )
+            data[TransDetails_constants.INTRADAY_COUNT] = intraday_quantity
+        elif mode == 'count':
+            # Buy and sell counts for every (date, name) group in a single groupby pass
+            counts = pd.DataFrame({'buy': is_buy, 'sell': is_sell}).groupby(keys, sort=False).transform('sum')
+            data[TransDetails_constants.INTRADAY_COUNT] = np.minimum(counts['buy'], counts['sell']).astype(float)
+        else:
+            raise ValueError(f"Unknown intraday matching mode: {mode}")
         
         return data
         
@@ -264,70 +212,36 @@ def update_intraday_count(data):
         logger.error(f"Error updating intraday count: {e}")
         return data
 
-def update_transaction_type(quantity):
+def update_transaction_type(quantity: pd.Series) -> pd.Series:
     """
-    Determine transaction type based on quantity
+    Determine transaction types based on quantity
     
     Args:
-        quantity: The quantity value (positive = BUY, negative = SELL)
+        quantity: The parsed quantity column (positive = BUY, negative = SELL)
         
     Returns:
-        str: 'BUY' or 'SELL'
+        pd.Series: 'BUY' or 'SELL' for every row
     """
-    try:
-        # Convert to integer and check if positive or negative
-        quantity_int = DataProcessor.safe_numeric(quantity)
-        
-        if quantity_int >= 0:
-            return config.BUY
-        else:
-            return config.SELL
-            
-    except (ValueError, TypeError) as e:
-        logger.error(f"Error determining transaction type for quantity {quantity}: {e}")
-        # Default to BUY on error
-        return config.BUY
+    quantity = DataProcessor.parse_numeric_columns(quantity.to_frame(), [quantity.name])[quantity.name]
+    return pd.Series(np.where(quantity >= 0, config.BUY, config.SELL), index=quantity.index)
 
-def convert_dtypes(df):
-    """Convert data types in dataframe"""
-    try:
-        for col in df.columns:
-            if df[col].dtype == 'object':
-                try:
-                    converted_col = df[col].astype(str)
-                    converted_col = converted_col.str.replace(',', '', regex=False)
-                    converted_col = pd.to_numeric(converted_col, errors='raise')
-                    df[col] = converted_col
-                except ValueError:
-                    pass
-        return df
-    except Exception as e:
-        logger.error(f"Error converting data types: {e}")
-        return df
+def get_output_columns(constants_class) -> List[str]:
+    """Get the column names declared on a sheet constants class, in declaration order"""
+    return [value for key, value in constants_class.__dict__.items() if not key.startswith('__')]
 
-def get_financial_year(date):
-    """
-    Get financial year for a given date
-    FY starts from 1st April and ends on 31st March next year
-    Example: FY 2021-22 means 1st April 2021 to 31st March 2022
+def build_result_frame(constants_class, columns: Dict[str, list], text_columns: List[str]) -> pd.DataFrame:
     """
-    try:
-        if isinstance(date, str):
-            date = pd.to_datetime(date)
-        
-        year = date.year
-        month = date.month
+    Create an output DataFrame once from collected column values with explicit dtypes
+    
+    Args:
+        constants_class: Sheet constants class giving the output columns and their order
+        columns: Collected values for every output column
+        text_columns: Columns kept as strings, all other columns are built as float64
         
-        # If month is April to December, it's FY year-year+1
-        # If month is January to March, it's FY year-1-year
-        if month >= 4:  # April to December
-            fy_start = year
-            fy_end = year + 1
-        else:  # January to March
-            fy_start = year - 1
-            fy_end = year
-            
-        return f"FY {fy_start}-{str(fy_end)[-2:]}"  # FY 2021-22 format
-    except Exception as e:
-        logger.error(f"Error getting financial year for date {date}: {e}")
-        return "FY Unknown"
\ No newline at end of file
+    Returns:
+        pd.DataFrame: The output frame
+    """
+    return pd.DataFrame({
+        column: np.asarray(columns[column], dtype=object if column in text_columns else np.float64)
+        for column in get_output_columns(constants_class)
+    })
@@ -0,0 +1,81 @@
+"""
+Columnar charge engine for transaction details
+Computes every charge column with NumPy array expressions instead of per-row apply calls.
+The row functions in utils.calculation_utils remain the reference implementation.
+"""
+
+import numpy as np
+import pandas as pd
+from stock_portfolio_shared.constants.raw_constants import Raw_constants
+from stock_portfolio_shared.constants.trans_details_constants import TransDetails_constants
+from config.config import Config
+from config.logging_config import setup_logging
+from utils.calculation_utils import participant_config_manager
+from utils.date_utils import get_date_ordinal_column
+
+logger = setup_logging(__name__)
+config = Config()
+
+
+def calculate_charges(data: pd.DataFrame, participant_name: str = "zerodha") -> pd.DataFrame:
+    """
+    Calculate all charge columns for transaction details in a single pass
+
+    Args:
+        data: Transaction details sorted by name, date and transaction type, with intraday counts set
+        participant_name: Name of the depository participant whose rates apply
+
+    Returns:
+        pd.DataFrame: The same frame with STT, SEBI, exchange, brokerage, stamp duty, DP and GST columns
+    """
+    try:
+        # Every rate comes from the compiled, process-wide cached rate table, resolved
+        # to each trade's effective period with one sorted lookup over the schedule dates
+        rates = participant_config_manager.get_rate_table(participant_name)
+        period = rates.period_index(get_date_ordinal_column(data))
+
+        quantity = data[Raw_constants.QUANTITY].to_numpy(dtype=float)
+        price = data[Raw_constants.PRICE].to_numpy(dtype=float)
+        net_amount = data[Raw_constants.NET_AMOUNT].to_numpy(dtype=float)
+        intraday_quantity = data[TransDetails_constants.INTRADAY_COUNT].to_numpy(dtype=float)
+        is_sell = (data[TransDetails_constants.TRANSACTION_TYPE] == config.SELL).to_numpy()
+        delivery_quantity = np.abs(quantity) - intraday_quantity
+
+        # STT: delivery portion always, intraday portion only on the SELL leg
+        stt_delivery = delivery_quantity * rates.stt_delivery[period] * price
+        stt_intraday = np.where(is_sell, intraday_quantity * rates.stt_intraday[period] * price, 0.0)
+        data[TransDetails_constants.STT] = stt_intraday + stt_delivery
+
+        data[TransDetails_constants.SEBI_TRANSACTION_CHARGES] = np.abs(net_amount * rates.sebi_transaction_charges[period])
+
+        exchange_rates = rates.exchange_rates(data[Raw_constants.STOCK_EXCHANGE], period)
+        exchange_charges = np.abs(net_amount * exchange_rates)
+        data[TransDetails_constants.EXCHANGE_TRANSACTION_CHARGES] = exchange_charges
+
+        brokerage = (
+            np.minimum(intraday_quantity * rates.brokerage_intraday_rate[period] * price, rates.brokerage_intraday_max[period]) +
+            np.minimum(delivery_quantity * rates.brokerage_delivery_rate[period] * price, rates.brokerage_delivery_max[period])
+        )
+        data[TransDetails_constants.BROKERAGE] = brokerage
+
+        data[TransDetails_constants.STAMP_DUTY] = (
+            intraday_quantity * rates.stamp_duty_intraday[period] * price +
+            delivery_quantity * rates.stamp_duty_delivery[period] * price
+        )
+
+        # DP charges apply once per (name, date) to the first delivery SELL, found with a
+        # first-occurrence mask instead of a dict mutated in row order
+        delivery_sell = is_sell & (delivery_quantity > 0)
+        first_delivery_sell = np.zeros(len(data), dtype=bool)
+        first_delivery_sell[delivery_sell] = ~data.loc[delivery_sell, [Raw_constants.NAME, Raw_constants.DATE]].duplicated().to_numpy()
+        dp_charges = np.where(first_delivery_sell, rates.dp_charges[period], 0.0)
+        data[TransDetails_constants.DP_CHARGES] = dp_charges
+
+        data[TransDetails_constants.GST] = np.abs(
+            rates.gst_rate[period] * (brokerage + dp_charges + exchange_charges)
+        )
+        return data
+
+    except Exception as e:
+        logger.error(f"Error calculating charges for {participant_name}: {e}")
+        raise
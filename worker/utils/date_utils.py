@@ -0,0 +1,82 @@
+"""
+Date columns for the processing pipeline
+The Date column is parsed once at ingestion into an int32 day-ordinal column and a
+financial-year code column. Downstream stages work on those and only format dates back
+to strings when building their output.
+"""
+
+from datetime import date
+from typing import List
+import numpy as np
+import pandas as pd
+from stock_portfolio_shared.constants.raw_constants import Raw_constants
+from config.config import Config
+
+config = Config()
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# Internal columns, dropped before data is written to a sheet
+DATE_ORDINAL = '_date_ordinal'
+FY_CODE = '_fy_code'
+INTERNAL_COLUMNS = [DATE_ORDINAL, FY_CODE]
+
+
+def get_date_ordinals(dates: pd.Series) -> np.ndarray:
+    """Parse a date column once into proleptic Gregorian day ordinals"""
+    days = pd.to_datetime(dates, format=config.DATA_TIME_FORMAT).to_numpy(dtype='datetime64[D]')
+    return (days.astype(np.int64) + EPOCH_ORDINAL).astype(np.int32)
+
+
+def get_financial_year_codes(ordinals: np.ndarray) -> np.ndarray:
+    """Get the starting year of the financial year (April to March) of every date ordinal"""
+    months = (np.asarray(ordinals, dtype=np.int64) - EPOCH_ORDINAL).astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+    years = months // 12 + 1970
+    return (years - (months % 12 < 3)).astype(np.int32)
+
+
+def format_financial_year(fy_code: int) -> str:
+    """Format a financial year code, e.g. 2021 as FY 2021-22"""
+    return f"FY {fy_code}-{str(fy_code + 1)[-2:]}"
+
+
+def format_date_ordinals(ordinals: np.ndarray) -> List[str]:
+    """Format day ordinals back into DATA_TIME_FORMAT strings"""
+    days = (np.asarray(ordinals, dtype=np.int64) - EPOCH_ORDINAL).astype('datetime64[D]')
+    return pd.DatetimeIndex(days).strftime(config.DATA_TIME_FORMAT).tolist()
+
+
+def add_date_columns(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Add the day-ordinal and financial-year code columns if they are not there yet
+
+    Args:
+        data: Frame with a Date column in DATA_TIME_FORMAT
+
+    Returns:
+        pd.DataFrame: The same frame with both internal date columns
+    """
+    if DATE_ORDINAL not in data.columns:
+        data[DATE_ORDINAL] = get_date_ordinals(data[Raw_constants.DATE])
+    if FY_CODE not in data.columns:
+        data[FY_CODE] = get_financial_year_codes(data[DATE_ORDINAL].to_numpy())
+    return data
+
+
+def get_date_ordinal_column(data: pd.DataFrame) -> np.ndarray:
+    """Get the day ordinals of a frame, parsing the Date column only when the ordinal column is missing"""
+    if DATE_ORDINAL in data.columns:
+        return data[DATE_ORDINAL].to_numpy()
+    return get_date_ordinals(data[Raw_constants.DATE])
+
+
+def get_fy_code_column(data: pd.DataFrame) -> np.ndarray:
+    """Get the financial-year codes of a frame, deriving them only when the code column is missing"""
+    if FY_CODE in data.columns:
+        return data[FY_CODE].to_numpy()
+    return get_financial_year_codes(get_date_ordinal_column(data))
+
+
+def drop_internal_columns(data: pd.DataFrame) -> pd.DataFrame:
+    """Drop the internal date columns before data is written out"""
+    return data.drop(columns=[column for column in INTERNAL_COLUMNS if column in data.columns])
@@ -0,0 +1,244 @@
+"""
+Resource usage and stage timings of a spreadsheet task
+A task runs on an I/O thread and hands its processing stages to the CPU pool, so its CPU
+time is the CPU time of its own thread plus the CPU time each stage reports back from the
+thread or process it ran on. Memory is the RSS growth of the worker process while the task
+ran, sampled on a background thread, plus that of the pool processes its stages ran on.
+Stages are named hierarchically: a stage such as 'write.Taxation.format' is part of
+'write.Taxation', which is part of the 'write' phase.
+"""
+
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+from config.config import Config
+
+config = Config()
+
+# Tasks currently tracing allocations; tracemalloc is process-wide, so it runs while any does
+_tracing_lock = threading.Lock()
+_tracing_tasks = 0
+
+# Seconds between RSS samples while any measurement is running
+RSS_SAMPLE_SECONDS = 0.05
+
+
+def run_timed(func: Callable, *args) -> Tuple[object, float, float]:
+    """Run func and return its result with its wall-clock seconds and the CPU seconds of the calling thread"""
+    start_wall = time.perf_counter()
+    start_cpu = time.thread_time()
+    result = func(*args)
+    return result, time.perf_counter() - start_wall, time.thread_time() - start_cpu
+
+
+def get_peak_rss_mb() -> float:
+    """Get the peak resident set size of the process in MB"""
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak_rss / (1024 * 1024) if sys.platform == 'darwin' else peak_rss / 1024
+
+
+def get_current_rss_mb() -> float:
+    """Get the resident set size of the process in MB, or the peak RSS where /proc is not available"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return get_peak_rss_mb()
+
+
+class RssSampler:
+    """Sample the RSS of the process on a daemon thread, keeping a peak per running measurement"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._peaks: Dict[int, float] = {}
+        self._next_id = 0
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> Tuple[int, float]:
+        """
+        Start a measurement
+
+        Returns:
+            tuple: (measurement ID, RSS in MB at the start)
+        """
+        rss = get_current_rss_mb()
+        with self._lock:
+            measurement_id = self._next_id
+            self._next_id += 1
+            self._peaks[measurement_id] = rss
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sample, name='rss-sampler', daemon=True)
+                self._thread.start()
+        return measurement_id, rss
+
+    def stop(self, measurement_id: int) -> float:
+        """Stop a measurement and get its peak RSS in MB"""
+        rss = get_current_rss_mb()
+        with self._lock:
+            return max(self._peaks.pop(measurement_id), rss)
+
+    def _sample(self):
+        """Update the peak of every running measurement until none is left"""
+        while True:
+            time.sleep(RSS_SAMPLE_SECONDS)
+            rss = get_current_rss_mb()
+            with self._lock:
+                if not self._peaks:
+                    self._thread = None
+                    return
+                for measurement_id, peak in self._peaks.items():
+                    self._peaks[measurement_id] = max(peak, rss)
+
+
+# Sampler of this process; pool processes have their own
+rss_sampler = RssSampler()
+
+
+def run_measured(func: Callable, *args) -> Tuple[object, float, float, float]:
+    """Run func as run_timed does, also returning the RSS growth in MB of the process while it ran"""
+    measurement_id, start_rss = rss_sampler.start()
+    try:
+        result, wall_seconds, cpu_seconds = run_timed(func, *args)
+    finally:
+        peak_rss = rss_sampler.stop(measurement_id)
+    return result, wall_seconds, cpu_seconds, max(peak_rss - start_rss, 0.0)
+
+
+@dataclass
+class StageTiming:
+    """Time spent in one stage of a task, over all its calls"""
+    wall_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+    calls: int = 0
+    cache_hits: Optional[int] = None
+    cache_misses: Optional[int] = None
+
+
+class ExecutionMetrics:
+    """CPU time, peak memory and stage timings of one spreadsheet task"""
+
+    def __init__(self):
+        self.stages: Dict[str, StageTiming] = {}
+        self.wall_seconds = 0.0
+        self._lock = threading.Lock()
+        self._stage_cpu_seconds = 0.0
+        self._stage_memory_mb = 0.0
+        self._rss_measurement = None
+        self._start_wall = time.perf_counter()
+        self._start_cpu = time.thread_time()
+        self._traces_memory = config.MEMORY_TRACING
+        if self._traces_memory:
+            self._start_tracing()
+        else:
+            self._rss_measurement, self._start_rss = rss_sampler.start()
+
+    @staticmethod
+    def _start_tracing():
+        """Start tracing allocations, or join the tracing of the tasks already running"""
+        global _tracing_tasks
+        with _tracing_lock:
+            if _tracing_tasks == 0:
+                tracemalloc.start()
+            _tracing_tasks += 1
+
+    @staticmethod
+    def _stop_tracing() -> float:
+        """Get the traced peak in MB and stop tracing once no task is left"""
+        global _tracing_tasks
+        with _tracing_lock:
+            peak = tracemalloc.get_traced_memory()[1]
+            _tracing_tasks -= 1
+            if _tracing_tasks == 0:
+                tracemalloc.stop()
+        return peak / (1024 * 1024)
+
+    def _get_stage(self, name: str) -> StageTiming:
+        """Get the timing of a stage, adding it on its first call; callers hold the lock"""
+        if name not in self.stages:
+            self.stages[name] = StageTiming()
+        return self.stages[name]
+
+    @contextmanager
+    def stage(self, name: str):
+        """Add the wall-clock and CPU time of the enclosed block, run on the task thread, to a stage"""
+        start_wall = time.perf_counter()
+        start_cpu = time.thread_time()
+        try:
+            yield
+        finally:
+            wall_seconds = time.perf_counter() - start_wall
+            cpu_seconds = time.thread_time() - start_cpu
+            with self._lock:
+                timing = self._get_stage(name)
+                timing.wall_seconds += wall_seconds
+                timing.cpu_seconds += cpu_seconds
+                timing.calls += 1
+
+    def wrap(self, name: str, func: Callable) -> Callable:
+        """Wrap a function so every call of it on the task thread is timed as a stage"""
+        def timed(*args, **kwargs):
+            with self.stage(name):
+                return func(*args, **kwargs)
+        return timed
+
+    def add_stage(self, name: str, wall_seconds: float, cpu_seconds: float, memory_mb: float = 0.0):
+        """
+        Add a stage call that ran on another thread or process, as measured by run_timed
+
+        Args:
+            memory_mb: RSS growth of the pool process the stage ran on, as measured by
+                run_measured; stages on threads already count towards the worker process RSS
+        """
+        with self._lock:
+            self._stage_memory_mb += memory_mb
+            timing = self._get_stage(name)
+            timing.wall_seconds += wall_seconds
+            timing.cpu_seconds += cpu_seconds
+            timing.calls += 1
+            self._stage_cpu_seconds += cpu_seconds
+
+    def add_cache_lookups(self, name: str, cache_hits: int, cache_misses: int):
+        """Add the cache hits and misses of a stage"""
+        with self._lock:
+            timing = self._get_stage(name)
+            timing.cache_hits = (timing.cache_hits or 0) + cache_hits
+            timing.cache_misses = (timing.cache_misses or 0) + cache_misses
+
+    @property
+    def phase_seconds(self) -> Dict[str, float]:
+        """Get the wall-clock seconds of the top-level stages"""
+        return {name: timing.wall_seconds for name, timing in self.stages.items() if '.' not in name}
+
+    def finish(self) -> Tuple[float, float]:
+        """
+        Stop measuring the task
+
+        Returns:
+            tuple: (memory usage in MB, CPU usage as a percentage of the wall-clock time)
+
+        The memory usage is how far the sampled RSS of the worker process rose above its value
+        at the start of the task, or the tracemalloc peak while the task ran when MEMORY_TRACING
+        is enabled. Either way the RSS growth of the pool processes its stages ran on is added.
+        Tasks running at the same time share the worker process's figures.
+        """
+        self.wall_seconds = time.perf_counter() - self._start_wall
+        cpu_seconds = time.thread_time() - self._start_cpu + self._stage_cpu_seconds
+        if self._traces_memory:
+            memory_usage = self._stop_tracing()
+            self._traces_memory = False
+        elif self._rss_measurement is not None:
+            memory_usage = max(rss_sampler.stop(self._rss_measurement) - self._start_rss, 0.0)
+            self._rss_measurement = None
+        else:
+            memory_usage = 0.0
+        memory_usage += self._stage_memory_mb
+        cpu_usage = 100.0 * cpu_seconds / self.wall_seconds if self.wall_seconds > 0 else 0.0
+        return memory_usage, cpu_usage
@@ -0,0 +1,123 @@
+"""
+Instrumented executors for the two-tier worker pools
+The I/O pool runs spreadsheet tasks (Sheets, Excel and market data calls) and the CPU pool
+runs the processing stages, so an outer task never waits on work queued behind itself.
+Both pools keep saturation metrics.
+"""
+
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Union
+from config.logging_config import setup_logging
+
+logger = setup_logging(__name__)
+
+
+class ExecutorMetrics:
+    """Saturation metrics of one executor pool"""
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._in_flight = 0
+        self._peak_in_flight = 0
+        self._saturated_submits = 0
+        self._started = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._total_run_time = 0.0
+
+    def on_submit(self) -> float:
+        """Record a submission and return its timestamp"""
+        with self._lock:
+            # A task submitted while every worker is busy has to queue
+            if self._in_flight >= self.max_workers:
+                self._saturated_submits += 1
+            self._submitted += 1
+            self._in_flight += 1
+            self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+        return time.monotonic()
+
+    def on_start(self, submitted_at: float) -> None:
+        """Record the time a task spent queued before a worker picked it up"""
+        wait = time.monotonic() - submitted_at
+        with self._lock:
+            self._started += 1
+            self._total_wait += wait
+            self._max_wait = max(self._max_wait, wait)
+
+    def on_done(self, submitted_at: float, future: Future) -> None:
+        """Record a finished task"""
+        run_time = time.monotonic() - submitted_at
+        with self._lock:
+            self._in_flight -= 1
+            self._completed += 1
+            self._total_run_time += run_time
+            if not future.cancelled() and future.exception() is not None:
+                self._failed += 1
+
+    def get_stats(self) -> Dict[str, Union[str, int, float]]:
+        """Get a snapshot of the pool metrics"""
+        with self._lock:
+            return {
+                'name': self.name,
+                'max_workers': self.max_workers,
+                'in_flight': self._in_flight,
+                'queued': max(self._in_flight - self.max_workers, 0),
+                'peak_in_flight': self._peak_in_flight,
+                'submitted': self._submitted,
+                'completed': self._completed,
+                'failed': self._failed,
+                'saturated_submits': self._saturated_submits,
+                'avg_wait_seconds': self._total_wait / self._started if self._started else 0.0,
+                'max_wait_seconds': self._max_wait,
+                'avg_turnaround_seconds': self._total_run_time / self._completed if self._completed else 0.0
+            }
+
+
+class InstrumentedThreadPoolExecutor(ThreadPoolExecutor):
+    """ThreadPoolExecutor that records queue wait, in-flight tasks and saturation"""
+
+    def __init__(self, name: str, max_workers: int):
+        super().__init__(max_workers=max_workers, thread_name_prefix=f"{name}-pool")
+        self.metrics = ExecutorMetrics(name, max_workers)
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        submitted_at = self.metrics.on_submit()
+
+        def run():
+            self.metrics.on_start(submitted_at)
+            return fn(*args, **kwargs)
+
+        future = super().submit(run)
+        future.add_done_callback(lambda done: self.metrics.on_done(submitted_at, done))
+        return future
+
+    def get_stats(self) -> Dict[str, Union[str, int, float]]:
+        return self.metrics.get_stats()
+
+
+class InstrumentedProcessPoolExecutor(ProcessPoolExecutor):
+    """
+    ProcessPoolExecutor that records in-flight tasks and saturation
+
+    Queue wait is not observable across the process boundary, so only turnaround is timed.
+    """
+
+    def __init__(self, name: str, max_workers: int, mp_context=None):
+        super().__init__(max_workers=max_workers, mp_context=mp_context)
+        self.metrics = ExecutorMetrics(name, max_workers)
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        submitted_at = self.metrics.on_submit()
+        future = super().submit(fn, *args, **kwargs)
+        future.add_done_callback(lambda done: self.metrics.on_done(submitted_at, done))
+        return future
+
+    def get_stats(self) -> Dict[str, Union[str, int, float]]:
+        return self.metrics.get_stats()
@@ -0,0 +1,162 @@
+"""
+Ledger checkpoints for incremental processing
+A checkpoint keeps what the derived sheets need from the trades processed so far: the open
+lots (buys not sold yet, and sells not matched to a buy yet), per-stock totals, gains per
+(stock, financial year) and the transaction details and daily rows already produced. Trades
+appended after it are matched against the open lots only.
+"""
+
+import hashlib
+from dataclasses import dataclass
+from typing import Optional
+import numpy as np
+import pandas as pd
+from stock_portfolio_shared.constants.raw_constants import Raw_constants
+from stock_portfolio_shared.constants.taxation_constants import Taxation_constants
+from config.logging_config import setup_logging
+from utils.date_utils import get_date_ordinals
+from utils.portfolio_ledger import PortfolioLedger
+
+logger = setup_logging(__name__)
+
+GAIN_COLUMNS = [Taxation_constants.LTCG, Taxation_constants.STCG, Taxation_constants.INTRADAY_INCOME]
+
+
+def get_row_hashes(raw_data: pd.DataFrame) -> np.ndarray:
+    """Hash every raw row on its own, so rows appended later leave the earlier hashes unchanged"""
+    return pd.util.hash_pandas_object(raw_data, index=False, categorize=False).to_numpy()
+
+
+def digest_row_hashes(row_hashes: np.ndarray, row_count: int) -> str:
+    """Digest the hashes of the first row_count raw rows"""
+    return hashlib.sha256(row_hashes[:row_count].tobytes()).hexdigest()
+
+
+@dataclass
+class LedgerCheckpoint:
+    """State of the derived sheets after the first raw_row_count raw rows"""
+    participant_name: str
+    raw_row_count: int
+    raw_prefix_hash: Optional[str]
+    last_date_ordinal: int
+    open_lots: pd.DataFrame
+    symbol_totals: pd.DataFrame
+    gain_cells: pd.DataFrame
+    trans_details: pd.DataFrame
+    daily_profit_loss: pd.DataFrame
+
+    @classmethod
+    def create(cls, participant_name: str, raw_row_count: int, raw_hash: Optional[str], trans_details: pd.DataFrame,
+               ledger: PortfolioLedger, daily_profit_loss: pd.DataFrame) -> 'LedgerCheckpoint':
+        """
+        Create a checkpoint from a full run
+
+        Args:
+            participant_name: Depository participant the charges were calculated for
+            raw_row_count: Number of raw rows the run processed
+            raw_hash: digest_row_hashes of those rows, taken before processing converted any column,
+                or None when the checkpoint is only snapshotted and never advanced
+            trans_details: Transaction details of the run
+            ledger: Portfolio ledger of the transaction details
+            daily_profit_loss: Daily Profit/Loss rows of the run
+
+        Returns:
+            LedgerCheckpoint: Checkpoint after the last raw row
+        """
+        return cls(
+            participant_name=participant_name,
+            raw_row_count=raw_row_count,
+            raw_prefix_hash=raw_hash,
+            last_date_ordinal=int(ledger.date_ordinal.max()) if len(ledger) else 0,
+            open_lots=ledger.open_lots(),
+            symbol_totals=ledger.symbol_totals().join(ledger.sold_cost()),
+            gain_cells=ledger.gain_cells(),
+            trans_details=trans_details,
+            daily_profit_loss=daily_profit_loss
+        )
+
+    def get_appended_rows(self, raw_data: pd.DataFrame, row_hashes: np.ndarray, participant_name: str) -> Optional[pd.DataFrame]:
+        """
+        Get the raw rows appended since the checkpoint, if it can be advanced with them
+
+        The earlier rows must be unchanged and every appended trade must be dated after the
+        checkpoint, so no intraday or FIFO match of the earlier trades can change.
+
+        Args:
+            raw_data: All raw transactions
+            row_hashes: get_row_hashes of the raw transactions
+            participant_name: Depository participant the charges are calculated for
+
+        Returns:
+            Optional[pd.DataFrame]: The appended rows, or None when a full run is needed
+        """
+        if participant_name != self.participant_name or len(raw_data) <= self.raw_row_count or self.raw_prefix_hash is None:
+            return None
+        if digest_row_hashes(row_hashes, self.raw_row_count) != self.raw_prefix_hash:
+            logger.info("Earlier transactions changed since the checkpoint")
+            return None
+        appended_rows = raw_data.iloc[self.raw_row_count:]
+        if get_date_ordinals(appended_rows[Raw_constants.DATE]).min() <= self.last_date_ordinal:
+            logger.info("Appended transactions are not all dated after the checkpoint")
+            return None
+        return appended_rows
+
+    def symbol_state(self) -> pd.DataFrame:
+        """
+        Get the running totals per symbol: traded totals, open quantity and the realized gains
+        of all financial years, indexed by name
+
+        The open quantity is negative for symbols sold beyond what was bought.
+        """
+        open_quantity = self.open_lots.groupby('name')['quantity'].sum().rename('open_quantity')
+        gains = self.gain_cells.groupby('name')[GAIN_COLUMNS].sum()
+        state = self.symbol_totals.join(open_quantity).join(gains)
+        return state.fillna({'open_quantity': 0.0, **{column: 0.0 for column in GAIN_COLUMNS}})
+
+    def advance(self, raw_row_count: int, raw_hash: str, trans_details: pd.DataFrame,
+                ledger: PortfolioLedger, daily_profit_loss: pd.DataFrame) -> 'LedgerCheckpoint':
+        """
+        Advance the checkpoint with the appended trades
+
+        Args:
+            raw_row_count: Number of raw rows, including the appended rows
+            raw_hash: digest_row_hashes of all raw rows
+            trans_details: Transaction details of the appended rows only
+            ledger: Ledger of the appended transaction details built on the open lots
+                (PortfolioLedger.from_transaction_details with carried_lots)
+            daily_profit_loss: Daily Profit/Loss rows of the appended trades only
+
+        Returns:
+            LedgerCheckpoint: Checkpoint after the last raw row
+        """
+        # The carried lots are in the ledger as trades again, so their amounts come off its totals
+        is_buy = self.open_lots['quantity'] > 0
+        carried = pd.concat([
+            self.open_lots[is_buy].groupby('name')[['final_amount', 'quantity']].sum().rename(
+                columns={'final_amount': 'buy_amount', 'quantity': 'buy_quantity'}),
+            self.open_lots[~is_buy].groupby('name')[['final_amount', 'quantity']].sum().rename(
+                columns={'final_amount': 'sell_amount', 'quantity': 'sell_quantity'})
+        ], axis=1)
+        appended_totals = ledger.symbol_totals().sub(carried, fill_value=0.0).join(ledger.sold_cost())
+        symbol_totals = self.symbol_totals.add(appended_totals, fill_value=0.0).sort_index()
+        symbol_totals.index.name = Raw_constants.NAME
+
+        gain_cells = pd.concat([self.gain_cells, ledger.gain_cells()], ignore_index=True).groupby(
+            ['name', 'fy_code'], as_index=False
+        ).agg({'sell': 'min', 'ordinal': 'min', **{column: 'sum' for column in GAIN_COLUMNS}})
+
+        # Appended trades are dated after every earlier one, so a stable sort by name keeps the
+        # transaction details ordered by name and date
+        all_trans_details = pd.concat([self.trans_details, trans_details]).sort_values(Raw_constants.NAME, kind='stable')
+
+        return LedgerCheckpoint(
+            participant_name=self.participant_name,
+            raw_row_count=raw_row_count,
+            raw_prefix_hash=raw_hash,
+            last_date_ordinal=max(self.last_date_ordinal, int(np.max(ledger.date_ordinal))),
+            open_lots=ledger.open_lots(),
+            symbol_totals=symbol_totals,
+            gain_cells=gain_cells,
+            trans_details=all_trans_details,
+            daily_profit_loss=pd.concat([self.daily_profit_loss, daily_profit_loss], ignore_index=True)
+        )
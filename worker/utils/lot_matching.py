@@ -0,0 +1,61 @@
+"""
+Array-backed FIFO lot matching
+Buy and sell lots are NumPy arrays of quantities grouped per symbol (or per symbol and day),
+matched for all groups at once with merged cumulative quantities.
+"""
+
+import numpy as np
+
+# A lot is long term when sold more than this many days after it was bought
+LONG_TERM_HOLDING_DAYS = 365
+
+
+def match_fifo_lots(buy_group: np.ndarray, buy_quantity: np.ndarray,
+                    sell_group: np.ndarray, sell_quantity: np.ndarray, group_count: int):
+    """
+    Match sell quantities against buy quantities FIFO within every group
+
+    Both sides must be ordered by group and then in FIFO order. Each group is laid out on a
+    shared quantity axis, and the merged cumulative quantities of the two sides split its
+    matched range into segments that each pair exactly one buy lot with one sell lot.
+
+    Args:
+        buy_group: Integer group code of every buy lot
+        buy_quantity: Quantity of every buy lot
+        sell_group: Integer group code of every sell lot
+        sell_quantity: Quantity of every sell lot
+        group_count: Number of group codes
+
+    Returns:
+        Tuple of buy lot index, sell lot index and matched quantity for every matched segment
+    """
+    buy_totals = np.bincount(buy_group, weights=buy_quantity, minlength=group_count)
+    sell_totals = np.bincount(sell_group, weights=sell_quantity, minlength=group_count)
+    matched_totals = np.minimum(buy_totals, sell_totals)
+    group_start = np.concatenate(([0.0], np.cumsum(np.maximum(buy_totals, sell_totals))[:-1]))
+    group_end = group_start + matched_totals
+
+    def lot_ends(group, quantity, totals):
+        totals_before = np.concatenate(([0.0], np.cumsum(totals)[:-1]))
+        return np.cumsum(quantity) - totals_before[group] + group_start[group]
+
+    buy_end = lot_ends(buy_group, buy_quantity, buy_totals)
+    sell_end = lot_ends(sell_group, sell_quantity, sell_totals)
+
+    points = np.unique(np.concatenate((
+        np.minimum(buy_end, group_end[buy_group]),
+        np.minimum(sell_end, group_end[sell_group]),
+        group_start
+    )))
+    starts, ends = points[:-1], points[1:]
+
+    # The lot covering a segment is the first one ending after the segment starts
+    buy_index = np.searchsorted(buy_end, starts, side='right')
+    sell_index = np.searchsorted(sell_end, starts, side='right')
+    valid = (buy_index < len(buy_end)) & (sell_index < len(sell_end))
+    buy_index, sell_index, starts, ends = buy_index[valid], sell_index[valid], starts[valid], ends[valid]
+
+    group = buy_group[buy_index]
+    valid = (sell_group[sell_index] == group) & (starts >= group_start[group]) & (ends <= group_end[group])
+    return buy_index[valid], sell_index[valid], (ends - starts)[valid]
+
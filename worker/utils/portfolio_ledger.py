@@ -0,0 +1,323 @@
+"""
+Portfolio ledger shared by the derived sheets
+Transaction details are grouped into per-symbol sorted trade arrays and matched once,
+intraday first and then FIFO. Share Profit/Loss, Daily Profit/Loss and taxation are
+projections of the ledger instead of separate passes over the transaction details.
+"""
+
+from dataclasses import dataclass
+from typing import Optional
+import numpy as np
+import pandas as pd
+from stock_portfolio_shared.constants.general_constants import BUY
+from stock_portfolio_shared.constants.raw_constants import Raw_constants
+from stock_portfolio_shared.constants.trans_details_constants import TransDetails_constants
+from stock_portfolio_shared.constants.taxation_constants import Taxation_constants
+from stock_portfolio_shared.utils.data_processor import DataProcessor
+from config.logging_config import setup_logging
+from utils.date_utils import format_financial_year, get_date_ordinal_column, get_fy_code_column
+from utils.lot_matching import LONG_TERM_HOLDING_DAYS, match_fifo_lots
+
+logger = setup_logging(__name__)
+
+
+@dataclass
+class LotMatches:
+    """Matched quantities between buy and sell trades, as row positions in the ledger"""
+    buy_row: np.ndarray
+    sell_row: np.ndarray
+    quantity: np.ndarray
+
+    def select(self, row_mask: np.ndarray, new_row: np.ndarray) -> 'LotMatches':
+        """Keep the matches between kept rows, renumbered to their new positions"""
+        keep = row_mask[self.buy_row]
+        return LotMatches(new_row[self.buy_row[keep]], new_row[self.sell_row[keep]], self.quantity[keep])
+
+
+@dataclass
+class PortfolioLedger:
+    """
+    Trades of every symbol ordered by symbol and then by date, with their lot matches
+
+    Symbols are integer codes into the sorted names. Quantities and amounts keep their sign,
+    so sells have negative quantities.
+    """
+    names: np.ndarray
+    symbol: np.ndarray
+    date_ordinal: np.ndarray
+    fy_code: np.ndarray
+    is_buy: np.ndarray
+    quantity: np.ndarray
+    final_amount: np.ndarray
+    net_amount: np.ndarray
+    intraday: LotMatches
+    delivery: LotMatches
+
+    @classmethod
+    def from_transaction_details(cls, data: pd.DataFrame, carried_lots: Optional[pd.DataFrame] = None) -> 'PortfolioLedger':
+        """
+        Build the ledger from transaction details without modifying them
+
+        Args:
+            data: Transaction details with transaction types, quantities, net and final amounts
+            carried_lots: Open lots of an earlier ledger (see open_lots) placed before the
+                transactions, which must all be dated after them
+
+        Returns:
+            PortfolioLedger: Trades sorted by symbol and date, matched intraday and FIFO
+        """
+        try:
+            numeric_columns = [Raw_constants.QUANTITY, Raw_constants.NET_AMOUNT, TransDetails_constants.FINAL_AMOUNT]
+            numeric = DataProcessor.parse_numeric_columns(data[numeric_columns].copy(), numeric_columns)
+            trades = {
+                'name': data[Raw_constants.NAME].to_numpy(),
+                'date_ordinal': get_date_ordinal_column(data),
+                'fy_code': get_fy_code_column(data),
+                'is_buy': data[TransDetails_constants.TRANSACTION_TYPE].to_numpy() == BUY,
+                'quantity': numeric[Raw_constants.QUANTITY].to_numpy(dtype=float),
+                'final_amount': numeric[TransDetails_constants.FINAL_AMOUNT].to_numpy(dtype=float),
+                'net_amount': numeric[Raw_constants.NET_AMOUNT].to_numpy(dtype=float)
+            }
+            if carried_lots is not None:
+                trades = {
+                    key: np.concatenate((carried_lots[key].to_numpy(), values)) if key != 'is_buy'
+                    else np.concatenate((carried_lots['quantity'].to_numpy() > 0, values))
+                    for key, values in trades.items()
+                }
+            names, symbol = np.unique(trades['name'], return_inverse=True)
+            order = np.lexsort((trades['date_ordinal'], symbol))
+            return cls.from_trades(
+                names, symbol[order], trades['date_ordinal'][order], trades['fy_code'][order], trades['is_buy'][order],
+                trades['quantity'][order], trades['final_amount'][order], trades['net_amount'][order]
+            )
+        except Exception as e:
+            logger.error(f"Error building portfolio ledger: {e}")
+            raise
+
+    @classmethod
+    def from_trades(cls, names, symbol, date_ordinal, fy_code, is_buy, quantity, final_amount, net_amount) -> 'PortfolioLedger':
+        """
+        Match trades already ordered by symbol and date
+
+        Sells are matched against buys of the same day first, and what remains is matched FIFO
+        against the remaining buys of the symbol.
+        """
+        buy_row, sell_row = np.flatnonzero(is_buy), np.flatnonzero(~is_buy)
+        buy_quantity, sell_quantity = np.abs(quantity[buy_row]), np.abs(quantity[sell_row])
+
+        # Intraday: match within (symbol, date) groups
+        day_group = np.cumsum(cls._day_starts(symbol, date_ordinal)) - 1
+        buy_index, sell_index, matched = match_fifo_lots(
+            day_group[buy_row], buy_quantity, day_group[sell_row], sell_quantity, int(day_group[-1]) + 1 if len(day_group) else 0)
+        intraday = LotMatches(buy_row[buy_index], sell_row[sell_index], matched)
+
+        # Delivery: the remaining quantities are matched FIFO per symbol
+        buy_quantity = buy_quantity - np.bincount(buy_index, weights=matched, minlength=len(buy_row))
+        sell_quantity = sell_quantity - np.bincount(sell_index, weights=matched, minlength=len(sell_row))
+        buy_index, sell_index, matched = match_fifo_lots(
+            symbol[buy_row], buy_quantity, symbol[sell_row], sell_quantity, len(names))
+        delivery = LotMatches(buy_row[buy_index], sell_row[sell_index], matched)
+
+        return cls(names, symbol, date_ordinal, fy_code, is_buy, quantity, final_amount, net_amount, intraday, delivery)
+
+    @staticmethod
+    def _day_starts(symbol: np.ndarray, date_ordinal: np.ndarray) -> np.ndarray:
+        """Flag the first trade of every (symbol, date) group"""
+        starts = np.ones(len(symbol), dtype=bool)
+        starts[1:] = (symbol[1:] != symbol[:-1]) | (date_ordinal[1:] != date_ordinal[:-1])
+        return starts
+
+    def __len__(self) -> int:
+        return len(self.symbol)
+
+    def select_symbols(self, symbol_mask: np.ndarray) -> 'PortfolioLedger':
+        """
+        Get the ledger of a subset of symbols, keeping their trades and matches
+
+        Args:
+            symbol_mask: Boolean mask over names
+
+        Returns:
+            PortfolioLedger: Ledger of the selected symbols only
+        """
+        row_mask = symbol_mask[self.symbol]
+        new_row = np.cumsum(row_mask) - 1
+        new_symbol = np.cumsum(symbol_mask) - 1
+        return PortfolioLedger(
+            self.names[symbol_mask], new_symbol[self.symbol[row_mask]], self.date_ordinal[row_mask],
+            self.fy_code[row_mask], self.is_buy[row_mask], self.quantity[row_mask],
+            self.final_amount[row_mask], self.net_amount[row_mask],
+            self.intraday.select(row_mask, new_row), self.delivery.select(row_mask, new_row)
+        )
+
+    def symbol_totals(self) -> pd.DataFrame:
+        """Get the final amounts and quantities bought and sold per symbol, indexed by name"""
+        def total(values: np.ndarray, mask: np.ndarray) -> np.ndarray:
+            return np.bincount(self.symbol, weights=np.where(mask, values, 0.0), minlength=len(self.names))
+
+        return pd.DataFrame({
+            'buy_amount': total(self.final_amount, self.is_buy),
+            'buy_quantity': total(self.quantity, self.is_buy),
+            'sell_amount': total(self.final_amount, ~self.is_buy),
+            'sell_quantity': total(self.quantity, ~self.is_buy)
+        }, index=pd.Index(self.names, name=Raw_constants.NAME))
+
+    def _matched_buy_quantity(self) -> np.ndarray:
+        """Get the quantity of every trade that was matched as a buy, intraday or delivery"""
+        return np.bincount(
+            np.concatenate((self.intraday.buy_row, self.delivery.buy_row)),
+            weights=np.concatenate((self.intraday.quantity, self.delivery.quantity)),
+            minlength=len(self)
+        )
+
+    def _matched_sell_quantity(self) -> np.ndarray:
+        """Get the quantity of every trade that was matched as a sell, intraday or delivery"""
+        return np.bincount(
+            np.concatenate((self.intraday.sell_row, self.delivery.sell_row)),
+            weights=np.concatenate((self.intraday.quantity, self.delivery.quantity)),
+            minlength=len(self)
+        )
+
+    def sold_cost(self) -> pd.DataFrame:
+        """
+        Get the cost and quantity of the matched buys per symbol, indexed by name
+
+        The cost of a matched buy quantity is its share of the buy's final amount.
+        """
+        matched = self._matched_buy_quantity()
+        quantity = np.abs(self.quantity)
+        cost_per_share = np.divide(self.final_amount, quantity, out=np.zeros(len(self)), where=self.is_buy & (quantity > 0))
+        return pd.DataFrame({
+            'sold_cost': np.bincount(self.symbol, weights=matched * cost_per_share, minlength=len(self.names)),
+            'sold_quantity': np.bincount(self.symbol, weights=matched, minlength=len(self.names))
+        }, index=pd.Index(self.names, name=Raw_constants.NAME))
+
+    def average_cost_of_sold_shares(self) -> np.ndarray:
+        """Get the average cost of sold shares per symbol, 0.0 when nothing was matched"""
+        sold = self.sold_cost()
+        return average_cost(sold['sold_cost'].to_numpy(), sold['sold_quantity'].to_numpy())
+
+    def open_lots(self) -> pd.DataFrame:
+        """
+        Get the quantities left after matching, in FIFO order per symbol
+
+        Buy lots keep positive quantities. Sells of shares never bought in the ledger, such as
+        IPO, bonus or transferred-in shares, keep negative quantities: later buys are matched
+        against them first. A symbol only ever has open lots of one side. Amounts are scaled to
+        the open quantity, so a ledger built with these as carried lots matches them at the cost
+        per share of the original trades.
+        """
+        remaining = np.abs(self.quantity) - np.where(self.is_buy, self._matched_buy_quantity(), self._matched_sell_quantity())
+        # Quantities below this are left over from floating point matching
+        rows = np.flatnonzero(remaining > 1e-9)
+        share = remaining[rows] / np.abs(self.quantity[rows])
+        return pd.DataFrame({
+            'name': self.names[self.symbol[rows]],
+            'date_ordinal': self.date_ordinal[rows],
+            'fy_code': self.fy_code[rows],
+            'quantity': np.where(self.is_buy[rows], remaining[rows], -remaining[rows]),
+            'final_amount': self.final_amount[rows] * share,
+            'net_amount': self.net_amount[rows] * share
+        })
+
+    def day_totals(self) -> pd.DataFrame:
+        """
+        Get the final amount and absolute quantity traded per (date, symbol)
+
+        Returns:
+            pd.DataFrame: Date ordinal, name, amount and quantity, ordered by date and then name
+        """
+        starts = self._day_starts(self.symbol, self.date_ordinal)
+        day_group = np.cumsum(starts) - 1
+        day_count = int(starts.sum())
+        amount = np.bincount(day_group, weights=self.final_amount, minlength=day_count)
+        quantity = np.bincount(day_group, weights=np.abs(self.quantity), minlength=day_count)
+        symbol, ordinal = self.symbol[starts], self.date_ordinal[starts]
+        order = np.lexsort((symbol, ordinal))
+        return pd.DataFrame({
+            'date_ordinal': ordinal[order],
+            'name': self.names[symbol[order]],
+            'amount': amount[order],
+            'quantity': quantity[order]
+        })
+
+    def gain_cells(self) -> pd.DataFrame:
+        """
+        Get intraday income, LTCG and STCG per symbol and financial year
+
+        Gains are booked in the financial year of the sell, at the net amount per share. Every
+        (symbol, fy) cell also keeps whether it was first seen on a sell and its first date,
+        which order the taxation rows.
+
+        Returns:
+            pd.DataFrame: Name, fy code, sell, ordinal, LTCG, STCG and intraday income per cell
+        """
+        try:
+            quantity = np.abs(self.quantity)
+            amount = np.where(self.is_buy, self.net_amount, np.abs(self.net_amount))
+            cost_per_share = np.divide(amount, quantity, out=np.zeros(len(self)), where=quantity != 0)
+
+            cells = pd.DataFrame({
+                'symbol': self.symbol, 'fy': self.fy_code, 'sell': ~self.is_buy, 'ordinal': self.date_ordinal
+            }).groupby(['symbol', 'fy'], as_index=False)[['sell', 'ordinal']].min()
+            cell_index = pd.Series(np.arange(len(cells)), index=pd.MultiIndex.from_frame(cells[['symbol', 'fy']]))
+            gains = np.zeros((len(cells), 3))
+            ltcg, stcg, intraday = 0, 1, 2
+
+            def book(matches: LotMatches, matched_quantity: np.ndarray, column):
+                cell = cell_index.reindex(pd.MultiIndex.from_arrays(
+                    [self.symbol[matches.sell_row], self.fy_code[matches.sell_row]])).to_numpy()
+                gain = matched_quantity * (cost_per_share[matches.sell_row] - cost_per_share[matches.buy_row])
+                np.add.at(gains, (cell, column), gain)
+
+            book(self.intraday, self.intraday.quantity, intraday)
+            long_term = self.date_ordinal[self.delivery.sell_row] > self.date_ordinal[self.delivery.buy_row] + LONG_TERM_HOLDING_DAYS
+            book(self.delivery, np.where(long_term, self.delivery.quantity, 0.0), ltcg)
+            book(self.delivery, np.where(long_term, 0.0, self.delivery.quantity), stcg)
+
+            return pd.DataFrame({
+                'name': self.names[cells['symbol'].to_numpy()],
+                'fy_code': cells['fy'].to_numpy(),
+                'sell': cells['sell'].to_numpy(),
+                'ordinal': cells['ordinal'].to_numpy(),
+                Taxation_constants.LTCG: gains[:, ltcg],
+                Taxation_constants.STCG: gains[:, stcg],
+                Taxation_constants.INTRADAY_INCOME: gains[:, intraday]
+            })
+        except Exception as e:
+            logger.error(f"Error calculating capital gains: {e}")
+            raise
+
+    def capital_gains(self) -> pd.DataFrame:
+        """
+        Get intraday income, LTCG and STCG per symbol and financial year
+
+        Returns:
+            pd.DataFrame: Name, financial year, LTCG, STCG and intraday income, ordered by name and
+            then by the financial years of the buys followed by those only seen on sells
+        """
+        return format_capital_gains(self.gain_cells())
+
+
+def average_cost(cost: np.ndarray, quantity: np.ndarray) -> np.ndarray:
+    """Divide matched cost by matched quantity, 0.0 where nothing was matched"""
+    return np.divide(cost, quantity, out=np.zeros(len(cost)), where=quantity > 0)
+
+
+def format_capital_gains(cells: pd.DataFrame) -> pd.DataFrame:
+    """Order gain cells (see PortfolioLedger.gain_cells) into the taxation rows"""
+    cells = cells.sort_values(['name', 'sell', 'ordinal'])
+    return pd.DataFrame({
+        Taxation_constants.NAME: cells['name'].to_numpy(),
+        Taxation_constants.FINANCIAL_YEAR: [format_financial_year(fy) for fy in cells['fy_code']],
+        Taxation_constants.LTCG: cells[Taxation_constants.LTCG].to_numpy(),
+        Taxation_constants.STCG: cells[Taxation_constants.STCG].to_numpy(),
+        Taxation_constants.INTRADAY_INCOME: cells[Taxation_constants.INTRADAY_INCOME].to_numpy()
+    })
+
+
+def get_portfolio_ledger(data) -> PortfolioLedger:
+    """Get the ledger of transaction details, or the ledger itself when one was already built"""
+    if isinstance(data, PortfolioLedger):
+        return data
+    return PortfolioLedger.from_transaction_details(data)
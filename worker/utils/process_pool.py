@@ -0,0 +1,73 @@
+"""
+Process-pool execution for the per-sheet processing stages
+The portfolio ledger is shipped to worker processes once as pickled NumPy arrays, and each
+stage runs on its own process so the CPU-bound work is not serialized by the GIL.
+"""
+
+import multiprocessing
+import pickle
+from typing import Tuple
+import pandas as pd
+from config.logging_config import setup_logging
+from utils.execution_metrics import run_measured
+from utils.executors import InstrumentedProcessPoolExecutor
+from utils.portfolio_ledger import PortfolioLedger
+from utils.worker_metrics import MetricValues, registry
+
+logger = setup_logging(__name__)
+
+# One processing service per worker process, created on the first stage it runs
+_service = None
+
+
+def create_process_pool(max_workers: int) -> InstrumentedProcessPoolExecutor:
+    """
+    Create a process pool for the processing stages
+
+    Worker processes are spawned rather than forked, since the parent runs threads
+    (thread pool, RabbitMQ connection) that must not be copied mid-operation.
+    """
+    logger.info(f"Creating process pool with {max_workers} processes")
+    return InstrumentedProcessPoolExecutor('cpu', max_workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+def pack_frame(data: pd.DataFrame) -> bytes:
+    """Serialize a DataFrame as its index and one NumPy array per column"""
+    return pickle.dumps(
+        (data.index.to_numpy(), list(data.columns), [data[column].to_numpy() for column in data.columns]),
+        protocol=pickle.HIGHEST_PROTOCOL
+    )
+
+
+def unpack_frame(payload: bytes) -> pd.DataFrame:
+    """Rebuild a DataFrame serialized by pack_frame"""
+    index, columns, arrays = pickle.loads(payload)
+    return pd.DataFrame(dict(zip(columns, arrays)), index=index, columns=columns)
+
+
+def pack_ledger(ledger: PortfolioLedger) -> bytes:
+    """Serialize a portfolio ledger, which only holds NumPy arrays"""
+    return pickle.dumps(ledger, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def run_stage(stage_name: str, payload: bytes) -> Tuple[bytes, float, float, float, MetricValues]:
+    """
+    Run one DataProcessingService stage inside a worker process
+
+    Args:
+        stage_name: Name of the DataProcessingService method, e.g. process_taxation
+        payload: Portfolio ledger packed with pack_ledger
+
+    Returns:
+        tuple: (The stage result packed with pack_frame, wall-clock seconds, CPU seconds of the stage,
+            RSS growth in MB of the worker process while the stage ran, changes of the worker process
+            metrics, such as yfinance calls and cache lookups, for the parent to merge)
+    """
+    global _service
+    if _service is None:
+        from services.data_processing_service import DataProcessingService
+        _service = DataProcessingService()
+    # A worker process runs one stage at a time, so every change belongs to this stage
+    before = registry.snapshot()
+    result = run_measured(lambda: pack_frame(getattr(_service, stage_name)(pickle.loads(payload))))
+    return (*result, registry.changes_since(before))
@@ -0,0 +1,59 @@
+"""
+Request rate limits per external host
+Every caller in the process that talks to a host shares its limiter, so concurrent fetches
+cannot exceed the host's rate however many threads issue them.
+"""
+
+import threading
+import time
+from typing import Callable, Dict
+from config.config import Config
+
+config = Config()
+
+
+class RateLimiter:
+    """Token bucket letting calls start at most `rate` times per second, in bursts of up to `burst`"""
+
+    def __init__(self, rate: float, burst: int = 1, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._tokens = float(self.burst)
+        self._updated = clock()
+
+    def acquire(self) -> float:
+        """
+        Wait until a call may start
+
+        Returns:
+            float: Seconds waited
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Take the token now, even if it only becomes available later, so waiters queue in order
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            self._sleep(wait)
+        return wait
+
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(host: str) -> RateLimiter:
+    """Get the limiter of a host, created with MARKET_DATA_RATE_LIMIT on first use"""
+    with _limiters_lock:
+        if host not in _limiters:
+            rate = config.MARKET_DATA_RATE_LIMIT
+            _limiters[host] = RateLimiter(rate, burst=int(rate))
+        return _limiters[host]
@@ -0,0 +1,74 @@
+"""
+Symbol sharding for the per-symbol processing stages
+Share Profit/Loss and taxation only ever combine trades of the same stock, so the portfolio
+ledger can be split by name into balanced shards, processed independently and merged back.
+"""
+
+import heapq
+from typing import List
+import numpy as np
+import pandas as pd
+from stock_portfolio_shared.constants.raw_constants import Raw_constants
+from config.logging_config import setup_logging
+from utils.portfolio_ledger import PortfolioLedger
+
+logger = setup_logging(__name__)
+
+# DataProcessingService stages whose output rows each depend on a single stock
+SHARDABLE_STAGES = ('process_share_profit_loss', 'process_taxation')
+
+
+def assign_symbol_shards(counts: pd.Series, shard_count: int) -> pd.Series:
+    """
+    Assign every stock name to a shard, balancing the number of trades per shard
+
+    Names are placed greedily, largest first, on the currently lightest shard. Ties are
+    broken by name and shard number, so the assignment is deterministic.
+
+    Args:
+        counts: Number of trades indexed by stock name
+        shard_count: Number of shards
+
+    Returns:
+        pd.Series: Shard number indexed by stock name
+    """
+    counts = counts.iloc[np.lexsort((counts.index.to_numpy(dtype=str), -counts.to_numpy()))]
+    loads = [(0, shard) for shard in range(shard_count)]
+    assignment = {}
+    for name, count in counts.items():
+        load, shard = heapq.heappop(loads)
+        assignment[name] = shard
+        heapq.heappush(loads, (load + count, shard))
+    return pd.Series(assignment, dtype=np.int64)
+
+
+def partition_by_symbol(ledger: PortfolioLedger, shard_count: int) -> List[PortfolioLedger]:
+    """
+    Split a portfolio ledger by stock name into at most shard_count balanced shards
+
+    Args:
+        ledger: Portfolio ledger of the transaction details
+        shard_count: Number of shards to aim for
+
+    Returns:
+        List[PortfolioLedger]: Non-empty shards, each keeping its trades and lot matches
+    """
+    counts = pd.Series(np.bincount(ledger.symbol, minlength=len(ledger.names)), index=ledger.names)
+    shard_of_symbol = assign_symbol_shards(counts, shard_count).reindex(ledger.names).to_numpy()
+    shards = [ledger.select_symbols(shard_of_symbol == shard) for shard in range(shard_count)]
+    shards = [shard for shard in shards if len(shard)]
+    logger.info(f"Partitioned {len(ledger)} trades into {len(shards)} symbol shards: {[len(shard) for shard in shards]}")
+    return shards
+
+
+def merge_shard_results(results: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Merge per-shard stage results into the order an unsharded run produces
+
+    Stage outputs are ordered by name, and all rows of a name come from one shard, so a
+    stable sort by name restores the unsharded order whatever order the shards finished in.
+    """
+    if len(results) == 1:
+        return results[0]
+    merged = pd.concat(results, ignore_index=True)
+    return merged.sort_values(Raw_constants.NAME, kind='stable', ignore_index=True)
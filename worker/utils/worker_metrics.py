@@ -0,0 +1,223 @@
+"""
+Runtime metrics of the worker in the Prometheus text exposition format
+Counters, gauges and histograms are updated where the work happens; values that already
+live elsewhere, such as executor and cache statistics, are read by collectors at scrape time.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Tuple
+from config.logging_config import setup_logging
+
+logger = setup_logging(__name__)
+
+# Upper bounds in seconds, from fast cache hits to slow spreadsheet tasks
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+# Type and help text of every exported metric
+METRICS = {
+    'worker_tasks_in_flight': ('gauge', 'Spreadsheet tasks being processed'),
+    'worker_tasks_total': ('counter', 'Spreadsheet task attempts by outcome'),
+    'worker_task_retries_total': ('counter', 'Spreadsheet task attempts retried after a failure'),
+    'worker_task_duration_seconds': ('histogram', 'Wall-clock time of spreadsheet task attempts'),
+    'worker_stage_duration_seconds': ('histogram', 'Wall-clock time of task stages; read.* and write.* stages are spreadsheet calls'),
+    'worker_messages_total': ('counter', 'Queue messages by outcome: processed, requeued or dead_lettered'),
+    'worker_external_call_duration_seconds': ('histogram', 'Latency of calls to external services'),
+    'worker_external_call_errors_total': ('counter', 'Failed calls to external services'),
+    'worker_executor_max_workers': ('gauge', 'Workers of an executor pool'),
+    'worker_executor_in_flight': ('gauge', 'Tasks running or queued on an executor pool'),
+    'worker_executor_queued': ('gauge', 'Tasks waiting for a worker of an executor pool'),
+    'worker_executor_submitted_total': ('counter', 'Tasks submitted to an executor pool'),
+    'worker_executor_failed_total': ('counter', 'Tasks of an executor pool that raised'),
+    'worker_executor_saturated_submits_total': ('counter', 'Tasks submitted while every worker of the pool was busy'),
+    'worker_executor_max_wait_seconds': ('gauge', 'Longest queue wait of an executor pool'),
+    'worker_market_data_cache_lookups_total': ('counter', 'Market data cache lookups by cache and result'),
+    'worker_market_data_cache_entries': ('gauge', 'Entries in a market data cache')
+}
+
+# A collected sample: metric name, labels and value
+Sample = Tuple[str, Dict[str, str], float]
+
+# Counter and gauge values, then histogram counts, by metric name and label set
+MetricValues = Tuple[Dict[str, Dict[Tuple, float]], Dict[str, Dict[Tuple, List[float]]]]
+
+
+def _escape(value) -> str:
+    """Escape a label value as the exposition format requires"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    """Format labels as {name="value",...}"""
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in sorted(labels.items())) + '}'
+
+
+def _format_value(value: float) -> str:
+    """Format a sample value, with integral values written without a fraction"""
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class MetricsRegistry:
+    """Thread-safe store of the worker metrics"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values: Dict[str, Dict[Tuple, float]] = {}
+        self._histograms: Dict[str, Dict[Tuple, List[float]]] = {}
+        self._collectors: List[Callable[[], Iterable[Sample]]] = []
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        """Increase a counter, or change a gauge by a positive or negative value"""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._values.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, seconds: float, **labels):
+        """Add an observation to a histogram"""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            # Per-bucket counts, then the sum and count of all observations
+            counts = self._histograms.setdefault(name, {}).setdefault(key, [0.0] * (len(DURATION_BUCKETS) + 2))
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if seconds <= bound:
+                    counts[index] += 1
+            counts[-2] += seconds
+            counts[-1] += 1
+
+    @contextmanager
+    def time(self, name: str, errors: str = None, **labels):
+        """
+        Observe the wall-clock time of the enclosed block in a histogram
+
+        Args:
+            name: Histogram to observe
+            errors: Counter to increase, with the same labels, when the block raises
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            if errors:
+                self.inc(errors, **labels)
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> MetricValues:
+        """Copy the counter, gauge and histogram values, to compare later with changes_since"""
+        with self._lock:
+            return (
+                {name: dict(series) for name, series in self._values.items()},
+                {name: {key: list(counts) for key, counts in series.items()} for name, series in self._histograms.items()}
+            )
+
+    def changes_since(self, snapshot: MetricValues) -> MetricValues:
+        """
+        Get how the counters, gauges and histograms changed since a snapshot
+
+        Args:
+            snapshot: Values returned by snapshot
+
+        Returns:
+            tuple: Changed values in the form of a snapshot, for merge
+        """
+        values, histograms = snapshot
+        current_values, current_histograms = self.snapshot()
+        value_changes = {}
+        for name, series in current_values.items():
+            for key, value in series.items():
+                change = value - values.get(name, {}).get(key, 0.0)
+                if change:
+                    value_changes.setdefault(name, {})[key] = change
+        histogram_changes = {}
+        for name, series in current_histograms.items():
+            for key, counts in series.items():
+                before = histograms.get(name, {}).get(key, [0.0] * len(counts))
+                if counts[-1] != before[-1]:
+                    histogram_changes.setdefault(name, {})[key] = [count - earlier for count, earlier in zip(counts, before)]
+        return value_changes, histogram_changes
+
+    def merge(self, changes: MetricValues):
+        """Add changes recorded by another registry, such as one in a pool process, to this one"""
+        values, histograms = changes
+        with self._lock:
+            for name, series in values.items():
+                target = self._values.setdefault(name, {})
+                for key, change in series.items():
+                    target[key] = target.get(key, 0.0) + change
+            for name, series in histograms.items():
+                target = self._histograms.setdefault(name, {})
+                for key, change in series.items():
+                    counts = target.setdefault(key, [0.0] * (len(DURATION_BUCKETS) + 2))
+                    target[key] = [count + added for count, added in zip(counts, change)]
+
+    def register_collector(self, collector: Callable[[], Iterable[Sample]]):
+        """Register a function whose samples are read at every scrape"""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format"""
+        samples: Dict[str, List[str]] = {}
+        with self._lock:
+            for name, series in self._values.items():
+                samples.setdefault(name, []).extend(
+                    f"{name}{_format_labels(dict(key))} {_format_value(value)}" for key, value in series.items()
+                )
+            for name, series in self._histograms.items():
+                lines = samples.setdefault(name, [])
+                for key, counts in series.items():
+                    labels = dict(key)
+                    for bound, count in zip(DURATION_BUCKETS, counts):
+                        lines.append(f"{name}_bucket{_format_labels({**labels, 'le': repr(bound)})} {_format_value(count)}")
+                    lines.append(f"{name}_bucket{_format_labels({**labels, 'le': '+Inf'})} {_format_value(counts[-1])}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(counts[-2])}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {_format_value(counts[-1])}")
+            collectors = list(self._collectors)
+
+        for collector in collectors:
+            try:
+                for name, labels, value in collector():
+                    samples.setdefault(name, []).append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+            except Exception as e:
+                # One failing collector must not take down the whole scrape
+                logger.error(f"Error collecting metrics from {collector}: {e}")
+
+        output = []
+        for name, lines in samples.items():
+            metric_type, help_text = METRICS.get(name, ('untyped', name))
+            output.append(f"# HELP {name} {help_text}")
+            output.append(f"# TYPE {name} {metric_type}")
+            output.extend(lines)
+        return '\n'.join(output) + '\n'
+
+
+# Metrics of this worker process
+registry = MetricsRegistry()
+
+
+def collect_executor_metrics(executors: Dict[str, object]) -> List[Sample]:
+    """
+    Get samples of the saturation metrics of instrumented executors
+
+    Args:
+        executors: Executors by pool name, each with get_stats()
+    """
+    samples = []
+    for pool, executor in executors.items():
+        stats = executor.get_stats()
+        labels = {'pool': pool}
+        samples.extend([
+            ('worker_executor_max_workers', labels, stats['max_workers']),
+            ('worker_executor_in_flight', labels, stats['in_flight']),
+            ('worker_executor_queued', labels, stats['queued']),
+            ('worker_executor_submitted_total', labels, stats['submitted']),
+            ('worker_executor_failed_total', labels, stats['failed']),
+            ('worker_executor_saturated_submits_total', labels, stats['saturated_submits']),
+            ('worker_executor_max_wait_seconds', labels, stats['max_wait_seconds'])
+        ])
+    return samples
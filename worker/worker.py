@@ -2,6 +2,8 @@ import asyncio
 import pika
 import json
 import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from config.config import Config
 from database import init_db, test_connection
 from services.trading_orchestrator import TradingOrchestrator
@@ -9,7 +11,9 @@ from stock_portfolio_shared.models.spreadsheet_type import SpreadsheetType
 from stock_portfolio_shared.models.spreadsheet_task import SpreadsheetTask
 from stock_portfolio_shared.utils.sheet_manager import SheetsManager
 from stock_portfolio_shared.utils.excel_manager import ExcelManager
-from concurrent.futures import ThreadPoolExecutor
+from utils.executors import InstrumentedThreadPoolExecutor
+from utils.process_pool import create_process_pool
+from utils.worker_metrics import collect_executor_metrics, registry
 from pika.channel import Channel
 
 
@@ -25,13 +29,35 @@ class AsyncWorker:
     
     def __init__(self):
         # Get configuration from environment variables
-        self.max_workers = int(os.getenv('WORKER_CONCURRENCY', 4))
         self.task_timeout = int(os.getenv('WORKER_TIMEOUT', 300))
-        self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
-        self.sheets_orchestrator = TradingOrchestrator(sheets_manager, self.executor)
-        self.excel_orchestrator = TradingOrchestrator(excel_manager, self.executor)
+        # Two-tier executors shared by both orchestrators: I/O for spreadsheet tasks, CPU for processing
+        self.io_executor = InstrumentedThreadPoolExecutor('io', Config.IO_POOL_SIZE)
+        if Config.PROCESSING_MODE == 'process':
+            self.cpu_executor = create_process_pool(Config.CPU_POOL_SIZE)
+        else:
+            self.cpu_executor = InstrumentedThreadPoolExecutor('cpu', Config.CPU_POOL_SIZE)
+        self.sheets_orchestrator = TradingOrchestrator(sheets_manager, self.io_executor, self.cpu_executor)
+        self.excel_orchestrator = TradingOrchestrator(excel_manager, self.io_executor, self.cpu_executor)
+        registry.register_collector(self.collect_metrics)
         
-        logger.info(f"Initialized AsyncWorker with {self.max_workers} workers and {self.task_timeout}s timeout")
+        logger.info(f"Initialized AsyncWorker with {Config.IO_POOL_SIZE} I/O workers, {Config.CPU_POOL_SIZE} CPU workers "
+                    f"({Config.PROCESSING_MODE} mode) and {self.task_timeout}s timeout")
+    
+    def get_executor_stats(self):
+        """Get saturation metrics of the I/O and CPU pools"""
+        return {
+            'io': self.io_executor.get_stats(),
+            'cpu': self.cpu_executor.get_stats()
+        }
+    
+    def collect_metrics(self):
+        """Get metric samples of the executor pools and the market data caches of both orchestrators"""
+        samples = collect_executor_metrics({'io': self.io_executor, 'cpu': self.cpu_executor})
+        for name, orchestrator in [('sheets', self.sheets_orchestrator), ('excel', self.excel_orchestrator)]:
+            cache_stats = orchestrator.data_processing_service.get_market_data_cache_stats()
+            samples.append(('worker_market_data_cache_entries', {'orchestrator': name, 'cache': 'price'}, cache_stats['price_cache_size']))
+            samples.append(('worker_market_data_cache_entries', {'orchestrator': name, 'cache': 'current_price'}, cache_stats['current_price_cache_size']))
+        return samples
     
     async def process_spreadsheet_async(self, task: SpreadsheetTask):
         """Process a single spreadsheet asynchronously"""
@@ -66,6 +92,7 @@ class AsyncWorker:
             success_count = sum(1 for result in results if result is True)
             
             logger.info(f"Batch processing completed: {success_count}/{len(tasks)} successful")
+            logger.info(f"Executor stats: {self.get_executor_stats()}")
             return success_count
             
         except Exception as e:
@@ -75,7 +102,8 @@ class AsyncWorker:
     def shutdown(self):
         """Clean shutdown of the worker"""
         logger.info("Shutting down AsyncWorker")
-        self.executor.shutdown(wait=True)
+        self.io_executor.shutdown(wait=True)
+        self.cpu_executor.shutdown(wait=True)
         logger.info("AsyncWorker shutdown complete")
 
 async def async_callback(ch: Channel, method: pika.spec.Basic.Deliver, properties: pika.spec.BasicProperties, body: bytes, worker: AsyncWorker) -> None:
@@ -99,6 +127,7 @@ async def async_callback(ch: Channel, method: pika.spec.Basic.Deliver, propertie
         
         # Acknowledge message
         ch.basic_ack(delivery_tag=method.delivery_tag)
+        registry.inc('worker_messages_total', outcome='processed')
         
     except Exception as e:
         logger.error(f"Error in async callback: {e}")
@@ -132,19 +161,48 @@ async def async_callback(ch: Channel, method: pika.spec.Basic.Deliver, propertie
             
             # Acknowledge the original message
             ch.basic_ack(delivery_tag=method.delivery_tag)
+            registry.inc('worker_messages_total', outcome='requeued')
         else:
             # Max retries reached, reject without requeue (goes to DLQ)
             logger.error(f"Max retries ({max_retries}) reached, message will go to DLQ")
             ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+            registry.inc('worker_messages_total', outcome='dead_lettered')
 
 def sync_callback(ch: pika.channel.Channel, method: pika.spec.Basic.Deliver, properties: pika.spec.BasicProperties, body: bytes, worker: AsyncWorker) -> None:
     """Synchronous callback wrapper for RabbitMQ"""
     asyncio.run(async_callback(ch, method, properties, body, worker))
 
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """Serves the worker metrics in the Prometheus text format on /metrics"""
+    
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        # Scrapes are too frequent for the worker log
+        pass
+
+def start_metrics_server(port: int) -> ThreadingHTTPServer:
+    """Serve the metrics endpoint from a daemon thread, which never blocks message consumption"""
+    server = ThreadingHTTPServer(('0.0.0.0', port), MetricsRequestHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    logger.info(f"Serving worker metrics on port {port} at /metrics")
+    return server
+
 def main():
     """Main function to start the async worker"""
     worker = None
     connection = None
+    metrics_server = None
     
     try:
         logger.info("Initializing async worker script")
@@ -164,6 +222,8 @@ def main():
         
         # Initialize the worker
         worker = AsyncWorker()
+        if Config.METRICS_PORT:
+            metrics_server = start_metrics_server(Config.METRICS_PORT)
         
         # Create RabbitMQ connection
         credentials_rabbitmq = pika.PlainCredentials(
@@ -210,6 +270,8 @@ def main():
         raise
     finally:
         # Clean shutdown
+        if metrics_server:
+            metrics_server.shutdown()
         if worker:
             worker.shutdown()
         if connection and connection.is_open: